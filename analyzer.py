@@ -0,0 +1,121 @@
+import re
+import typing
+
+from stemming import EnglishStemmer, RussianStemmer
+
+# служебные слова (после casefold), которые анализатор со stopwords выбрасывает
+STOPWORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'всё', 'вы', 'да', 'для', 'до', 'его', 'ее', 'её', 'ей', 'если',
+    'есть', 'же', 'за', 'и', 'из', 'или', 'им', 'их', 'к', 'как', 'ко', 'когда', 'кто', 'ли', 'либо', 'мне', 'мы',
+    'на', 'над', 'не', 'него', 'нее', 'неё', 'нет', 'ни', 'них', 'но', 'о', 'об', 'обо', 'он', 'она', 'они', 'оно',
+    'от', 'по', 'под', 'при', 'про', 'с', 'со', 'так', 'также', 'то', 'того', 'тоже', 'только', 'том', 'ты', 'у',
+    'уже', 'чем', 'что', 'чтобы', 'это', 'этот', 'эта', 'эти', 'я',
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it', 'no', 'not',
+    'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was', 'will',
+    'with',
+))
+
+
+class Analyzer:
+    """
+    нормализация слов, одна и та же при индексации (FolderIndexer.index_file) и в запросах (QueryPlanner,
+    TfIdfIndex.get_words_list). слово - совпадение settings.WORD_REGEX после casefold - проходит шаги:
+    1. strip_punctuation: знаки по краям отрезаются ('(шифром),' -> 'шифром'), слово из одних знаков выбрасывается.
+       вхождение указывает на слово без знаков, так что сниппет выделяет только его;
+    2. stopwords: служебные слова (STOPWORDS) выбрасываются;
+    3. stem: слово из кириллицы сводится к основе RussianStemmer, из латиницы - EnglishStemmer, остальные
+       (с цифрами, дефисами, смешанные) не меняются.
+    выброшенные слова не занимают номеров слов и не входят в длину файла: фраза "кукуруза поле" находит
+    "кукуруза на поле", если "на" - служебное слово. результат каждого различного слова запоминается (memo),
+    так что шаги выполняются один раз на слово, а не на вхождение.
+    анализатор без шагов (по умолчанию) оставляет слова как есть - как индексы, построенные до анализатора.
+    набор шагов сохраняется в файле индекса, и запросы к индексу нормализуются так же, как он строился
+    """
+    # готовые наборы шагов для --analyzer
+    PRESETS = {
+        'raw': {},
+        'punctuation': {'strip_punctuation': True},
+        'stem': {'strip_punctuation': True, 'stem': True},
+        'full': {'strip_punctuation': True, 'stopwords': True, 'stem': True},
+    }
+    # memo очищается, когда в нем столько слов
+    MAX_MEMO_SIZE = 2 ** 20
+    RUSSIAN_WORD = re.compile('[а-яё]+')
+    ENGLISH_WORD = re.compile("[a-z']+")
+
+    def __init__(self, strip_punctuation: bool = False, stopwords: bool = False, stem: bool = False):
+        self.strip_punctuation = strip_punctuation
+        self.stopwords = stopwords
+        self.stem = stem
+        self.is_identity = not (strip_punctuation or stopwords or stem)
+        self.russian_stemmer = RussianStemmer()
+        self.english_stemmer = EnglishStemmer()
+        # {слово: (нормальная форма, начало, конец) или None, если слово выбрасывается}
+        self.memo: dict[str, typing.Optional[tuple[str, int, int]]] = {}
+
+    @classmethod
+    def of(cls, name: str) -> 'Analyzer':
+        """:param name: имя набора из PRESETS"""
+        if name not in cls.PRESETS:
+            raise ValueError(f'неизвестный анализатор {name}, есть только {", ".join(cls.PRESETS)}')
+        return cls(**cls.PRESETS[name])
+
+    @classmethod
+    def from_config(cls, config: dict[str, bool]) -> 'Analyzer':
+        return cls(**config)
+
+    def get_config(self) -> dict[str, bool]:
+        """:return: включенные шаги (то, что сохраняется в файле индекса)"""
+        return {name: True for name in ('strip_punctuation', 'stopwords', 'stem') if getattr(self, name)}
+
+    def analyze(self, token: str) -> typing.Optional[tuple[str, int, int]]:
+        """:return: (нормальная форма, начало и конец ее вхождения в token) или None, если слово выбрасывается"""
+        if self.is_identity:
+            return token, 0, len(token)
+        try:
+            return self.memo[token]
+        except KeyError:
+            pass
+        if len(self.memo) >= self.MAX_MEMO_SIZE:
+            self.memo.clear()
+        analyzed = self.memo[token] = self.run(token)
+        return analyzed
+
+    def normalize(self, word: str) -> typing.Optional[str]:
+        """:return: нормальная форма слова запроса или None, если слово выбрасывается"""
+        analyzed = self.analyze(word)
+        return analyzed[0] if analyzed is not None else None
+
+    def run(self, token: str) -> typing.Optional[tuple[str, int, int]]:
+        start, end = 0, len(token)
+        if self.strip_punctuation:
+            while start < end and not token[start].isalnum():
+                start += 1
+            while end > start and not token[end - 1].isalnum():
+                end -= 1
+            if start == end:
+                return None
+        word = token[start:end]
+        if self.stopwords and word in STOPWORDS:
+            return None
+        if self.stem:
+            if self.RUSSIAN_WORD.fullmatch(word):
+                word = self.russian_stemmer.stem(word)
+            elif self.ENGLISH_WORD.fullmatch(word):
+                word = self.english_stemmer.stem(word)
+        return word, start, end
+
+    def __eq__(self, other):
+        return isinstance(other, Analyzer) and self.get_config() == other.get_config()
+
+    def __hash__(self):
+        return hash(tuple(self.get_config()))
+
+    def __repr__(self):
+        return f'Analyzer({", ".join(f"{name}=True" for name in self.get_config())})'
+
+    def __getstate__(self):
+        # в процессы-воркеры индексации передаются только шаги, memo там заполняется заново
+        state = self.__dict__.copy()
+        state['memo'] = {}
+        return state
@@ -0,0 +1,258 @@
+import argparse
+import json
+import sys
+import time
+import typing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import logic_tree
+from analyzer import Analyzer
+from folder_index import FolderIndex, FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
+from foogle import ExpressionSearcher, Foogle
+from query_cache import QueryCache
+from query_planner import QueryPlanner, PlanNode, TermNode, PhraseNode, NearNode, AndNode, OrNode, ExcludeNode
+from scoring import Scorer, TfIdfScorer
+from search_server import SearchServer
+from segmented_index import SegmentedIndex
+from sharded_index import ShardedIndex
+
+
+class BatchIndexView:
+    """
+    индекс, который запоминает количества вхождений слов для пакетов запросов: ранжирование каждого запроса
+    берет их отсюда, и из индекса слово читается один раз, сколько бы запросов его ни содержали
+    (пока количества не вытеснены из кеша, ограниченного max_size байт)
+    """
+
+    def __init__(self, folder_index: FolderIndex, max_size: int):
+        self.folder_index = folder_index
+        self.counts_cache = QueryCache(max_items=sys.maxsize, max_size=max_size)
+
+    def get_term_counts(self, word: str) -> tuple[array, array]:
+        generation = self.folder_index.generation
+        counts = self.counts_cache.get(word, generation)
+        if counts is None:
+            counts = self.folder_index.get_term_counts(word)
+            doc_ids, doc_counts = counts
+            size = doc_ids.itemsize * len(doc_ids) + doc_counts.itemsize * len(doc_counts)
+            self.counts_cache.put(word, counts, size, generation)
+        return counts
+
+    def get_term_doc_ids(self, word: str) -> array:
+        return self.get_term_counts(word)[0]
+
+    def __getattr__(self, name):
+        return getattr(self.folder_index, name)
+
+    def __getitem__(self, word: str):
+        return self.folder_index[word]
+
+
+# поисковик пакетов, открытый в процессе-воркере
+_worker_searcher: typing.Optional['BatchSearcher'] = None
+
+
+def _open_index(index: typing.Union[str, FolderIndex], scorer: Scorer):
+    """:param index: путь к файлу индекса или сам индекс (при fork передается без копирования)"""
+    global _worker_searcher
+    if isinstance(index, str):
+        index = FolderIndexSaveloader.load(index)
+    _worker_searcher = BatchSearcher(index, scorer=scorer)
+
+
+def _search_worker_chunk(chunk: list[tuple[PlanNode, str]], k: typing.Optional[int]):
+    return _worker_searcher.search_plans(chunk, k)
+
+
+class BatchSearcher:
+    """
+    выполняет пакет запросов без вывода: сначала все запросы разбираются и планируются, одинаковые
+    (с одним планом и словами ранжирования, как у кеша результатов Foogle) выполняются один раз,
+    потом планы выполняются кусками в пуле процессов (если workers > 1). каждый процесс держит списки слов
+    и количества вхождений на весь пакет, так что слово читается из индекса не больше одного раза на процесс.
+    вхождения и сниппеты не собираются - результат запроса это количество файлов и k лучших файлов с оценками.
+    у ShardedIndex свой пул процессов по шардам, поэтому его запросы выполняются по одному в текущем процессе
+    """
+    # на сколько кусков на воркер делится пакет: мельче - ровнее нагрузка, крупнее - меньше пересылок
+    CHUNKS_PER_WORKER = 4
+    # ограничение кеша списков слов одного процесса, байт
+    POSTINGS_CACHE_SIZE = 512 * 2 ** 20
+    # ограничение кеша количеств вхождений слов одного процесса, байт
+    COUNTS_CACHE_SIZE = 128 * 2 ** 20
+
+    def __init__(self, folder_index: typing.Union[FolderIndex, ShardedIndex, SegmentedIndex], workers: int = 1,
+                 scorer: Scorer = None, max_expansions: int = QueryPlanner.MAX_EXPANSIONS):
+        if workers < 1: raise ValueError(f'количество воркеров должно быть положительным, а не {workers}')
+        if isinstance(folder_index, SegmentedIndex):
+            # весь пакет выполняется по одному снимку
+            folder_index = folder_index.snapshot()
+        self.folder_index = folder_index
+        self.workers = workers
+        self.scorer = scorer if scorer is not None else TfIdfScorer()
+        self.max_expansions = max_expansions
+        self.view = BatchIndexView(folder_index, self.COUNTS_CACHE_SIZE) if not isinstance(folder_index, ShardedIndex) else None
+        self.postings_cache = QueryCache(max_items=sys.maxsize, max_size=self.POSTINGS_CACHE_SIZE)
+        self.executor = None
+        # счетчики последнего пакета, см. search
+        self.stats: dict[str, typing.Any] = {}
+
+    def search(self, querries: typing.Iterable[str], k: typing.Optional[int] = 10) -> list[dict[str, typing.Any]]:
+        """
+        :param k: сколько лучших файлов вернуть на запрос (None - все)
+        :return: на каждый запрос {'query', 'total', 'results': [{'path', 'score'}, ...]}
+            или {'query', 'error'}, если запрос не разобрался; в том же порядке, что и querries.
+            счетчики пакета (запросы, уникальные планы и слова, время фаз, запросов в секунду) - в self.stats
+        """
+        start = time.perf_counter()
+        querries = list(querries)
+        errors = {}
+        keys = []
+        plans = {}
+        for i, querry in enumerate(querries):
+            querry = querry.casefold()
+            try:
+                plan = QueryPlanner(self.folder_index, self.max_expansions).plan(
+                    logic_tree.LogicTreeParser(querry).parse())
+            except (ValueError, RecursionError) as e:
+                errors[i] = str(e) if isinstance(e, ValueError) else f'слишком глубокий запрос: {e}'
+                keys.append(None)
+                continue
+            key = (plan.key, Foogle.get_ranking_words(self.folder_index, querry))
+            keys.append(key)
+            plans.setdefault(key, (plan, querry))
+        planned = time.perf_counter()
+
+        unique = list(plans.values())
+        results_by_key = dict(zip(plans, self.search_unique(unique, k)))
+        searched = time.perf_counter()
+
+        output = []
+        for i, (querry, key) in enumerate(zip(querries, keys)):
+            if key is None:
+                output.append({'query': querry, 'error': errors[i]})
+                continue
+            total, ranking = results_by_key[key]
+            output.append({'query': querry, 'total': total,
+                           'results': [{'path': filepath, 'score': score} for filepath, score in ranking]})
+
+        elapsed = time.perf_counter() - start
+        words = set()
+        for plan, _ in unique:
+            words.update(self.get_plan_words(plan))
+        self.stats = {
+            'queries': len(querries),
+            'errors': len(errors),
+            'unique_plans': len(unique),
+            'unique_words': len(words),
+            'plan_s': round(planned - start, 3),
+            'search_s': round(searched - planned, 3),
+            'total_s': round(elapsed, 3),
+            'queries_per_s': round(len(querries) / elapsed, 1) if elapsed > 0 else 0,
+        }
+        return output
+
+    def search_unique(self, plans: list[tuple[PlanNode, str]],
+                      k: typing.Optional[int]) -> list[tuple[int, list[tuple[str, float]]]]:
+        if self.workers == 1 or self.view is None or len(plans) == 0:
+            return self.search_plans(plans, k)
+        chunks_count = min(self.workers * self.CHUNKS_PER_WORKER, len(plans))
+        chunk_size = -(-len(plans) // chunks_count)
+        chunks = [plans[i:i + chunk_size] for i in range(0, len(plans), chunk_size)]
+        results = []
+        for chunk_results in self.get_executor().map(_search_worker_chunk, chunks, [k] * len(chunks)):
+            results.extend(chunk_results)
+        return results
+
+    def search_plans(self, plans: list[tuple[PlanNode, str]],
+                     k: typing.Optional[int]) -> list[tuple[int, list[tuple[str, float]]]]:
+        """:return: на каждый (план, запрос) - (количество найденных файлов, [(файл, оценка), ...])"""
+        results = []
+        for plan, querry in plans:
+            if self.view is None:
+                result, ranking = self.folder_index.search(plan, querry, self.scorer, k)
+            else:
+                result = ExpressionSearcher(self.view, self.postings_cache).search(plan)
+                ranking = self.scorer.rank(self.view, querry, result, k)
+            results.append((len(result.postings), ranking))
+        return results
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        # индекс из файла каждый воркер открывает сам, индекс в памяти передается воркеру при создании
+        if self.executor is None:
+            if isinstance(self.folder_index, MappedFolderIndex):
+                index = self.folder_index.reader.filepath
+            else:
+                index = self.folder_index
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_open_index,
+                                                initargs=(index, self.scorer))
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    @classmethod
+    def get_plan_words(cls, node: PlanNode) -> typing.Iterator[str]:
+        """:return: слова, списки которых читает план"""
+        if isinstance(node, TermNode):
+            yield node.word
+        elif isinstance(node, PhraseNode):
+            yield from node.words
+        elif isinstance(node, NearNode):
+            yield from cls.get_plan_words(node.left)
+            yield from cls.get_plan_words(node.right)
+        elif isinstance(node, (AndNode, OrNode)):
+            for child in node.children:
+                yield from cls.get_plan_words(child)
+        elif isinstance(node, ExcludeNode):
+            yield from cls.get_plan_words(node.positive)
+            yield from cls.get_plan_words(node.excluded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='пакетный поиск Foogle: запрос на строку, результаты в JSON Lines')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--index', help='файл индекса, папка сегментов или папка шардов')
+    source.add_argument('--folder', help='папка, которую проиндексировать перед поиском')
+    parser.add_argument('--querries', help='файл с запросами (по умолчанию stdin)')
+    parser.add_argument('--output', help='куда записать результаты (по умолчанию stdout)')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--analyzer', choices=Analyzer.PRESETS, default='raw', help='нормализация слов для --folder')
+    args = parser.parse_args()
+
+    if args.index is not None:
+        index = SearchServer.load_index(args.index, args.workers)
+    else:
+        index = FolderIndexer(args.workers, analyzer=Analyzer.of(args.analyzer)).index_folder(args.folder)
+
+    if args.querries is not None:
+        with open(args.querries, encoding='utf8') as f:
+            querries = [line.strip() for line in f]
+    else:
+        querries = [line.strip() for line in sys.stdin]
+    querries = [querry for querry in querries if querry != '']
+
+    searcher = BatchSearcher(index, args.workers)
+    try:
+        results = searcher.search(querries, args.k)
+    finally:
+        searcher.close()
+
+    output = open(args.output, 'w', encoding='utf8') if args.output is not None else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    stats = searcher.stats
+    print(f'{stats["queries"]} запросов ({stats["errors"]} с ошибками, {stats["unique_plans"]} уникальных планов, '
+          f'{stats["unique_words"]} слов) за {stats["total_s"]} с: {stats["queries_per_s"]} запросов/с',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
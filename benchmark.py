@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from corpus_generator import CorpusGenerator
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+
+
+class Benchmark:
+    """
+    измеряет на синтетическом корпусе (CorpusGenerator) скорость индексации, сохранения и загрузки индекса,
+    память индекса и задержки запросов фиксированного набора QUERY_MIX. результат - словарь для JSON,
+    который можно сравнить с результатом другого коммита (compare)
+    """
+    # шаблоны запросов: {f} - частое слово, {m} - слово средней частоты, {r} - редкое
+    QUERY_MIX = [
+        ('word', '{m}'),
+        ('and', '{f} & {m}'),
+        ('and_rare', '{f} & {f} & {r}'),
+        ('or', '{m} | {r}'),
+        ('or_frequent', '{f} | {f}'),
+        ('exclude', '{f} \\ {m}'),
+        ('nested', '{f} & ( {m} | {r} )'),
+        ('nested_exclude', '( {f} | {m} ) & {f} \\ ( {m} | {r} )'),
+    ]
+    # диапазоны рангов слов (доли словаря) для {f}, {m} и {r}
+    RANKS = {'f': (0, 0.001), 'm': (0.005, 0.05), 'r': (0.2, 1)}
+    PERCENTILES = [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]
+
+    def __init__(self, generator: CorpusGenerator, queries_per_template: int = 50, k: int = 10, workers: int = 1,
+                 measure_memory: bool = True):
+        self.generator = generator
+        self.queries_per_template = queries_per_template
+        self.k = k
+        self.workers = workers
+        self.measure_memory = measure_memory
+
+    def run(self, corpus_path: str = None) -> dict[str, typing.Any]:
+        """:param corpus_path: папка для корпуса, если None - временная"""
+        if corpus_path is None:
+            with tempfile.TemporaryDirectory() as tmp:
+                return self.run(os.path.join(tmp, 'corpus'))
+
+        result = {'meta': self.get_meta()}
+        start = time.perf_counter()
+        filepaths = self.generator.generate(corpus_path)
+        corpus_bytes = sum(os.path.getsize(filepath) for filepath in filepaths)
+        result['corpus'] = {'files': len(filepaths), 'bytes': corpus_bytes,
+                            'generation_s': round(time.perf_counter() - start, 3)}
+
+        start = time.perf_counter()
+        folder_index = FolderIndexer(self.workers).index_folder(corpus_path)
+        indexing_s = time.perf_counter() - start
+        result['indexing'] = {'seconds': round(indexing_s, 3),
+                              'files_per_s': round(len(filepaths) / indexing_s, 1),
+                              'mb_per_s': round(corpus_bytes / 2 ** 20 / indexing_s, 3),
+                              'words': len(folder_index.word_entires)}
+
+        if self.measure_memory:
+            result['memory'] = self.measure_index_memory(corpus_path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = os.path.join(tmp, 'index.idx')
+            start = time.perf_counter()
+            FolderIndexSaveloader.save(index_path, folder_index)
+            save_s = time.perf_counter() - start
+            start = time.perf_counter()
+            mapped_index = FolderIndexSaveloader.load(index_path)
+            load_s = time.perf_counter() - start
+            start = time.perf_counter()
+            FolderIndexSaveloader.load(index_path, lazy=False)
+            full_load_s = time.perf_counter() - start
+            result['storage'] = {'save_s': round(save_s, 3), 'index_bytes': os.path.getsize(index_path),
+                                 'load_s': round(load_s, 6), 'full_load_s': round(full_load_s, 3)}
+
+            querries = self.make_querries()
+            result['queries'] = {'in_memory': self.measure_querries(folder_index, querries),
+                                 'mapped': self.measure_querries(mapped_index, querries)}
+            mapped_index.close()
+        return result
+
+    def measure_index_memory(self, corpus_path: str) -> dict[str, int]:
+        """индекс строится еще раз под tracemalloc, чтобы трассировка не искажала время индексации"""
+        tracemalloc.start()
+        try:
+            folder_index = FolderIndexer().index_folder(corpus_path)
+            index_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del folder_index
+        return {'index_bytes': index_bytes, 'peak_bytes': peak_bytes}
+
+    def make_querries(self) -> list[tuple[str, str]]:
+        """:return: [(имя шаблона, запрос), ...], при одинаковом seed генератора - одни и те же"""
+        rng = random.Random(self.generator.seed + 2)
+        size = len(self.generator.vocabulary)
+        querries = []
+        for name, template in self.QUERY_MIX:
+            for _ in range(self.queries_per_template):
+                querry = template
+                for group, (low, high) in self.RANKS.items():
+                    while '{' + group + '}' in querry:
+                        rank = rng.randrange(int(low * size), max(int(high * size), int(low * size) + 1))
+                        querry = querry.replace('{' + group + '}', self.generator.get_word(rank), 1)
+                querries.append((name, querry))
+        return querries
+
+    def measure_querries(self, folder_index, querries: list[tuple[str, str]]) -> dict[str, dict[str, float]]:
+        """:return: {шаблон: задержки в мс}, кеш результатов выключен, поиск и ранжирование top-k без вывода"""
+        foogle = Foogle(index=folder_index, results_cache_size=0)
+        # прогрев: первые обращения к словам и файлу индекса
+        for _, querry in querries[::len(querries) // 10 or 1]:
+            foogle.search(querry, self.k)
+
+        latencies_by_name = {}
+        for name, querry in querries:
+            start = time.perf_counter()
+            foogle.search(querry, self.k)
+            latencies_by_name.setdefault(name, []).append(time.perf_counter() - start)
+        latencies_by_name['all'] = [latency for latencies in list(latencies_by_name.values())
+                                    for latency in latencies]
+        return {name: self.summarize(latencies) for name, latencies in latencies_by_name.items()}
+
+    @classmethod
+    def summarize(cls, latencies: list[float]) -> dict[str, float]:
+        latencies = sorted(latencies)
+        summary = {'mean_ms': round(sum(latencies) / len(latencies) * 1000, 4)}
+        for name, q in cls.PERCENTILES:
+            summary[name + '_ms'] = round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 4)
+        return summary
+
+    def get_meta(self) -> dict[str, typing.Any]:
+        generator = self.generator
+        return {
+            'commit': self.get_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': {'seed': generator.seed, 'files': generator.files_count,
+                       'min_words': generator.min_words, 'max_words': generator.max_words,
+                       'vocabulary_size': len(generator.vocabulary), 'zipf_exponent': generator.zipf_exponent,
+                       'encodings': list(generator.encodings), 'queries_per_template': self.queries_per_template,
+                       'k': self.k, 'workers': self.workers},
+        }
+
+    @staticmethod
+    def get_commit() -> typing.Optional[str]:
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @classmethod
+    def compare(cls, old: dict, new: dict, prefix: str = '') -> list[tuple[str, float, float]]:
+        """:return: [(метрика, старое значение, новое), ...] по всем числовым метрикам обоих результатов"""
+        rows = []
+        for key, new_value in new.items():
+            if key == 'meta' or key not in old:
+                continue
+            old_value = old[key]
+            if isinstance(new_value, dict) and isinstance(old_value, dict):
+                rows.extend(cls.compare(old_value, new_value, prefix + key + '.'))
+            elif isinstance(new_value, (int, float)) and isinstance(old_value, (int, float)):
+                rows.append((prefix + key, old_value, new_value))
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='бенчмарк Foogle на синтетическом корпусе')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--min-words', type=int, default=50)
+    parser.add_argument('--max-words', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--zipf', type=float, default=1.0)
+    parser.add_argument('--encodings', default='utf-8,cp1251,utf-16')
+    parser.add_argument('--queries', type=int, default=50, help='запросов на каждый шаблон')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='не измерять память (индексация еще раз)')
+    parser.add_argument('--corpus', help='папка для корпуса (по умолчанию временная)')
+    parser.add_argument('--output', help='куда записать JSON (по умолчанию stdout)')
+    parser.add_argument('--compare', help='JSON прошлого запуска: напечатать изменения метрик')
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(args.seed, args.files, args.min_words, args.max_words, args.vocabulary, args.zipf,
+                                tuple(args.encodings.split(',')))
+    result = Benchmark(generator, args.queries, args.k, args.workers, not args.no_memory).run(args.corpus)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf8') as f:
+            old = json.load(f)
+        for name, old_value, new_value in Benchmark.compare(old, result):
+            change = f'{(new_value / old_value - 1) * 100:+.1f}%' if old_value else ''
+            print(f'{name:45} {old_value:>14} {new_value:>14}  {change}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import bisect
+import itertools
+import os
+import random
+
+
+class CorpusGenerator:
+    """
+    создает синтетический корпус без доступа к сети (в отличие от tests/wiki_parser.py):
+    слова берутся из случайного словаря по закону Ципфа (вероятность слова ранга r пропорциональна 1 / r^s),
+    файлы сохраняются в кодировках из encodings по очереди. при одинаковых параметрах
+    и seed корпус совпадает побайтно
+    """
+    LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+    LATIN_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+    # доля латинских слов в словаре
+    LATIN_SHARE = 0.1
+    WORDS_PER_LINE = 12
+
+    def __init__(self, seed: int = 0, files_count: int = 1000, min_words: int = 50, max_words: int = 500,
+                 vocabulary_size: int = 20000, zipf_exponent: float = 1.0,
+                 encodings: tuple[str, ...] = ('utf-8', 'cp1251', 'utf-16')):
+        """
+        :param min_words: минимальное количество слов в файле
+        :param max_words: максимальное количество слов в файле (размер равномерно распределен между ними)
+        """
+        if files_count < 0: raise ValueError(f'количество файлов должно быть неотрицательным, а не {files_count}')
+        if not 0 < min_words <= max_words: raise ValueError(f'неверный размер файлов: {min_words}..{max_words}')
+        self.seed = seed
+        self.files_count = files_count
+        self.min_words = min_words
+        self.max_words = max_words
+        self.zipf_exponent = zipf_exponent
+        self.encodings = encodings
+        self.vocabulary = self.make_vocabulary(random.Random(seed), vocabulary_size)
+        self.cum_weights = list(itertools.accumulate(1 / rank ** zipf_exponent
+                                                     for rank in range(1, vocabulary_size + 1)))
+
+    def make_vocabulary(self, rng: random.Random, size: int) -> list[str]:
+        """:return: различные слова по убыванию частоты"""
+        words = []
+        seen = set()
+        while len(words) < size:
+            letters = self.LATIN_LETTERS if rng.random() < self.LATIN_SHARE else self.LETTERS
+            # частые слова короче
+            length = min(1 + int(rng.expovariate(1 / (2 + 4 * len(words) / size))), 16)
+            word = ''.join(rng.choice(letters) for _ in range(length))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def generate(self, folderpath: str) -> list[str]:
+        """:return: пути созданных файлов"""
+        os.makedirs(folderpath, exist_ok=True)
+        rng = random.Random(self.seed + 1)
+        filepaths = []
+        width = len(str(max(self.files_count - 1, 0)))
+        for file_no in range(self.files_count):
+            filepath = os.path.join(folderpath, f'doc{str(file_no).zfill(width)}.txt')
+            encoding = self.encodings[file_no % len(self.encodings)]
+            with open(filepath, 'w', encoding=encoding, newline='') as f:
+                f.write(self.make_text(rng))
+            filepaths.append(filepath)
+        return filepaths
+
+    def make_text(self, rng: random.Random) -> str:
+        words_count = rng.randint(self.min_words, self.max_words)
+        words = self.sample_words(rng, words_count)
+        return '\n'.join(' '.join(words[i:i + self.WORDS_PER_LINE])
+                         for i in range(0, len(words), self.WORDS_PER_LINE)) + '\n'
+
+    def sample_words(self, rng: random.Random, count: int) -> list[str]:
+        # то же, что rng.choices(vocabulary, cum_weights=...), но без зависимости от версии Python
+        total = self.cum_weights[-1]
+        last = len(self.vocabulary) - 1
+        return [self.vocabulary[min(bisect.bisect_right(self.cum_weights, rng.random() * total), last)]
+                for _ in range(count)]
+
+    def get_word(self, rank: int) -> str:
+        """:return: слово ранга rank (0 - самое частое)"""
+        return self.vocabulary[rank]
@@ -0,0 +1,109 @@
+import codecs
+import collections
+import os
+import typing
+
+import chardet
+
+
+class EncodingDetector:
+    """
+    определяет кодировку по уже прочитанному началу файла (небольшой файл читается целиком и сразу декодируется):
+    - BOM -> кодировка по BOM
+    - только ASCII -> ascii (у большого файла, начало которого ASCII, - utf-8)
+    - корректный UTF-8 -> utf-8
+    - иначе chardet по первым SAMPLE_SIZE байтам
+    определенные кодировки запоминаются по (путь, размер, mtime), так что при повторной индексации
+    неизмененного файла кодировка не определяется заново
+    """
+    SAMPLE_SIZE = 64 * 2 ** 10
+    MAX_CACHED_FILES = 2 ** 16
+
+    # utf-32 проверяется раньше utf-16: BOM UTF-32 LE начинается с BOM UTF-16 LE
+    BOMS = [
+        (codecs.BOM_UTF32_LE, 'UTF-32'),
+        (codecs.BOM_UTF32_BE, 'UTF-32'),
+        (codecs.BOM_UTF8, 'UTF-8-SIG'),
+        (codecs.BOM_UTF16_LE, 'UTF-16'),
+        (codecs.BOM_UTF16_BE, 'UTF-16'),
+    ]
+
+    def __init__(self):
+        self.encodings: collections.OrderedDict[tuple[str, int, int], str] = collections.OrderedDict()
+
+    def get_encoding(self, filepath: str, sample: bytes, stat: os.stat_result,
+                     complete: bool) -> tuple[str, typing.Optional[str]]:
+        """
+        :param sample: начало файла
+        :param complete: sample - весь файл
+        :return: (кодировка, текст всего файла, если он уже декодирован по пути, иначе None)
+        """
+        key = (filepath, stat.st_size, stat.st_mtime_ns)
+        encoding = self.encodings.get(key)
+        if encoding is not None:
+            self.encodings.move_to_end(key)
+            return encoding, None
+        encoding, text = self.detect(sample) if complete else (self.detect_by_prefix(sample), None)
+        self.remember(key, encoding)
+        return encoding, text
+
+    def remember(self, key: tuple[str, int, int], encoding: str):
+        self.encodings[key] = encoding
+        if len(self.encodings) > self.MAX_CACHED_FILES:
+            self.encodings.popitem(last=False)
+
+    def forget(self, filepath: str, stat: os.stat_result):
+        self.encodings.pop((filepath, stat.st_size, stat.st_mtime_ns), None)
+
+    def detect(self, data: bytes) -> tuple[str, typing.Optional[str]]:
+        """:return: (кодировка, текст, если он уже декодирован по пути, иначе None)"""
+        for bom, encoding in self.BOMS:
+            if data.startswith(bom):
+                return encoding, None
+        if data.isascii():
+            return 'ascii', data.decode('ascii')
+        try:
+            return 'utf-8', data.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+        encoding = chardet.detect(data[:self.SAMPLE_SIZE])['encoding']
+        if encoding is not None and len(data) > self.SAMPLE_SIZE:
+            try:
+                return encoding, data.decode(encoding)
+            except UnicodeDecodeError:
+                # по началу файла кодировка определилась неверно
+                encoding = chardet.detect(data)['encoding']
+        # chardet не узнал кодировку - как и при открытии файла без кодировки, пробуем utf-8
+        return encoding if encoding is not None else 'utf-8', None
+
+    def detect_by_prefix(self, sample: bytes) -> str:
+        """кодировка большого файла по его началу"""
+        for bom, encoding in self.BOMS:
+            if sample.startswith(bom):
+                return encoding
+        try:
+            # в конце начала файла может оказаться обрезанный многобайтовый символ
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+        encoding = chardet.detect(sample[:self.SAMPLE_SIZE])['encoding']
+        return encoding if encoding is not None else 'utf-8'
+
+    def detect_file(self, filepath: str) -> str:
+        """кодировка по всему файлу (chardet читает файл, пока не уверен), когда начала файла не хватило"""
+        detector = chardet.UniversalDetector()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.SAMPLE_SIZE), b''):
+                detector.feed(chunk)
+                if detector.done:
+                    break
+        detector.close()
+        encoding = detector.result['encoding']
+        return encoding if encoding is not None else 'utf-8'
+
+    @staticmethod
+    def translate_newlines(text: str) -> str:
+        if '\r' not in text:
+            return text
+        return text.replace('\r\n', '\n').replace('\r', '\n')
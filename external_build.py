@@ -0,0 +1,238 @@
+import argparse
+import heapq
+import itertools
+import os
+import pickle
+import struct
+import tempfile
+import time
+import typing
+
+from analyzer import Analyzer
+from folder_index import FolderIndex, FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
+from index_storage import IndexFileReader, IndexFileWriter, UINT32
+from instrumentation import Instrumentation, Stats
+
+# запись прогона: длина слова в байтах utf-8, длина блока, затем слово и блок вхождений в формате index_storage
+# (без сжатия, с номерами слов). записи отсортированы по слову
+RUN_RECORD = struct.Struct('<II')
+
+
+class RunBlock:
+    """где в файле прогона лежит блок вхождений слова: разделы блока копируются в итоговый блок по отдельности"""
+    __slots__ = ('offset', 'df', 'total')
+
+    def __init__(self, offset: int, df: int, total: int):
+        """
+        :param offset: смещение блока в файле прогона
+        :param df: в скольких файлах прогона есть слово
+        :param total: сколько всего вхождений слова в прогоне
+        """
+        self.offset = offset
+        self.df = df
+        self.total = total
+
+    def get_sections(self) -> list[tuple[int, int]]:
+        """:return: [(смещение, длина)] doc_id, количеств, троек вхождений и номеров слов"""
+        doc_ids_offset = self.offset + UINT32.size
+        counts_offset = doc_ids_offset + 4 * self.df
+        packed_offset = counts_offset + 4 * self.df
+        positions_offset = packed_offset + 24 * self.total
+        return [(doc_ids_offset, 4 * self.df), (counts_offset, 4 * self.df),
+                (packed_offset, 24 * self.total), (positions_offset, 4 * self.total)]
+
+
+class RunReader:
+    """
+    читает файл прогона по записям. файл читается только явными seek + read, потому что следующая запись
+    читается слиянием раньше, чем скопирован блок текущей
+    """
+    # размер куска, которым копируются разделы блока
+    COPY_CHUNK_SIZE = 2 ** 20
+
+    def __init__(self, filepath: str):
+        self.file = open(filepath, 'rb')
+
+    def __iter__(self) -> typing.Iterator[tuple[bytes, RunBlock]]:
+        offset = 0
+        while True:
+            header = self.read(offset, RUN_RECORD.size)
+            if len(header) < RUN_RECORD.size:
+                return
+            term_length, block_length = RUN_RECORD.unpack(header)
+            term_bytes = self.read(offset + RUN_RECORD.size, term_length)
+            block_offset = offset + RUN_RECORD.size + term_length
+            df = UINT32.unpack(self.read(block_offset, UINT32.size))[0]
+            counts = IndexFileReader.from_le_bytes('I', self.read(block_offset + UINT32.size + 4 * df, 4 * df))
+            yield term_bytes, RunBlock(block_offset, df, sum(counts))
+            offset = block_offset + block_length
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def iter_section(self, offset: int, length: int) -> typing.Iterator[bytes]:
+        end = offset + length
+        while offset < end:
+            chunk = self.read(offset, min(self.COPY_CHUNK_SIZE, end - offset))
+            if not chunk:
+                raise ValueError(f'файл прогона {self.file.name} обрывается на {offset}-м байте')
+            yield chunk
+            offset += len(chunk)
+
+    def close(self):
+        self.file.close()
+
+
+class ExternalIndexBuilder:
+    """
+    строит файл индекса папки в ограниченной памяти (SPIMI): файлы индексируются в FolderIndex, пока его
+    примерный размер не превысит memory_limit, потом его слова сортируются и сбрасываются на диск прогоном,
+    а описания файлов дописываются в общий временный файл. прогоны идут по подряд идущим файлам, поэтому
+    doc_id в них сразу глобальные, и блок слова в итоговом индексе - блоки прогонов, склеенные по разделам.
+    в конце прогоны сливаются k-way слиянием по словам прямо в файл индекса (index_storage), блоки копируются
+    кусками по COPY_CHUNK_SIZE. результат совпадает с FolderIndexSaveloader.save индекса, построенного в памяти.
+    в памяти одновременно: индекс одного прогона, по записи на прогон при слиянии, и словарь и таблица файлов
+    итогового индекса (по несколько десятков байт на слово и на файл)
+    """
+    # примерный размер в памяти FolderIndex (вместе с TfIdfIndex) в байтах: на вхождение,
+    # на пару (слово, файл) и на слово. замерено tracemalloc на синтетическом корпусе
+    ENTRY_SIZE = 40
+    PAIR_SIZE = 400
+    TERM_SIZE = 1000
+
+    def __init__(self, memory_limit: int = 256 * 2 ** 20, compress: bool = False, temp_directory: str = None,
+                 instrumentation: Instrumentation = None, analyzer: Analyzer = None):
+        """
+        :param memory_limit: сколько байт может занимать индекс одного прогона
+        :param temp_directory: где держать прогоны (по умолчанию рядом с файлом индекса)
+        :param instrumentation: если задана, получает Stats каждого файла и в конце Stats('index'):
+            время build (индексация и сброс прогонов) и merge, количество прогонов и их размер
+        :param analyzer: нормализация слов, записывается в файл индекса
+        """
+        if memory_limit <= 0: raise ValueError(f'ограничение памяти должно быть положительным, а не {memory_limit}')
+        self.memory_limit = memory_limit
+        self.compress = compress
+        self.temp_directory = temp_directory
+        self.instrumentation = instrumentation
+        self.indexer = FolderIndexer(instrumentation=instrumentation, analyzer=analyzer)
+        # счетчики последнего построения
+        self.runs_count = 0
+        self.docs_count = 0
+        self.files_with_words_count = 0
+
+    def build(self, folderpath: str, filepath: str) -> MappedFolderIndex:
+        """индексирует папку в файл индекса filepath и открывает его"""
+        start = time.perf_counter()
+        temp_directory = self.temp_directory or os.path.dirname(os.path.abspath(filepath))
+        with tempfile.TemporaryDirectory(dir=temp_directory) as directory:
+            docs_path = os.path.join(directory, 'docs')
+            run_paths = []
+            self.docs_count = 0
+            self.files_with_words_count = 0
+            with open(docs_path, 'wb') as docs_file:
+                folder_index, entries, pairs = FolderIndex(self.indexer.analyzer), 0, 0
+                for source_path in self.indexer.iter_filepaths(folderpath):
+                    self.indexer.index_file(folder_index, source_path)
+                    entries += folder_index.doc_lengths[folder_index.doc_ids[source_path]]
+                    pairs += len(folder_index.tf_idf_index.word_count_in_file.get(source_path, ()))
+                    if self.estimate_size(entries, pairs, len(folder_index.word_entires)) >= self.memory_limit:
+                        run_paths.append(self.spill(folder_index, directory, len(run_paths), docs_file))
+                        folder_index, entries, pairs = FolderIndex(self.indexer.analyzer), 0, 0
+                if len(folder_index.filepaths) > 0:
+                    run_paths.append(self.spill(folder_index, directory, len(run_paths), docs_file))
+                del folder_index
+            built = time.perf_counter()
+
+            self.runs_count = len(run_paths)
+            run_bytes = sum(os.path.getsize(run_path) for run_path in run_paths)
+            readers = [RunReader(run_path) for run_path in run_paths]
+            try:
+                IndexFileWriter.write_blocks(filepath, self.iter_docs(docs_path), self.files_with_words_count,
+                                             self.merge_runs(readers), self.compress,
+                                             analyzer_config=self.indexer.analyzer.get_config())
+            finally:
+                for reader in readers:
+                    reader.close()
+
+        if self.instrumentation is not None:
+            stats = Stats('index')
+            stats.add_time('build', built - start)
+            stats.add_time('merge', time.perf_counter() - built)
+            stats.count('files', self.docs_count)
+            stats.count('runs', len(run_paths))
+            stats.count('run_bytes', run_bytes)
+            self.instrumentation.emit('index', stats)
+        return FolderIndexSaveloader.load(filepath)
+
+    def estimate_size(self, entries: int, pairs: int, terms: int) -> int:
+        return self.ENTRY_SIZE * entries + self.PAIR_SIZE * pairs + self.TERM_SIZE * terms
+
+    def spill(self, folder_index: FolderIndex, directory: str, run_no: int, docs_file: typing.BinaryIO) -> str:
+        """
+        сбрасывает слова индекса в файл прогона, а описания его файлов - в docs_file
+        :return: путь к файлу прогона
+        """
+        run_path = os.path.join(directory, f'run-{run_no}')
+        docs, new_doc_ids = FolderIndexSaveloader.make_docs(folder_index, self.docs_count)
+        self.docs_count += len(docs)
+        self.files_with_words_count += folder_index.tf_idf_index.get_files_count()
+        for doc in docs:
+            pickle.dump(doc, docs_file)
+        with open(run_path, 'wb') as f:
+            for word, postings in sorted(folder_index.word_entires.items()):
+                term_bytes = word.encode('utf8')
+                block = IndexFileWriter.make_block([(new_doc_ids[doc_id], entries.packed, entries.positions)
+                                                    for doc_id, entries in postings.items()])
+                f.write(RUN_RECORD.pack(len(term_bytes), len(block)))
+                f.write(term_bytes)
+                f.write(block)
+        return run_path
+
+    @staticmethod
+    def iter_docs(docs_path: str) -> typing.Iterator[tuple]:
+        with open(docs_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    @classmethod
+    def merge_runs(cls, readers: list[RunReader]) -> typing.Iterator[tuple[str, int, typing.Iterator[bytes]]]:
+        """:return: [(слово, df, куски итогового блока), ...] в порядке возрастания слов"""
+        # при равных словах прогоны идут по порядку, то есть по возрастанию doc_id
+        merged = heapq.merge(*(zip(reader, itertools.repeat(run_no)) for run_no, reader in enumerate(readers)),
+                             key=lambda item: (item[0][0], item[1]))
+        for term_bytes, group in itertools.groupby(merged, key=lambda item: item[0][0]):
+            parts = [(readers[run_no], block) for (_, block), run_no in group]
+            yield term_bytes.decode('utf8'), sum(block.df for _, block in parts), cls.iter_block_chunks(parts)
+
+    @staticmethod
+    def iter_block_chunks(parts: list[tuple[RunReader, RunBlock]]) -> typing.Iterator[bytes]:
+        yield UINT32.pack(sum(block.df for _, block in parts))
+        sections = [(reader, block.get_sections()) for reader, block in parts]
+        for section_no in range(4):
+            for reader, block_sections in sections:
+                yield from reader.iter_section(*block_sections[section_no])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='построение индекса Foogle в ограниченной памяти')
+    parser.add_argument('folder', help='папка, которую проиндексировать')
+    parser.add_argument('index', help='куда записать файл индекса')
+    parser.add_argument('--memory-limit', type=int, default=256, help='память на индекс одного прогона, МБ')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--temp-directory', help='папка для прогонов (по умолчанию рядом с индексом)')
+    parser.add_argument('--analyzer', choices=Analyzer.PRESETS, default='raw', help='нормализация слов')
+    args = parser.parse_args()
+
+    builder = ExternalIndexBuilder(args.memory_limit * 2 ** 20, args.compress, args.temp_directory,
+                                   analyzer=Analyzer.of(args.analyzer))
+    index = builder.build(args.folder, args.index)
+    print(f'{index.get_docs_count()} файлов, {builder.runs_count} прогонов')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
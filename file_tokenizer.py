@@ -0,0 +1,144 @@
+import io
+import re
+import typing
+from array import array
+
+import settings
+
+
+class HashingReader(io.RawIOBase):
+    """
+    читает файл, начиная с уже прочитанного начала prefix, и считает хеш всего прочитанного,
+    чтобы хеш FileStat и индексация обходились одним чтением файла
+    """
+
+    def __init__(self, file: typing.BinaryIO, prefix: bytes, content_hash):
+        super().__init__()
+        self.file = file
+        self.prefix = memoryview(prefix)
+        self.content_hash = content_hash
+        self.content_hash.update(prefix)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if len(self.prefix) > 0:
+            n = min(len(buffer), len(self.prefix))
+            buffer[:n] = self.prefix[:n]
+            self.prefix = self.prefix[n:]
+            return n
+        n = self.file.readinto(buffer)
+        if n:
+            self.content_hash.update(memoryview(buffer)[:n])
+        return n
+
+
+class FileTokenizer:
+    """
+    разбивает текст, приходящий кусками, на слова (settings.WORD_REGEX) с теми же смещениями и номерами строк,
+    что и разбор всего файла по строкам: смещения считаются в тексте после casefold, строки нумеруются с 1.
+    в памяти держится только текущий кусок и незаконченная строка. слишком длинная незаконченная строка
+    режется после последнего слова, которое точно закончилось (для регулярок вроде \\S+, совпадение
+    которых не содержит перевод строки и не может продлиться за символ, на котором остановилось)
+    - line_starts: смещения начал строк
+    - length:      количество символов текста после casefold
+    """
+    WORD_PATTERN = re.compile(settings.WORD_REGEX)
+    # сколько символов незаконченной строки держать, прежде чем отдать уже законченные в ней слова
+    MAX_LINE_BUFFER = 2 ** 20
+
+    def __init__(self):
+        self.line_starts = array('q')
+        self.length = 0
+        self.line = 1
+        self.at_line_start = True
+        # незаконченная строка: куски текста начиная с позиции buffer_offset
+        self.pieces: list[str] = []
+        self.pieces_length = 0
+        self.buffer_offset = 0
+
+    def tokenize(self, chunks: typing.Iterable[str]) -> typing.Iterator[tuple[str, int, int, int]]:
+        """:return: (слово, offset, номер строки, длина) по порядку"""
+        for chunk in chunks:
+            chunk = chunk.casefold()
+            if len(chunk) > 0:
+                yield from self.feed(chunk)
+        yield from self.flush()
+
+    def feed(self, chunk: str) -> list[tuple[str, int, int, int]]:
+        """:return: слова, которые точно закончились"""
+        if self.at_line_start:
+            self.line_starts.append(self.length)
+            self.at_line_start = False
+        self.length += len(chunk)
+
+        last_newline = chunk.rfind('\n')
+        if last_newline == -1:
+            self.pieces.append(chunk)
+            self.pieces_length += len(chunk)
+            if self.pieces_length > self.MAX_LINE_BUFFER:
+                return self.cut_long_line()
+            return []
+
+        # законченные строки разбираются одним проходом регулярки
+        self.pieces.append(chunk[:last_newline + 1])
+        tokens = self.tokenize_lines(''.join(self.pieces), self.buffer_offset)
+        remainder = chunk[last_newline + 1:]
+        self.buffer_offset = self.length - len(remainder)
+        self.pieces = [remainder] if len(remainder) > 0 else []
+        self.pieces_length = len(remainder)
+        if len(remainder) > 0:
+            self.line_starts.append(self.buffer_offset)
+        else:
+            self.at_line_start = True
+        return tokens
+
+    def flush(self) -> list[tuple[str, int, int, int]]:
+        tokens = self.tokenize_lines(''.join(self.pieces), self.buffer_offset)
+        self.buffer_offset = self.length
+        self.pieces = []
+        self.pieces_length = 0
+        return tokens
+
+    def tokenize_lines(self, text: str, offset: int) -> list[tuple[str, int, int, int]]:
+        """
+        разбирает text, начинающийся с позиции offset внутри текущей строки и заканчивающийся переводом строки
+        (или концом файла). начала строк внутри text добавляются в line_starts
+        """
+        tokens = []
+        line = self.line
+        line_starts = self.line_starts
+        next_newline = text.find('\n')
+        for match in self.WORD_PATTERN.finditer(text):
+            start, end = match.span()
+            while -1 < next_newline < start:
+                line += 1
+                # начало последней строки куска добавится, когда придет ее первый символ
+                if next_newline + 1 < len(text):
+                    line_starts.append(offset + next_newline + 1)
+                next_newline = text.find('\n', next_newline + 1)
+            tokens.append((match.group(), offset + start, line, end - start))
+        while next_newline != -1:
+            line += 1
+            if next_newline + 1 < len(text):
+                line_starts.append(offset + next_newline + 1)
+            next_newline = text.find('\n', next_newline + 1)
+        self.line = line
+        return tokens
+
+    def cut_long_line(self) -> list[tuple[str, int, int, int]]:
+        text = ''.join(self.pieces)
+        tokens = []
+        cut = len(text)
+        for match in self.WORD_PATTERN.finditer(text):
+            start, end = match.span()
+            if end == len(text):
+                # слово может продолжиться в следующем куске
+                cut = start
+                break
+            tokens.append((match.group(), self.buffer_offset + start, self.line, end - start))
+        self.buffer_offset += cut
+        self.pieces = [text[cut:]] if cut < len(text) else []
+        self.pieces_length = len(text) - cut
+        return tokens
@@ -1,144 +1,769 @@
+import copy
+import functools
+import gc
+import hashlib
+import io
+import itertools
 import os
 import pickle
-import re
+import time
 import typing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
-import chardet
+from analyzer import Analyzer
+from encoding_detection import EncodingDetector
+from file_tokenizer import FileTokenizer, HashingReader
+from if_idf import TfIdfIndex, MappedTfIdfIndex
+from index_storage import IndexFileReader, IndexFileWriter, is_index_file
+from instrumentation import Instrumentation, Stats, StatsCollector
+from postings import WordEntry, WordEntries, Postings
+from term_dictionary import TermDictionary, MappedTermDictionary
 
-import settings
-from if_idf import TfIdfIndex
 
+class FileStat:
+    """размер, время изменения и хеш содержимого файла на момент индексации"""
+    __slots__ = ('size', 'mtime', 'content_hash')
 
-class WordEntry:
-    """одно вхождение одного слова в один файл"""
+    def __init__(self, size: int, mtime: int, content_hash: bytes):
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
 
-    def __init__(self, offset: int, line: int, length: int):
-        self.offset = offset
-        self.length = length
-        self.line = line
+    @classmethod
+    def of(cls, filepath: str) -> 'FileStat':
+        stat = os.stat(filepath)
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                content_hash.update(chunk)
+        return cls(stat.st_size, stat.st_mtime_ns, content_hash.digest())
 
+    def is_same_stat(self, stat: os.stat_result) -> bool:
+        """совпадают ли размер и время изменения (без чтения файла)"""
+        return self.size == stat.st_size and self.mtime == stat.st_mtime_ns
 
-class SearchResult:
-    """хранит {файл: [вхождения]}"""
+    def __eq__(self, other):
+        return (isinstance(other, FileStat) and
+                (self.size, self.mtime, self.content_hash) == (other.size, other.mtime, other.content_hash))
 
-    def __init__(self, entries: dict[str, list[WordEntry]] = None):
-        if entries is None: entries = {}
-        self.entries = entries
+    def __repr__(self):
+        return f'FileStat({self.size}, {self.mtime}, {self.content_hash.hex()})'
+
+
+class SearchResult:
+    """
+    хранит Postings результата и таблицу файлов (doc_id -> путь),
+    чтобы отдавать вхождения по пути: entries - {файл: вхождения}.
+    если задан entries_loader (doc_id -> вхождения), postings - только файлы без вхождений, а вхождения
+    файла собираются при первом обращении к нему (например, когда файл показывается на странице результатов).
+    stats - instrumentation.Stats поиска, который вернул этот результат (None без Instrumentation, см. with_stats)
+    folder_index - индекс, по которому выполнен поиск (у SegmentedIndex - снимок): из него же сниппеты берут
+    кодировки и начала строк файлов, даже если индекс с тех пор изменился
+    """
+
+    def __init__(self, postings: Postings = None, filepaths: typing.Sequence[str] = (),
+                 entries_loader: typing.Callable[[int], WordEntries] = None):
+        if postings is None: postings = Postings()
+        self.postings = postings
+        self.filepaths = filepaths
+        self.entries_loader = entries_loader
+        self.loaded_entries: dict[int, WordEntries] = {}
+        self.entries_by_filepath = None
+        self.stats: typing.Optional[Stats] = None
+        self.folder_index = None
+
+    @property
+    def entries(self) -> 'LazyEntries':
+        if self.entries_by_filepath is None:
+            self.entries_by_filepath = LazyEntries(self)
+        return self.entries_by_filepath
+
+    def with_stats(self, stats: Stats) -> 'SearchResult':
+        """
+        :return: копия результата со Stats одного поиска. сам результат лежит в кеше и отдается повторным поискам,
+            поэтому Stats в него не записываются. вхождения у копии общие с результатом
+        """
+        result = copy.copy(self)
+        result.entries_by_filepath = None
+        result.stats = stats
+        return result
+
+    def get_entries(self, doc_id: int) -> WordEntries:
+        """вхождения файла doc_id из результата"""
+        if self.entries_loader is None:
+            return self.postings.get(doc_id)
+        if doc_id not in self.loaded_entries:
+            self.loaded_entries[doc_id] = self.entries_loader(doc_id)
+        return self.loaded_entries[doc_id]
+
+    def load_postings(self) -> Postings:
+        """:return: Postings результата с вхождениями всех файлов"""
+        if self.entries_loader is None:
+            return self.postings
+        doc_ids = array('I', self.postings.doc_ids)
+        return Postings(doc_ids, [self.get_entries(doc_id) for doc_id in doc_ids])
 
     @classmethod
     def intersect(cls, entries_list: list['SearchResult']) -> 'SearchResult':
         if len(entries_list) == 0: raise ValueError('перресечение пустого набора результатов')
-
-        all_filenames = [set(entries.entries.keys()) for entries in entries_list]
-        # Начинаем с самого маленького множества, чтобы ускорить пересечение
-        common_filenames = min(all_filenames, key=len)
-        # Пересекаем его с остальными множествами
-        common_filenames = common_filenames.intersection(*all_filenames)
-
-        intersection = {}
-        for common_filename in common_filenames:
-            common_word_entries: list[WordEntry] = []
-            for entries in entries_list:
-                if common_filename not in entries.entries: continue
-                common_word_entries.extend(entries.entries[common_filename])
-                # todo: пофиксить дублирование в запросах вида "кукуруза AND кукуруза"
-            common_word_entries.sort(key=lambda entry: entry.offset)
-            intersection[common_filename] = common_word_entries
-        return SearchResult(intersection)
+        return SearchResult(Postings.intersect([entries.load_postings() for entries in entries_list]),
+                            entries_list[0].filepaths)
 
     @classmethod
     def unite(cls, entries_list: list['SearchResult']) -> 'SearchResult':
         if len(entries_list) == 0: return SearchResult()
-
-        all_filenames = [set(entries.entries.keys()) for entries in entries_list]
-        common_filenames = all_filenames[0].union(*all_filenames)
-
-        union = {}
-        for common_filename in common_filenames:
-            common_word_entries: list[WordEntry] = []
-            for entries in entries_list:
-                if common_filename not in entries.entries: continue
-                common_word_entries.extend(entries.entries[common_filename])
-                # todo: пофиксить дублирование в запросах вида "кукуруза AND кукуруза"
-            common_word_entries.sort(key=lambda entry: entry.offset)
-            union[common_filename] = common_word_entries
-        return SearchResult(union)
+        return SearchResult(Postings.unite([entries.load_postings() for entries in entries_list]),
+                            entries_list[0].filepaths)
 
     @classmethod
     def exclude(cls, result: 'SearchResult', exclusions: list['SearchResult']) -> 'SearchResult':
         if len(exclusions) == 0:
             return result
-        # получаем set фалов, которые нужно исключить из result
-        excluded_filenames_list = [set(exluded_result.entries.keys()) for exluded_result in exclusions]
-        excluded_filenames = excluded_filenames_list[0].union(*excluded_filenames_list)
-
-        # исключаем лишние файлы
-        result = {fname: entries for (fname, entries) in result.entries.items() if fname not in excluded_filenames}
-        return SearchResult(result)
+        return SearchResult(Postings.exclude(result.load_postings(),
+                                             [exclusion.postings for exclusion in exclusions]),
+                            result.filepaths)
 
     def __getitem__(self, filename):
         return self.entries[filename]
 
-    def __setitem__(self, key, value):
-        self.entries[key] = value
+
+class LazyEntries(typing.Mapping[str, WordEntries]):
+    """{файл: вхождения} результата поиска: вхождения файла берутся из SearchResult.get_entries при обращении"""
+
+    def __init__(self, result: SearchResult):
+        self.result = result
+        self.doc_ids_by_filepath = {result.filepaths[doc_id]: doc_id for doc_id in result.postings.doc_ids}
+
+    def __getitem__(self, filepath: str) -> WordEntries:
+        return self.result.get_entries(self.doc_ids_by_filepath[filepath])
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.doc_ids_by_filepath)
+
+    def __len__(self):
+        return len(self.doc_ids_by_filepath)
 
 
 class FolderIndex:
 
-    def __init__(self):
+    def __init__(self, analyzer: Analyzer = None):
         """
         хранит 
-        - word_entires: {слово: {файл: [вхождения]}}
+        - filepaths:    [путь к файлу по doc_id], None на месте удаленных файлов
+        - doc_ids:      {файл: doc_id}
+        - word_entires: {слово: Postings}
         - encodings:    {файл: кодировка}
-        - tf_idf_index: TfIdfIndex
+        - file_stats:   {файл: FileStat} - чтобы при обновлении переиндексировать только измененные файлы
+        - line_starts:  {файл: смещения начал строк} - чтобы сниппет сразу брал нужную строку
+        - doc_lengths:  [количество слов в файле по doc_id] - для BM25
+        - tf_idf_index: TfIdfIndex, в нем же analyzer - нормализация слов файлов и запросов (по умолчанию без шагов)
+        - generation:   счетчик изменений индекса, по нему кеши запросов понимают, что устарели
+        - term_dictionary: TermDictionary слов word_entires, строится при первом запросе с шаблоном
+                           и сбрасывается, когда в индексе появляются или пропадают слова
         """
-        self.word_entires: dict[str, dict[str, list[WordEntry]]] = {}
+        self.filepaths: list[typing.Optional[str]] = []
+        self.doc_ids: dict[str, int] = {}
+        self.word_entires: dict[str, Postings] = {}
         self.encodings = {}
-        self.tf_idf_index = TfIdfIndex()
-
-    def add(self, word, filepath, entry: WordEntry):
+        self.file_stats: dict[str, FileStat] = {}
+        self.line_starts: dict[str, array] = {}
+        self.doc_lengths = array('I')
+        self.tf_idf_index = TfIdfIndex(analyzer)
+        self.generation = 0
+        self.term_dictionary: typing.Optional[TermDictionary] = None
+
+    @property
+    def analyzer(self) -> Analyzer:
+        return self.tf_idf_index.analyzer
+
+    def get_or_add_doc_id(self, filepath: str) -> int:
+        if filepath not in self.doc_ids:
+            self.generation += 1
+            self.doc_ids[filepath] = len(self.filepaths)
+            self.filepaths.append(filepath)
+            self.doc_lengths.append(0)
+        return self.doc_ids[filepath]
+
+    def add(self, word, filepath, offset: int, line: int, length: int, position: int):
+        """:param position: номер слова в файле (для фраз и NEAR)"""
+        self.generation += 1
         if word not in self.word_entires:
-            self.word_entires[word] = {}
-        if filepath not in self.word_entires[word]:
-            self.word_entires[word][filepath] = []
-        self.word_entires[word][filepath].append(entry)
+            self.word_entires[word] = Postings()
+            self.term_dictionary = None
+        doc_id = self.get_or_add_doc_id(filepath)
+        self.word_entires[word].add_entry(doc_id, offset, line, length, position)
+        self.doc_lengths[doc_id] += 1
+
+    def merge(self, other: 'FolderIndex'):
+        """вливает в этот индекс другой, построенный по другому набору файлов. doc_id другого индекса сдвигаются"""
+        if other.analyzer != self.analyzer:
+            raise ValueError(f'индекс с анализатором {other.analyzer} нельзя влить в индекс с {self.analyzer}')
+        self.generation += 1
+        self.term_dictionary = None
+        shift = len(self.filepaths)
+        self.filepaths.extend(other.filepaths)
+        self.doc_lengths.extend(other.doc_lengths)
+        for filepath, doc_id in other.doc_ids.items():
+            self.doc_ids[filepath] = doc_id + shift
+        for word, postings in other.word_entires.items():
+            if word not in self.word_entires:
+                self.word_entires[word] = Postings()
+            self.word_entires[word].extend(postings, shift)
+        self.encodings.update(other.encodings)
+        self.file_stats.update(other.file_stats)
+        self.line_starts.update(other.line_starts)
+        self.tf_idf_index.merge(other.tf_idf_index)
+
+    def remove_file(self, filepath: str):
+        """удаляет из индекса все, что относится к файлу. doc_id файла больше не используется"""
+        self.generation += 1
+        doc_id = self.doc_ids.pop(filepath, None)
+        if doc_id is not None:
+            self.filepaths[doc_id] = None
+            self.doc_lengths[doc_id] = 0
+            for word in self.tf_idf_index.get_words_in_file(filepath):
+                self.word_entires[word].remove(doc_id)
+                if len(self.word_entires[word]) == 0:
+                    del self.word_entires[word]
+                    self.term_dictionary = None
+        self.tf_idf_index.remove_file(filepath)
+        self.encodings.pop(filepath, None)
+        self.file_stats.pop(filepath, None)
+        self.line_starts.pop(filepath, None)
+
+    def update(self, folderpath: str, workers: int = 1) -> tuple[list[str], list[str], list[str]]:
+        """см. FolderIndexer.update_folder"""
+        return FolderIndexer(workers, analyzer=self.analyzer).update_folder(self, folderpath)
+
+    def get_doc_frequency(self, word: str) -> int:
+        """:return: количество файлов со словом"""
+        if word in self.word_entires:
+            return len(self.word_entires[word])
+        return 0
+
+    def get_term_dictionary(self) -> TermDictionary:
+        if self.term_dictionary is None:
+            self.term_dictionary = TermDictionary(sorted(self.word_entires))
+        return self.term_dictionary
+
+    def expand_terms(self, pattern: str, max_expansions: int) -> list[str]:
+        """см. TermDictionary.expand"""
+        return self.get_term_dictionary().expand(pattern, max_expansions)
+
+    def get_term_counts(self, word: str) -> tuple[array, array]:
+        """:return: (doc_id файлов со словом по возрастанию, количество вхождений слова в каждый из них)"""
+        postings = self[word]
+        return postings.doc_ids, postings.get_counts()
+
+    def get_term_doc_ids(self, word: str) -> array:
+        """:return: doc_id файлов со словом по возрастанию"""
+        return self[word].doc_ids
+
+    def get_doc_lengths(self) -> array:
+        return self.doc_lengths
 
-    def __getitem__(self, word: str):
+    def get_average_doc_length(self) -> float:
+        """средняя длина файла со словами (для BM25)"""
+        files_count = self.tf_idf_index.get_files_count()
+        return sum(self.get_doc_lengths()) / files_count if files_count > 0 else 0
+
+    def get_docs_count(self) -> int:
+        return len(self.doc_ids)
+
+    def entries_by_file(self, word: str) -> dict[str, WordEntries]:
+        """:return: {файл: вхождения слова}"""
+        return {self.filepaths[doc_id]: entries for doc_id, entries in self[word].items()}
+
+    def __getitem__(self, word: str) -> Postings:
         if word in self.word_entires:
             return self.word_entires[word]
-        return {}
+        return Postings()
+
+
+class MappedFilepaths(typing.Sequence[str]):
+    """[путь к файлу по doc_id] поверх таблицы файлов индекса, пути читаются по мере обращения"""
+
+    def __init__(self, reader: IndexFileReader):
+        self.reader = reader
+        self.get_path = functools.lru_cache(maxsize=None)(reader.doc_path)
+
+    def __getitem__(self, doc_id: int) -> str:
+        if not 0 <= doc_id < self.reader.docs_count:
+            raise IndexError(doc_id)
+        return self.get_path(doc_id)
+
+    def __len__(self):
+        return self.reader.docs_count
+
+
+class MappedDocIds(typing.Mapping[str, int]):
+    """{файл: doc_id} поверх файла индекса, таблица файлов читается целиком при первом обращении"""
+
+    def __init__(self, filepaths: MappedFilepaths):
+        self.filepaths = filepaths
+        self.doc_ids = None
+
+    def get_all(self) -> dict[str, int]:
+        if self.doc_ids is None:
+            self.doc_ids = {filepath: doc_id for doc_id, filepath in enumerate(self.filepaths)}
+        return self.doc_ids
+
+    def __getitem__(self, filepath: str) -> int:
+        return self.get_all()[filepath]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.get_all())
+
+    def __len__(self):
+        return len(self.filepaths)
+
+
+class MappedWordEntries(typing.Mapping[str, Postings]):
+    """{слово: Postings} поверх файла индекса, вхождения слова декодируются при обращении к нему"""
+
+    def __init__(self, reader: IndexFileReader):
+        self.reader = reader
+
+    def __getitem__(self, word: str) -> Postings:
+        term_id = self.reader.find_term(word)
+        if term_id is None:
+            raise KeyError(word)
+        return self.decode(term_id)
+
+    def __contains__(self, word):
+        return self.reader.find_term(word) is not None
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for term_id in range(self.reader.terms_count):
+            yield self.reader.term(term_id)
+
+    def __len__(self):
+        return self.reader.terms_count
+
+    def items(self) -> typing.Iterator[tuple[str, Postings]]:
+        for term_id in range(self.reader.terms_count):
+            yield self.reader.term(term_id), self.decode(term_id)
+
+    def decode(self, term_id: int) -> Postings:
+        doc_ids, counts, packed, positions = self.reader.read_block(term_id)
+        entries = []
+        cursor = 0
+        for count in counts:
+            entries.append(WordEntries(packed[3 * cursor:3 * (cursor + count)],
+                                       positions[cursor:cursor + count] if positions is not None else None))
+            cursor += count
+        return Postings(doc_ids, entries)
+
+
+class MappedEncodings(typing.Mapping[str, str]):
+    """{файл: кодировка} поверх файла индекса"""
+
+    def __init__(self, reader: IndexFileReader, doc_ids: MappedDocIds):
+        self.reader = reader
+        self.doc_ids = doc_ids
+
+    def __getitem__(self, filepath: str) -> str:
+        return self.reader.doc_encoding(self.doc_ids[filepath])
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return self.reader.docs_count
+
+
+class MappedFileStats(typing.Mapping[str, FileStat]):
+    """{файл: FileStat} поверх файла индекса"""
+
+    def __init__(self, reader: IndexFileReader, doc_ids: MappedDocIds):
+        self.reader = reader
+        self.doc_ids = doc_ids
+
+    def __getitem__(self, filepath: str) -> FileStat:
+        stat = self.reader.doc_stat(self.doc_ids[filepath])
+        if stat is None:
+            raise KeyError(filepath)
+        return FileStat(*stat)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return (filepath for filepath, doc_id in self.doc_ids.items() if self.reader.doc_stat(doc_id) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class MappedLineStarts(typing.Mapping[str, array]):
+    """{файл: смещения начал строк} поверх файла индекса"""
+
+    def __init__(self, reader: IndexFileReader, doc_ids: MappedDocIds):
+        self.reader = reader
+        self.doc_ids = doc_ids
+
+    def __getitem__(self, filepath: str) -> array:
+        line_starts = self.reader.doc_line_starts(self.doc_ids[filepath])
+        if line_starts is None:
+            raise KeyError(filepath)
+        return line_starts
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return (filepath for filepath, doc_id in self.doc_ids.items()
+                if self.reader.doc_line_starts(doc_id) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class MappedFolderIndex(FolderIndex):
+    """FolderIndex только для чтения поверх файла индекса, открытого через mmap"""
+
+    def __init__(self, reader: IndexFileReader):
+        super().__init__()
+        self.reader = reader
+        self.filepaths = MappedFilepaths(reader)
+        self.doc_ids = MappedDocIds(self.filepaths)
+        self.word_entires = MappedWordEntries(reader)
+        self.encodings = MappedEncodings(reader, self.doc_ids)
+        self.file_stats = MappedFileStats(reader, self.doc_ids)
+        self.line_starts = MappedLineStarts(reader, self.doc_ids)
+        self.doc_lengths = None
+        self.tf_idf_index = MappedTfIdfIndex(reader, self.filepaths.__getitem__)
+        self.term_dictionary = MappedTermDictionary(reader)
+
+    def get_or_add_doc_id(self, filepath: str) -> int:
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def add(self, word, filepath, offset: int, line: int, length: int, position: int):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def merge(self, other: 'FolderIndex'):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def remove_file(self, filepath: str):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def get_doc_frequency(self, word: str) -> int:
+        # df хранится в словаре терминов, блок вхождений не читается
+        term_id = self.reader.find_term(word)
+        return self.reader.df(term_id) if term_id is not None else 0
+
+    def get_term_counts(self, word: str) -> tuple[array, array]:
+        term_id = self.reader.find_term(word)
+        if term_id is None:
+            return array('I'), array('I')
+        return self.reader.read_counts(term_id)
+
+    def get_term_doc_ids(self, word: str) -> array:
+        # вхождения не декодируются
+        return self.get_term_counts(word)[0]
+
+    def get_doc_lengths(self) -> array:
+        if self.doc_lengths is None:
+            self.doc_lengths = self.reader.doc_lengths()
+        if self.doc_lengths is None:
+            # индекс сохранен до того, как начал хранить длины файлов
+            self.doc_lengths = array('I', bytes(4 * self.reader.docs_count))
+            for term_id in range(self.reader.terms_count):
+                for doc_id, count in zip(*self.reader.read_counts(term_id)):
+                    self.doc_lengths[doc_id] += count
+        return self.doc_lengths
+
+    def close(self):
+        self.reader.close()
+
+    def to_folder_index(self) -> FolderIndex:
+        """читает весь файл индекса в обычный FolderIndex"""
+        folder_index = FolderIndex(self.analyzer)
+        folder_index.filepaths = list(self.filepaths)
+        folder_index.doc_ids = dict(self.doc_ids)
+        for word, postings in self.word_entires.items():
+            folder_index.word_entires[word] = postings
+            for doc_id, entries in postings.items():
+                folder_index.tf_idf_index.add(word, folder_index.filepaths[doc_id], len(entries))
+        folder_index.encodings = dict(self.encodings)
+        folder_index.file_stats = dict(self.file_stats)
+        folder_index.line_starts = dict(self.line_starts)
+        folder_index.doc_lengths = array('I', self.get_doc_lengths())
+        return folder_index
+
+
+class PackedIndex:
+    """
+    частичный индекс, который процесс-воркер отдает главному процессу: вхождения всех слов подряд в нескольких
+    массивах, а не объекты Postings и WordEntries на каждую пару (слово, файл) и словари TfIdfIndex.
+    массивы пиклятся как байты, так что пересылка стоит почти столько же, сколько копирование памяти
+    - docs:      описания файлов, как у FolderIndexSaveloader.make_docs; doc_id - номер в этом списке
+    - terms:     слова в порядке появления в частичном индексе
+    - dfs:       в скольких файлах есть каждое слово
+    - doc_ids, counts:     по паре (слово, файл) подряд по словам - doc_id файла и количество вхождений
+    - packed, positions:   тройки (offset, line, length) и номера слов всех вхождений подряд по парам
+    """
+
+    def __init__(self, docs: list[tuple], terms: list[str], dfs: array, doc_ids: array, counts: array, packed: array,
+                 positions: array):
+        self.docs = docs
+        self.terms = terms
+        self.dfs = dfs
+        self.doc_ids = doc_ids
+        self.counts = counts
+        self.packed = packed
+        self.positions = positions
+
+    @classmethod
+    def of(cls, folder_index: FolderIndex) -> 'PackedIndex':
+        docs, new_doc_ids = FolderIndexSaveloader.make_docs(folder_index)
+        dfs, doc_ids, counts = array('I'), array('I'), array('I')
+        packed, positions = array('q'), array('I')
+        for postings in folder_index.word_entires.values():
+            dfs.append(len(postings))
+            for doc_id, entries in postings.items():
+                doc_ids.append(new_doc_ids[doc_id])
+                counts.append(len(entries))
+                packed.extend(entries.packed)
+                positions.extend(entries.positions)
+        return cls(docs, list(folder_index.word_entires), dfs, doc_ids, counts, packed, positions)
+
+    def merge_into(self, folder_index: FolderIndex):
+        """
+        вливает частичный индекс в folder_index - то же, что folder_index.merge(частичный индекс),
+        но вхождения раскладываются сразу по спискам folder_index, без промежуточного FolderIndex
+        """
+        # распаковка создает сотни тысяч объектов без циклических ссылок, и сборщик мусора,
+        # который запускается по их количеству, занимал больше половины ее времени
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.unpack_into(folder_index)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def unpack_into(self, folder_index: FolderIndex):
+        folder_index.generation += 1
+        folder_index.term_dictionary = None
+        shift = len(folder_index.filepaths)
+        for path, encoding, stat, line_starts, length in self.docs:
+            doc_id = folder_index.get_or_add_doc_id(path)
+            folder_index.doc_lengths[doc_id] = length
+            folder_index.encodings[path] = encoding
+            if stat is not None:
+                folder_index.file_stats[path] = FileStat(*stat)
+            if line_starts is not None:
+                folder_index.line_starts[path] = line_starts
+
+        # количества слов собираются по файлам и попадают в TfIdfIndex файлом целиком
+        count_by_word_by_doc: list[dict[str, int]] = [{} for _ in self.docs]
+        packed, positions = self.packed, self.positions
+        pair, entry = 0, 0
+        for word, df in zip(self.terms, self.dfs):
+            doc_ids = self.doc_ids[pair:pair + df]
+            entries_list = []
+            for doc_id, count in zip(doc_ids, self.counts[pair:pair + df]):
+                end = entry + count
+                entries_list.append(WordEntries(packed[3 * entry:3 * end], positions[entry:end]))
+                count_by_word_by_doc[doc_id][word] = count
+                entry = end
+            if word not in folder_index.word_entires:
+                folder_index.word_entires[word] = Postings()
+            folder_index.word_entires[word].extend(Postings(doc_ids, entries_list), shift)
+            pair += df
+        for doc_id, count_by_word in enumerate(count_by_word_by_doc):
+            folder_index.tf_idf_index.add_file(folder_index.filepaths[shift + doc_id], count_by_word)
+
+
+def _index_batch(filepaths: list[str], instrumented: bool = False,
+                 analyzer: Analyzer = None) -> tuple[PackedIndex, list[Stats]]:
+    """строит частичный индекс в процессе-воркере. :return: (индекс, Stats файлов, если instrumented)"""
+    if not instrumented:
+        return PackedIndex.of(FolderIndexer(analyzer=analyzer).index_files(filepaths)), []
+    collector = StatsCollector()
+    folder_index = FolderIndexer(instrumentation=Instrumentation([collector]), analyzer=analyzer).index_files(filepaths)
+    return PackedIndex.of(folder_index), collector.stats.get('file', [])
 
 
 class FolderIndexer:
-    def __init__(self):
-        pass
+    # на сколько пачек делить файлы на каждого воркера, чтобы воркеры не простаивали
+    BATCHES_PER_WORKER = 4
+    # общий для всех индексаторов процесса: кодировки запоминаются между индексациями
+    encoding_detector = EncodingDetector()
+    # файлы больше этого размера в байтах читаются и разбираются на слова кусками
+    MAX_WHOLE_FILE_SIZE = 4 * 2 ** 20
+    # размер куска в символах
+    CHUNK_SIZE = 2 ** 20
+
+    def __init__(self, workers: int = 1, instrumentation: Instrumentation = None, analyzer: Analyzer = None):
+        """
+        :param workers: количество процессов для индексации, 1 - индексировать в текущем процессе
+        :param instrumentation: если задана, получает Stats каждого файла (время read, detect, tokenize,
+            прочитанные байты и слова) и сумму по всем файлам после build_index
+        :param analyzer: анализатор новых индексов (файлы индексируются анализатором индекса, в который попадают)
+        """
+        if workers < 1: raise ValueError(f'количество воркеров должно быть положительным, а не {workers}')
+        self.workers = workers
+        self.instrumentation = instrumentation
+        self.analyzer = analyzer if analyzer is not None else Analyzer()
+        self.stats: typing.Optional[Stats] = None
 
     def index_folder(self, folderpath):
-        folder_index = FolderIndex()
-        for filepath in self.iter_filepaths(folderpath):
+        folder_index = self.build_index(list(self.iter_filepaths(folderpath)))
+        folder_index.tf_idf_index.compute_idf()
+        return folder_index
+
+    def update_folder(self, folder_index: FolderIndex, folderpath: str) -> tuple[list[str], list[str], list[str]]:
+        """
+        переиндексирует новые и измененные файлы папки и удаляет из индекса удаленные.
+        файл считается неизмененным, если совпали размер и mtime, а если нет - сравнивается хеш содержимого,
+        поэтому читаются только новые файлы и файлы с измененными размером или mtime
+        :return: (новые, измененные, удаленные) файлы
+        """
+        filepaths = list(self.iter_filepaths(folderpath))
+        present_filepaths = set(filepaths)
+        deleted = [filepath for filepath in folder_index.encodings
+                   if filepath.startswith(folderpath + '/') and filepath not in present_filepaths]
+
+        added, changed = [], []
+        for filepath in filepaths:
+            old_stat = folder_index.file_stats.get(filepath)
+            if old_stat is None:
+                # файл мог быть проиндексирован до того, как индекс стал хранить FileStat
+                (changed if filepath in folder_index.encodings else added).append(filepath)
+                continue
+            if old_stat.is_same_stat(os.stat(filepath)):
+                continue
+            new_stat = FileStat.of(filepath)
+            if new_stat.content_hash == old_stat.content_hash:
+                folder_index.file_stats[filepath] = new_stat
+            else:
+                changed.append(filepath)
+
+        for filepath in deleted + changed:
+            folder_index.remove_file(filepath)
+        folder_index.merge(self.build_index(added + changed))
+        folder_index.tf_idf_index.compute_idf()
+        return added, changed, deleted
+
+    def build_index(self, filepaths: list[str]) -> FolderIndex:
+        """индексирует файлы в текущем процессе или в пуле процессов, если workers > 1"""
+        start = time.perf_counter()
+        instrumented = self.instrumentation is not None
+        self.stats = Stats('index') if instrumented else None
+        if self.workers == 1:
+            folder_index = self.index_files(filepaths)
+        else:
+            # каждый воркер строит индекс по своей пачке файлов и отдает его упакованным (PackedIndex),
+            # потом индексы сливаются. пачки идут подряд и сливаются по порядку, поэтому результат совпадает
+            # с последовательной индексацией
+            folder_index = FolderIndex(self.analyzer)
+            with ProcessPoolExecutor(self.workers) as executor:
+                batches = self.split_into_batches(filepaths)
+                for partial_index, files_stats in executor.map(_index_batch, batches, itertools.repeat(instrumented),
+                                                               itertools.repeat(self.analyzer)):
+                    partial_index.merge_into(folder_index)
+                    for file_stats in files_stats:
+                        self.add_file_stats(file_stats)
+        if instrumented:
+            self.stats.add_time('build', time.perf_counter() - start)
+            self.instrumentation.emit('index', self.stats)
+        return folder_index
+
+    def index_files(self, filepaths: typing.Iterable[str]) -> 'FolderIndex':
+        folder_index = FolderIndex(self.analyzer)
+        for filepath in filepaths:
             self.index_file(folder_index, filepath)
         return folder_index
 
-    def index_file(self, folder_index: FolderIndex, filepath: str):
-        # todo может выделить это в отдельный класс
-        # индексация кодировки
-        if filepath not in folder_index.encodings:
-            folder_index.encodings[filepath] = self.get_encoding(filepath)
-        encoding = folder_index.encodings[filepath]
-
-        # индексация вхождений и tf_idf
-        with open(filepath, 'r', encoding=encoding) as f:
-            total_char_count = 0
-            for i, line in enumerate(f.readlines()):
-                line = line.casefold()
-                for match in re.finditer(settings.WORD_REGEX, line):
-                    word = match.group()
-                    folder_index.add(word, filepath,
-                                     WordEntry(match.span()[0] + total_char_count, i + 1,
-                                               match.span()[1] - match.span()[0]))
-                    # может и это выделить отдельно
-                    folder_index.tf_idf_index.add(word, filepath)
-                total_char_count += len(line)
+    def split_into_batches(self, filepaths: list[str]) -> list[list[str]]:
+        batches_count = min(len(filepaths), self.workers * self.BATCHES_PER_WORKER)
+        if batches_count == 0: return []
+        batch_size, remainder = divmod(len(filepaths), batches_count)
+        batches = []
+        start = 0
+        for i in range(batches_count):
+            end = start + batch_size + (1 if i < remainder else 0)
+            batches.append(filepaths[start:end])
+            start = end
+        return batches
+
+    def add_file_stats(self, file_stats: Stats):
+        if self.stats is not None:
+            self.stats.merge(file_stats)
+        self.instrumentation.emit('file', file_stats)
+
+    def index_file(self, folder_index: FolderIndex, filepath: str, encoding: str = None):
+        """
+        файл читается один раз: по прочитанным байтам считается хеш, определяется кодировка и строится индекс.
+        файл до MAX_WHOLE_FILE_SIZE байт читается целиком, больший - кусками по CHUNK_SIZE символов
+        (тогда чтение остальной части файла входит во время tokenize)
+        :param encoding: кодировка, если она уже известна
+        """
+        start = time.perf_counter()
+        doc_id = folder_index.get_or_add_doc_id(filepath)
+        with open(filepath, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            sample = f.read(self.MAX_WHOLE_FILE_SIZE)
+            complete = len(sample) < self.MAX_WHOLE_FILE_SIZE
+            read = time.perf_counter()
+
+            # индексация кодировки
+            known_encoding = encoding or folder_index.encodings.get(filepath)
+            text = None
+            if known_encoding is not None:
+                encoding = known_encoding
+            else:
+                encoding, text = self.encoding_detector.get_encoding(filepath, sample, stat, complete)
+            folder_index.encodings[filepath] = encoding
+            detected = time.perf_counter()
+
+            content_hash = hashlib.blake2b(digest_size=16)
+            if complete:
+                content_hash.update(sample)
+                if text is None:
+                    text = sample.decode(encoding)
+                chunks = [self.encoding_detector.translate_newlines(text)]
+            else:
+                # перевод строк приводится к \n так же, как при открытии файла в режиме 'r'
+                stream = io.TextIOWrapper(io.BufferedReader(HashingReader(f, sample, content_hash)), encoding=encoding)
+                chunks = iter(lambda: stream.read(self.CHUNK_SIZE), '')
+
+            # индексация вхождений и tf_idf. слова, выброшенные анализатором, не занимают номеров
+            tokenizer = FileTokenizer()
+            analyzer = folder_index.analyzer
+            try:
+                if analyzer.is_identity:
+                    # без шагов слова индексируются как есть, без вызова анализатора на каждое вхождение
+                    for position, (word, offset, line, length) in enumerate(tokenizer.tokenize(chunks)):
+                        folder_index.add(word, filepath, offset, line, length, position)
+                        # может и это выделить отдельно
+                        folder_index.tf_idf_index.add(word, filepath)
+                else:
+                    position = 0
+                    for token, offset, line, length in tokenizer.tokenize(chunks):
+                        analyzed = analyzer.analyze(token)
+                        if analyzed is None:
+                            continue
+                        word, word_start, word_end = analyzed
+                        folder_index.add(word, filepath, offset + word_start, line, word_end - word_start, position)
+                        folder_index.tf_idf_index.add(word, filepath)
+                        position += 1
+            except UnicodeDecodeError:
+                if complete or known_encoding is not None:
+                    raise
+                # кодировка, определенная по началу большого файла, не подошла для его продолжения
+                folder_index.remove_file(filepath)
+                self.encoding_detector.forget(filepath, stat)
+                return self.index_file(folder_index, filepath, self.encoding_detector.detect_file(filepath))
+        folder_index.file_stats[filepath] = FileStat(stat.st_size, stat.st_mtime_ns, content_hash.digest())
+        folder_index.line_starts[filepath] = tokenizer.line_starts
+
+        if self.instrumentation is not None:
+            file_stats = Stats(filepath)
+            file_stats.add_time('read', read - start)
+            file_stats.add_time('detect', detected - read)
+            file_stats.add_time('tokenize', time.perf_counter() - detected)
+            file_stats.count('files')
+            file_stats.count('bytes_read', stat.st_size)
+            file_stats.count('words', folder_index.doc_lengths[doc_id])
+            self.add_file_stats(file_stats)
 
     def iter_filepaths(self, folderpath) -> typing.Generator[str, None, None]:
         """рекурсивно проходится по всем файлам в папке и ее подпапкках"""
@@ -151,24 +776,104 @@ class FolderIndexer:
                     yield filepath
 
     def get_encoding(self, filepath: str) -> str:
-        detector = chardet.UniversalDetector()
-        with open(filepath, 'rb') as fh:
-            for line in fh:
-                detector.feed(line)
-                if detector.done:
-                    break
-            detector.close()
-        return detector.result['encoding']
+        with open(filepath, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            sample = f.read(self.MAX_WHOLE_FILE_SIZE)
+        return self.encoding_detector.get_encoding(filepath, sample, stat,
+                                                   len(sample) < self.MAX_WHOLE_FILE_SIZE)[0]
 
 
 class FolderIndexSaveloader:
+    """
+    сохраняет индекс в бинарный формат index_storage и открывает его через mmap.
+    старые индексы в pickle тоже загружаются, а convert переводит их в новый формат
+    """
+
     @classmethod
-    def save(cls, filepath: str, folder_index: FolderIndex):
-        with open(filepath, 'wb') as f:
-            pickle.dump(folder_index, f)
+    def save(cls, filepath: str, folder_index: FolderIndex, compress: bool = False):
+        docs, new_doc_ids = cls.make_docs(folder_index)
+        terms = (
+            (word, [(new_doc_ids[doc_id], entries.packed, entries.positions) for doc_id, entries in postings.items()])
+            for word, postings in sorted(folder_index.word_entires.items())
+        )
+        # индексы, построенные до появления номеров слов, сохраняются без них
+        positions = all(entries.positions is not None
+                        for postings in folder_index.word_entires.values() for entries in postings.entries)
+        IndexFileWriter.write(filepath, docs, folder_index.tf_idf_index.get_files_count(), terms, compress,
+                              positions, folder_index.analyzer.get_config())
+
+    @staticmethod
+    def make_docs(folder_index: FolderIndex, first_doc_id: int = 0) -> tuple[list[tuple], dict[int, int]]:
+        """
+        :param first_doc_id: doc_id первого файла в файле индекса
+        :return: (описания файлов для IndexFileWriter, {doc_id в folder_index: doc_id в файле индекса}).
+            doc_id удаленных файлов пропускаются, так что в файле doc_id снова идут подряд
+        """
+        new_doc_ids = {}
+        docs = []
+        for doc_id, path in enumerate(folder_index.filepaths):
+            if path is None: continue
+            new_doc_ids[doc_id] = first_doc_id + len(docs)
+            stat = folder_index.file_stats.get(path)
+            docs.append((path, folder_index.encodings[path],
+                         (stat.size, stat.mtime, stat.content_hash) if stat is not None else None,
+                         folder_index.line_starts.get(path), folder_index.doc_lengths[doc_id]))
+        return docs, new_doc_ids
 
     @classmethod
-    def load(cls, filepath: str) -> FolderIndex:
+    def load(cls, filepath: str, lazy: bool = True) -> FolderIndex:
+        """
+        :param lazy: True - вернуть MappedFolderIndex, который читает вхождения слов с диска по мере запросов,
+                     False - прочитать весь индекс в память
+        """
+        if not is_index_file(filepath):
+            return cls.load_pickle(filepath)
+        index = MappedFolderIndex(IndexFileReader(filepath))
+        if lazy:
+            return index
+        folder_index = index.to_folder_index()
+        index.close()
+        return folder_index
+
+    @classmethod
+    def load_pickle(cls, filepath: str) -> FolderIndex:
         with open(filepath, 'rb') as f:
-            index = pickle.load(f)
+            index: FolderIndex = pickle.load(f)
+        # старые индексы не хранят FileStat, при обновлении их файлы будут переиндексированы
+        if not hasattr(index, 'file_stats'):
+            index.file_stats = {}
+        if not hasattr(index, 'line_starts'):
+            index.line_starts = {}
+        if not hasattr(index, 'generation'):
+            index.generation = 0
+        if not hasattr(index, 'term_dictionary'):
+            index.term_dictionary = None
+        if not hasattr(index.tf_idf_index, 'idf_by_word'):
+            index.tf_idf_index.idf_by_word = None
+        if not hasattr(index.tf_idf_index, 'analyzer'):
+            index.tf_idf_index.analyzer = Analyzer()
+        # в старых индексах нет doc_id, а вхождения хранятся {слово: {файл: вхождения}}, иногда списками WordEntry
+        if not hasattr(index, 'filepaths'):
+            index.filepaths = list(index.encodings)
+            index.doc_ids = {filepath: doc_id for doc_id, filepath in enumerate(index.filepaths)}
+            for word, entries_by_file in index.word_entires.items():
+                postings = Postings()
+                for filepath, entries in sorted(entries_by_file.items(), key=lambda item: index.doc_ids[item[0]]):
+                    if isinstance(entries, list):
+                        packed = array('q')
+                        for entry in entries:
+                            packed.extend((entry.offset, entry.line, entry.length))
+                        entries = WordEntries(packed)
+                    postings.append(index.doc_ids[filepath], entries)
+                index.word_entires[word] = postings
+        if not hasattr(index, 'doc_lengths'):
+            index.doc_lengths = array('I', bytes(4 * len(index.filepaths)))
+            for postings in index.word_entires.values():
+                for doc_id, entries in postings.items():
+                    index.doc_lengths[doc_id] += len(entries)
         return index
+
+    @classmethod
+    def convert(cls, pickle_filepath: str, filepath: str, compress: bool = False):
+        """переводит индекс, сохраненный в pickle, в бинарный формат"""
+        cls.save(filepath, cls.load_pickle(pickle_filepath), compress)
@@ -1,132 +1,430 @@
+import collections
+import functools
+import itertools
 import re
+import time
+import typing
+from array import array
 
 import colorama
 
 import logic_tree
-from folder_index import WordEntry, SearchResult, FolderIndex, FolderIndexer
+from analyzer import Analyzer
+from folder_index import WordEntry, WordEntries, SearchResult, FolderIndex, FolderIndexer, Postings
+from instrumentation import Instrumentation, Stats
+from query_cache import QueryCache
+from query_planner import QueryPlanner, PlanNode, TermNode, PhraseNode, NearNode, AndNode, OrNode, ExcludeNode
+from scoring import Scorer, TfIdfScorer
+from segmented_index import SegmentedIndex
+from sharded_index import ShardedIndex
+from text_cache import FileTextCache
 
 colorama.init()
 
 
 class ExpressionSearcher:
-    def __init__(self, folder_index: FolderIndex):
+    """
+    выполняет запрос по плану из QueryPlanner в две фазы.
+    1. файлы: план вычисляется над списками doc_id без вхождений (из файла индекса читаются только doc_id слов).
+       дети AND вычисляются от самого редкого, и каждый следующий ищется только среди файлов, прошедших предыдущие;
+       исключаемое ищется только среди файлов положительной части.
+       фразы и NEAR проверяются по номерам слов из вхождений, сами файлы не читаются.
+       как только промежуточный результат пуст, остальные поддеревья не вычисляются
+    2. вхождения: для файла из результата план вычисляется еще раз, но только над вхождениями этого файла
+       (get_entries). SearchResult делает это при первом обращении к вхождениям файла, так что вхождения
+       собираются только для показанных файлов, а промежуточные файлы, отсеянные AND и исключениями, их не копируют
+    """
+
+    # список слова отбирается по кандидатам, если кандидатов хотя бы в RESTRICT_RATIO раз меньше
+    RESTRICT_RATIO = 4
+
+    def __init__(self, folder_index: FolderIndex, postings_cache: QueryCache = None, stats: Stats = None):
+        """
+        :param postings_cache: кеш {слово: Postings}, если None - вхождения каждый раз берутся из индекса
+        :param stats: если задан, в него считаются прочитанные списки вхождений и размеры входов и выходов операторов
+        """
         self.folder_index = folder_index
+        self.postings_cache = postings_cache
+        self.stats = stats
+        # результаты подзапросов без ограничения по файлам, по каноническому ключу узла плана
+        self.results_by_key: dict[tuple, Postings] = {}
 
     def search_by_or_tree(self, or_tree: logic_tree.OrTree) -> SearchResult:
-        results_list = [self.search_by_and_tree(and_tree) for and_tree in or_tree.and_trees]
-        results = SearchResult.unite(results_list)
-        return results
-
-    def search_by_and_tree(self, and_tree: logic_tree.AndTree) -> SearchResult:
-        results_list = [self.search_by_exclusion_tree(exclusion_tree) for exclusion_tree in and_tree.exclusion_trees]
-        results = SearchResult.intersect(results_list)
-        return results
-
-    def search_by_exclusion_tree(self, exclusion_tree: logic_tree.ExclusionTree) -> SearchResult:
-        results_list = [self.search_by_atom(atom) for atom in exclusion_tree.atoms]
-        results = SearchResult.exclude(results_list[0], results_list[1:])
-        return results
-
-    def search_by_atom(self, atom: logic_tree.Atom):
-        if isinstance(atom, logic_tree.WordAtom):
-            return SearchResult(self.folder_index[atom.value])
-        if isinstance(atom, logic_tree.TreeAtom):
-            atom: logic_tree.TreeAtom
-            return self.search_by_or_tree(atom.value)
+        return self.search(QueryPlanner(self.folder_index).plan(or_tree))
+
+    def search(self, plan: PlanNode) -> SearchResult:
+        self.results_by_key = {}
+        postings = self.search_by_plan(plan)
+        self.results_by_key = {}
+        # вхождения собираются после того, как Stats поиска отданы хукам, и в них не считаются
+        self.stats = None
+        return SearchResult(postings, self.folder_index.filepaths, functools.partial(self.get_entries, plan))
+
+    def search_by_plan(self, node: PlanNode, candidates: Postings = None) -> Postings:
+        """
+        :param candidates: если задан, результат должен быть верен только для файлов из candidates:
+            файлы вне candidates в нем могут остаться, вызывающий все равно пересекает или исключает
+            результат с candidates (вхождения candidates в результат не попадают)
+        """
+        if node.key in self.results_by_key:
+            if self.stats is not None:
+                self.stats.count('memo_hits')
+            return self.restrict(self.results_by_key[node.key], candidates)
+        result = self.evaluate(node, candidates)
+        if self.stats is not None:
+            # node.key[0] - 'term', 'phrase', 'near', 'and', 'or' или 'exclude'
+            operator = node.key[0]
+            self.stats.count(operator + '.evaluations')
+            if candidates is not None:
+                self.stats.count(operator + '.candidates', len(candidates))
+            self.stats.count(operator + '.results', len(result))
+        if candidates is None:
+            self.results_by_key[node.key] = result
+        return result
+
+    def evaluate(self, node: PlanNode, candidates: typing.Optional[Postings]) -> Postings:
+        """:return: файлы без вхождений"""
+        if isinstance(node, TermNode):
+            return self.restrict(self.get_doc_ids(node.word), candidates)
+        if isinstance(node, PhraseNode):
+            postings_list = []
+            for word in node.words:
+                postings = self.restrict(self.get_postings(word), candidates)
+                if len(postings) == 0:
+                    return Postings.of_doc_ids()
+                postings_list.append(postings)
+                candidates = postings if candidates is None or len(postings) < len(candidates) else candidates
+            return Postings.phrase(postings_list, with_entries=False)
+        if isinstance(node, NearNode):
+            left = self.search_by_plan(node.left, candidates)
+            if len(left) == 0:
+                return left
+            common = Postings.intersect([left, self.search_by_plan(node.right, left)])
+            # пары ищутся по вхождениям сторон в каждом общем файле
+            return Postings.of_doc_ids(array('I', (doc_id for doc_id in common.doc_ids
+                                                   if self.get_entries(node, doc_id) is not None)))
+        if isinstance(node, AndNode):
+            results = []
+            for child in node.children:
+                result = self.search_by_plan(child, candidates)
+                if len(result) == 0:
+                    return result
+                results.append(result)
+                candidates = result
+            return Postings.intersect(results)
+        if isinstance(node, OrNode):
+            return Postings.unite([self.search_by_plan(child, candidates) for child in node.children])
+        if isinstance(node, ExcludeNode):
+            result = self.search_by_plan(node.positive, candidates)
+            if len(result) == 0:
+                return result
+            return Postings.exclude(result, [self.search_by_plan(node.excluded, result)])
         raise AssertionError()
 
+    def get_entries(self, node: PlanNode, doc_id: int) -> typing.Optional[WordEntries]:
+        """:return: вхождения, которыми файл doc_id удовлетворяет узлу плана, или None, если не удовлетворяет"""
+        if isinstance(node, TermNode):
+            return self.get_postings(node.word).get(doc_id)
+        if isinstance(node, PhraseNode):
+            found = [self.get_postings(word).get(doc_id) for word in node.words]
+            if None in found:
+                return None
+            starts = Postings.find_phrase_starts(found)
+            return Postings.select_phrase(found, starts) if starts else None
+        if isinstance(node, NearNode):
+            left = self.get_entries(node.left, doc_id)
+            if left is None:
+                return None
+            right = self.get_entries(node.right, doc_id)
+            if right is None:
+                return None
+            return Postings.select_near(left, right, node.distance)
+        if isinstance(node, AndNode):
+            entries_list = []
+            for child in node.children:
+                entries = self.get_entries(child, doc_id)
+                if entries is None:
+                    return None
+                entries_list.append(entries)
+            return WordEntries.merge(entries_list)
+        if isinstance(node, OrNode):
+            entries_list = [entries for entries in (self.get_entries(child, doc_id) for child in node.children)
+                            if entries is not None]
+            return WordEntries.merge(entries_list) if entries_list else None
+        if isinstance(node, ExcludeNode):
+            if self.get_entries(node.excluded, doc_id) is not None:
+                return None
+            return self.get_entries(node.positive, doc_id)
+        raise AssertionError()
+
+    def get_doc_ids(self, word: str) -> Postings:
+        """файлы со словом без вхождений (из файла индекса вхождения не читаются)"""
+        if self.postings_cache is None:
+            postings = Postings.of_doc_ids(self.folder_index.get_term_doc_ids(word))
+        else:
+            # вместе со списком в кеше остается его битмап
+            key = ('doc_ids', word)
+            generation = self.folder_index.generation
+            postings = self.postings_cache.get(key, generation)
+            if postings is None:
+                postings = Postings.of_doc_ids(self.folder_index.get_term_doc_ids(word))
+                self.postings_cache.put(key, postings, postings.get_size(), generation)
+            elif self.stats is not None:
+                self.stats.count('postings_cache_hits')
+        if self.stats is not None:
+            self.stats.count('postings_touched')
+            self.stats.count('postings_files', len(postings))
+        return postings
+
+    def get_postings(self, word: str) -> Postings:
+        if self.postings_cache is None:
+            postings = self.folder_index[word]
+        else:
+            generation = self.folder_index.generation
+            postings = self.postings_cache.get(word, generation)
+            if postings is None:
+                postings = self.folder_index[word]
+                self.postings_cache.put(word, postings, postings.get_size(), generation)
+            elif self.stats is not None:
+                self.stats.count('postings_cache_hits')
+        if self.stats is not None:
+            self.stats.count('postings_touched')
+            self.stats.count('postings_files', len(postings))
+        return postings
+
+    def restrict(self, result: Postings, candidates: typing.Optional[Postings]) -> Postings:
+        # отбор по candidates окупается, только если он заметно сокращает список
+        if candidates is None or len(candidates) * self.RESTRICT_RATIO >= len(result):
+            return result
+        return Postings.restrict(result, candidates)
+
 
 class Foogle:
-    def __init__(self, folderpath: str = None, index: FolderIndex = None):
+    # примерный размер одной пары (файл, оценка) ранжирования в байтах, для учета размера кеша результатов
+    RANKING_ITEM_SIZE = 128
+
+    def __init__(self, folderpath: str = None, index: typing.Union[FolderIndex, ShardedIndex] = None, workers: int = 1,
+                 snippets_per_file: int = 10, results_cache_size: int = 256, postings_cache_size: int = 1024,
+                 scorer: Scorer = None, instrumentation: Instrumentation = None,
+                 max_expansions: int = QueryPlanner.MAX_EXPANSIONS, analyzer: Analyzer = None):
+        """
+        :param scorer: ранжирование результатов, по умолчанию TfIdfScorer (можно Bm25Scorer)
+        :param instrumentation: если задана, каждый поиск собирает Stats: время фаз tokenize, parse, plan, search,
+            rank, snippets и счетчики - они передаются хукам и лежат в SearchResult.stats.
+            та же Instrumentation получает Stats индексации, если Foogle индексирует папку
+        :param max_expansions: сколько слов индекса может подойти под шаблон со * (см. QueryPlanner)
+        :param analyzer: нормализация слов при индексации папки folderpath (у готового index - его собственная)
+        """
         none_args_count = (folderpath, index).count(None)
         if none_args_count != 1:
             raise Exception(f'Ровно один агрумент должен быть не None, а не {none_args_count}: {(folderpath, index)}')
 
         if folderpath is not None:
-            folder_index = FolderIndexer().index_folder(folderpath)
+            folder_index = FolderIndexer(workers, instrumentation, analyzer).index_folder(folderpath)
         elif index is not None:
             folder_index = index
         else:
             raise AssertionError()
 
         self.folder_index = folder_index
+        self.snippets_per_file = snippets_per_file
+        self.scorer = scorer if scorer is not None else TfIdfScorer()
+        self.instrumentation = instrumentation
+        self.max_expansions = max_expansions
+        self.file_texts = FileTextCache()
+        # результат поиска и ранжирование по запросу, и вхождения отдельных слов
+        self.results_cache = QueryCache(max_items=results_cache_size)
+        self.postings_cache = QueryCache(max_items=postings_cache_size)
+
+    def search_expression(self, querry, k: int = None, offset: int = 0):
+        """
+        :param k: сколько лучших файлов показать (None - все)
+        :param offset: сколько лучших файлов пропустить (для постраничного вывода)
+        """
+        result, filepaths_with_score, stats = self.run_search(querry, k, offset)
+        if stats is None:
+            self.show_results(result, filepaths_with_score)
+            return result
 
-    def search_expression(self, querry):
+        start = time.perf_counter()
+        files_read, bytes_read = self.file_texts.files_read, self.file_texts.bytes_read
+        self.show_results(result, filepaths_with_score)
+        stats.add_time('snippets', time.perf_counter() - start)
+        stats.count('files_opened', self.file_texts.files_read - files_read)
+        stats.count('bytes_read', self.file_texts.bytes_read - bytes_read)
+        self.instrumentation.emit('search', stats)
+        return result
+
+    def search(self, querry, k: int = None, offset: int = 0) -> tuple[SearchResult, list[tuple[str, float]]]:
+        """то же, что search_expression, но без вывода: (результат, [(файл, оценка), ...])"""
+        result, filepaths_with_score, stats = self.run_search(querry, k, offset)
+        if stats is not None:
+            self.instrumentation.emit('search', stats)
+        return result, filepaths_with_score
+
+    def run_search(self, querry, k: typing.Optional[int],
+                   offset: int) -> tuple[SearchResult, list[tuple[str, float]], typing.Optional[Stats]]:
+        stats = Stats(querry) if self.instrumentation is not None else None
+        start = time.perf_counter()
         # TODO: может не стоит делать casefold тут (чтобы не кейсфолдить операторы)
         querry = querry.casefold()
+        parser = logic_tree.LogicTreeParser(querry)
+        tokenized = time.perf_counter()
+        expr = parser.parse()
+        parsed = time.perf_counter()
+        folder_index = self.get_index()
+        plan = QueryPlanner(folder_index, self.max_expansions).plan(expr)
+        key = (plan.key, self.get_ranking_words(folder_index, querry), k, offset)
+        generation = folder_index.generation
+        planned = time.perf_counter()
+
+        cached = self.results_cache.get(key, generation)
+        if cached is not None:
+            result, filepaths_with_score = cached
+        else:
+            result, filepaths_with_score = self.search_plan(folder_index, plan, querry, k, offset, stats)
+            result.folder_index = folder_index
+            size = result.postings.get_size() + self.RANKING_ITEM_SIZE * len(filepaths_with_score)
+            self.results_cache.put(key, (result, filepaths_with_score), size, generation)
+
+        if stats is not None:
+            stats.add_time('tokenize', tokenized - start)
+            stats.add_time('parse', parsed - tokenized)
+            stats.add_time('plan', planned - parsed)
+            stats.count('results_cache_hits', int(cached is not None))
+            stats.count('result_files', len(result.postings))
+            result = result.with_stats(stats)
+        return result, filepaths_with_score, stats
+
+    @staticmethod
+    def get_ranking_words(folder_index, querry: str) -> tuple[tuple[str, int], ...]:
+        """:return: ((слово, сколько раз оно в запросе), ...) - то, от чего кроме плана зависит ранжирование"""
+        tf_idf_index = folder_index.tf_idf_index
+        # "a & b" и "b & a" дают один план, но ранжирование учитывает повторы слов в запросе.
+        # слова, которых нет в индексе (в том числе скобки), на ранжирование не влияют
+        words = collections.Counter(word for word in tf_idf_index.get_words_list(querry)
+                                    if tf_idf_index.get_df(word) > 0)
+        return tuple(sorted(words.items()))
+
+    def get_index(self):
+        """индекс для одного запроса: у SegmentedIndex - снимок, который не меняется, пока запрос выполняется"""
+        if isinstance(self.folder_index, SegmentedIndex):
+            return self.folder_index.snapshot()
+        return self.folder_index
+
+    def search_plan(self, folder_index, plan: PlanNode, querry: str, k: typing.Optional[int], offset: int,
+                    stats: Stats = None) -> tuple[SearchResult, list[tuple[str, float]]]:
+        """:param folder_index: индекс из get_index"""
+        start = time.perf_counter()
+        # шардированный индекс сам рассылает план по шардам и сливает ранжирование
+        if isinstance(folder_index, ShardedIndex):
+            result, filepaths_with_score = folder_index.search(plan, querry, self.scorer, k, offset)
+            if stats is not None:
+                # поиск и ранжирование в шардах не разделяются
+                stats.add_time('search', time.perf_counter() - start)
+            return result, filepaths_with_score
+        result = ExpressionSearcher(folder_index, self.postings_cache, stats).search(plan)
+        searched = time.perf_counter()
+        filepaths_with_score = self.scorer.rank(folder_index, querry, result, k, offset)
+        if stats is not None:
+            stats.add_time('search', searched - start)
+            stats.add_time('rank', time.perf_counter() - searched)
+            stats.count('ranked_files', len(result.postings))
+        return result, filepaths_with_score
+
+    def get_cache_stats(self) -> dict[str, dict[str, int]]:
+        """:return: счетчики кеша результатов запросов и кеша вхождений слов"""
+        return {'results': self.results_cache.get_stats(), 'postings': self.postings_cache.get_stats()}
+
+    def explain(self, querry) -> str:
+        """:return: план запроса с оценками количества файлов на каждом узле"""
+        querry = querry.casefold()
         expr = logic_tree.LogicTreeParser(querry).parse()
-        result = ExpressionSearcher(self.folder_index).search_by_or_tree(expr)
-        filepaths_with_score = self.folder_index.tf_idf_index.get_odered_filepaths_with_tf_idf(querry, result)
-        self.show_results(result, filepaths_with_score)
-        return result
+        return QueryPlanner(self.get_index(), self.max_expansions).plan(expr).explain()
 
     def show_results(self, search_result: SearchResult, filepaths_with_score):
         for filepath, score in filepaths_with_score:
             print(self.format_filepath(filepath, score))
             entries = search_result[filepath]
-            for entry in entries:
-                print(self.make_snippet(filepath, entry))
+            for entry in itertools.islice(entries, self.snippets_per_file):
+                print(self.make_snippet(filepath, entry, folder_index=search_result.folder_index))
+            if len(entries) > self.snippets_per_file:
+                print(f'{colorama.Fore.LIGHTBLACK_EX}      ... и еще {len(entries) - self.snippets_per_file} '
+                      f'вхождений{colorama.Fore.RESET}')
             print()
 
-    def format_filepath(self, filepath, tf_idf):
+    def format_filepath(self, filepath, score):
         # подсвечиваем имя файла
         result = re.sub(r'([^/]+?)\.txt', rf'{colorama.Fore.CYAN}\1{colorama.Fore.RESET}.txt', filepath)
 
-        # добавляем тф идф
+        # добавляем оценку
         result += colorama.Style.BRIGHT
         result += colorama.Fore.LIGHTBLACK_EX
-        result += f'  (TF-IDF: {round(tf_idf, 3)})'
+        result += f'  ({self.scorer.NAME}: {round(score, 3)})'
         result += colorama.Fore.RESET
         result += colorama.Style.RESET_ALL
         return result
 
-    def make_snippet(self, filepath, entry: WordEntry, radius=40):
-        with open(filepath, encoding=self.folder_index.encodings[filepath]) as f:
-            text = f.read()
-
-        left_ellipsis = True
-        left_border = entry.offset - radius
-        if left_border <= 0:
-            left_ellipsis = False
-            left_border = 0
-
-        right_ellipsis = True
-        right_border = entry.offset + entry.length + radius
-        if right_border >= len(text):
-            right_ellipsis = False
-            right_border = len(text)
-
-        # ищем конец прошлой строки
-        for i in range(entry.offset - 1, left_border - 1, -1):
-            if text[i] == '\n':
-                left_border = i + 1
-                left_ellipsis = False
-                break
-
-        # ищем конец этой строки
-        for i in range(entry.offset + entry.length, right_border):
-            if text[i] == '\n':
-                right_border = i
-                right_ellipsis = False
-                break
-
+    def make_snippet(self, filepath, entry: WordEntry, radius=40, folder_index=None):
+        before, word, after = self.cut_snippet(filepath, entry, radius, folder_index)
         snippet = ''
         snippet += colorama.Fore.LIGHTBLACK_EX
         snippet += str(entry.line).rjust(4, ' ') + '  '
         snippet += colorama.Fore.RESET
-        if left_ellipsis: snippet += '...'
-        snippet += text[left_border:entry.offset]
+        snippet += before
         # snippet += colorama.Fore.WHITE
         # snippet += colorama.Back.LIGHTGREEN_EX
         snippet += colorama.Fore.GREEN
-        snippet += text[entry.offset:entry.offset + entry.length]
+        snippet += word
         # snippet += colorama.Back.RESET
         snippet += colorama.Fore.RESET
-        snippet += text[entry.offset + entry.length:right_border]
-        if right_ellipsis: snippet += '...'
-
+        snippet += after
         return snippet
 
+    def cut_snippet(self, filepath, entry: WordEntry, radius=40, folder_index=None) -> tuple[str, str, str]:
+        """
+        :param folder_index: индекс, по которому найдено вхождение (SearchResult.folder_index),
+                             None - текущий (у SegmentedIndex снимок мог измениться после поиска)
+        :return: (текст строки перед вхождением, вхождение, текст после), обрезанные до radius символов с '...'
+        """
+        if folder_index is None:
+            folder_index = self.get_index()
+        # файл читается один раз и дальше берется из кеша
+        text = self.file_texts.get(filepath, folder_index.encodings[filepath])
+        line_start, line_end = self.get_line_bounds(folder_index, filepath, entry, text)
+
+        left_ellipsis = True
+        left_border = entry.offset - radius
+        if left_border <= line_start:
+            left_ellipsis = False
+            left_border = line_start
+
+        right_ellipsis = True
+        right_border = entry.offset + entry.length + radius
+        if right_border >= line_end:
+            right_ellipsis = False
+            right_border = line_end
+
+        before = ('...' if left_ellipsis else '') + text[left_border:entry.offset]
+        after = text[entry.offset + entry.length:right_border] + ('...' if right_ellipsis else '')
+        return before, text[entry.offset:entry.offset + entry.length], after
+
+    @staticmethod
+    def get_line_bounds(folder_index, filepath, entry: WordEntry, text: str) -> tuple[int, int]:
+        """:return: смещения начала и конца (без перевода строки) строки, в которой находится вхождение"""
+        line_starts = folder_index.line_starts.get(filepath)
+        if line_starts is None:
+            # индекс сохранен до того, как начал хранить начала строк
+            line_start = text.rfind('\n', 0, entry.offset) + 1
+            line_end = text.find('\n', entry.offset + entry.length)
+            return line_start, line_end if line_end != -1 else len(text)
+
+        line_start = line_starts[entry.line - 1]
+        line_end = line_starts[entry.line] if entry.line < len(line_starts) else len(text)
+        if line_end > line_start and text[line_end - 1:line_end] == '\n':
+            line_end -= 1
+        return line_start, line_end
+
 
 def main():
     foogle = Foogle('tests/files/wiki_test')
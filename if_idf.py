@@ -1,34 +1,80 @@
+import functools
 import math
 import re
 
 import settings
+from analyzer import Analyzer
 
 
 class TfIdfIndex:
-    def __init__(self):
+    def __init__(self, analyzer: Analyzer = None):
         """
         хранит:
+        - analyzer: Analyzer                            - нормализация слов индекса, ей же get_words_list
+                                                          нормализует слова запроса
         - files_count                                   - общее количество файлов в индексе
         - word_count_in_file: {filepath: {word: count}} - количество вхождений слова в файл 
         - filepaths_by_word: {word: {filepaths}}        - множество файлов с данным словом 
+        - idf_by_word: {word: idf}                      - считается для всех слов сразу после построения
+                                                          или обновления индекса, None - устарел
         """
+        self.analyzer = analyzer if analyzer is not None else Analyzer()
         self.filepaths = set()
         self.word_count_in_file = {}
         self.filepaths_by_word = {}
+        self.idf_by_word = None
 
-    def add(self, word, filepath):
+    def add(self, word, filepath, count: int = 1):
+        self.idf_by_word = None
         self.filepaths.add(filepath)
 
         if filepath not in self.word_count_in_file:
             self.word_count_in_file[filepath] = {}
         if word not in self.word_count_in_file[filepath]:
             self.word_count_in_file[filepath][word] = 0
-        self.word_count_in_file[filepath][word] += 1
+        self.word_count_in_file[filepath][word] += count
 
         if word not in self.filepaths_by_word:
             self.filepaths_by_word[word] = set()
         self.filepaths_by_word[word].add(filepath)
 
+    def add_file(self, filepath, count_by_word: dict[str, int]):
+        """добавляет файл, которого еще нет в индексе, со всеми его словами: то же, что add каждого слова"""
+        if len(count_by_word) == 0: return
+        self.idf_by_word = None
+        self.filepaths.add(filepath)
+        self.word_count_in_file[filepath] = count_by_word
+        for word in count_by_word:
+            if word not in self.filepaths_by_word:
+                self.filepaths_by_word[word] = set()
+            self.filepaths_by_word[word].add(filepath)
+
+    def merge(self, other: 'TfIdfIndex'):
+        """вливает в этот индекс другой, построенный по другому набору файлов"""
+        self.idf_by_word = None
+        self.filepaths |= other.filepaths
+        self.word_count_in_file.update(other.word_count_in_file)
+        for word, filepaths in other.filepaths_by_word.items():
+            if word not in self.filepaths_by_word:
+                self.filepaths_by_word[word] = set()
+            self.filepaths_by_word[word] |= filepaths
+
+    def remove_file(self, filepath):
+        self.idf_by_word = None
+        counts = self.word_count_in_file.pop(filepath, {})
+        for word in counts:
+            self.filepaths_by_word[word].discard(filepath)
+            if len(self.filepaths_by_word[word]) == 0:
+                del self.filepaths_by_word[word]
+        self.filepaths.discard(filepath)
+
+    def compute_idf(self):
+        n = self.get_files_count()
+        self.idf_by_word = {word: math.log(n / len(filepaths)) for word, filepaths in self.filepaths_by_word.items()}
+
+    def get_words_in_file(self, filepath) -> list[str]:
+        return list(self.word_count_in_file.get(filepath, {}))
+
     def get_odered_filepaths_with_tf_idf(self, querry: str, search_result) -> list[tuple[str, float]]:
         """
         :param querry:
@@ -53,20 +99,93 @@ class TfIdfIndex:
         return score
 
     def get_tf_idf_by_word(self, word: str, filepath: str) -> float:
-        if word not in self.filepaths_by_word:
+        if self.get_df(word) == 0:
             # слова нет в нашем индексе
             return 0
+        return self.get_count(word, filepath) * self.get_idf(word)
+
+    def get_idf(self, word: str) -> float:
+        if self.idf_by_word is None:
+            self.compute_idf()
+        return self.idf_by_word.get(word, 0)
 
+    def get_count(self, word: str, filepath: str) -> int:
         if filepath in self.word_count_in_file and word in self.word_count_in_file[filepath]:
-            tf = self.word_count_in_file[filepath][word]
-        else:
-            tf = 0
-        n = len(self.filepaths)
-        df = len(self.filepaths_by_word[word])
-        score = tf * math.log(n / df)
-        return score
+            return self.word_count_in_file[filepath][word]
+        return 0
+
+    def get_df(self, word: str) -> int:
+        if word not in self.filepaths_by_word:
+            return 0
+        return len(self.filepaths_by_word[word])
+
+    def get_files_count(self) -> int:
+        return len(self.filepaths)
 
     def get_words_list(self, querry: str):
         words = re.findall(settings.WORD_REGEX, querry)
-        words = [w for w in words if w not in settings.LOGIC_TERMS]
-        return words
+        # кавычки фраз отрезаются от слов, операторы NEAR/k и шаблоны отбрасываются,
+        # слова нормализуются так же, как при индексации
+        words = [w.strip(settings.PHRASE_QUOTE) for w in words
+                 if w not in settings.LOGIC_TERMS and re.fullmatch(settings.NEAR_REGEX, w) is None]
+        words = [self.analyzer.normalize(w) for w in words if w and settings.WILDCARD not in w]
+        return [w for w in words if w]
+
+
+class MappedTfIdfIndex(TfIdfIndex):
+    """
+    TfIdfIndex поверх файла индекса (index_storage.IndexFileReader):
+    tf и df берутся из блоков вхождений слова, которые читаются только для слов из запроса
+    """
+    COUNTS_CACHE_SIZE = 1024
+
+    def __init__(self, reader, doc_path):
+        """
+        :param reader: index_storage.IndexFileReader
+        :param doc_path: функция doc_id -> путь к файлу
+        """
+        super().__init__(Analyzer.from_config(reader.analyzer_config))
+        self.reader = reader
+        self.doc_path = doc_path
+        self.get_counts_by_word = functools.lru_cache(maxsize=self.COUNTS_CACHE_SIZE)(self.read_counts_by_word)
+        self.get_idf = functools.lru_cache(maxsize=self.COUNTS_CACHE_SIZE)(self.read_idf)
+
+    def add(self, word, filepath, count: int = 1):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def merge(self, other: 'TfIdfIndex'):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def remove_file(self, filepath):
+        raise TypeError('индекс, загруженный из файла, доступен только для чтения')
+
+    def read_counts_by_word(self, word: str):
+        """:return: {файл: количество вхождений слова} или None, если слова нет в индексе"""
+        term_id = self.reader.find_term(word)
+        if term_id is None:
+            return None
+        doc_ids, counts = self.reader.read_counts(term_id)
+        return {self.doc_path(doc_id): count for doc_id, count in zip(doc_ids, counts)}
+
+    def read_idf(self, word: str) -> float:
+        df = self.get_df(word)
+        if df == 0:
+            return 0
+        return math.log(self.get_files_count() / df)
+
+    def compute_idf(self):
+        # idf считается по df из словаря индекса при первом обращении к слову
+        pass
+
+    def get_count(self, word: str, filepath: str) -> int:
+        counts_by_file = self.get_counts_by_word(word)
+        if counts_by_file is None:
+            return 0
+        return counts_by_file.get(filepath, 0)
+
+    def get_df(self, word: str) -> int:
+        term_id = self.reader.find_term(word)
+        return self.reader.df(term_id) if term_id is not None else 0
+
+    def get_files_count(self) -> int:
+        return self.reader.files_with_words_count
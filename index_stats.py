@@ -0,0 +1,248 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+import typing
+from array import array
+
+from analyzer import Analyzer
+from folder_index import FolderIndex, FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
+from index_storage import HEADER, DOC_ENTRY, TERM_ENTRY, UINT32, FLAG_ZLIB
+
+
+class MemoryCounter:
+    """
+    глубокий sys.getsizeof: объект считается вместе со всем, на что он ссылается.
+    объект, на который ссылаются несколько структур (слово - ключ word_entires и filepaths_by_word, путь - элемент
+    filepaths и ключ doc_ids), считается один раз - в первой структуре, так что у остальных остается только
+    их собственная цена: таблицы словарей, множества, ссылки
+    """
+    # объекты этих типов ни на что не ссылаются
+    LEAF_TYPES = (str, bytes, int, float, bool, type(None), array)
+
+    def __init__(self):
+        self.seen: set[int] = set()
+
+    def size(self, obj) -> int:
+        """:return: байт, занятых obj и еще не посчитанными объектами, на которые он ссылается"""
+        total = 0
+        stack = [obj]
+        while len(stack) > 0:
+            obj = stack.pop()
+            if id(obj) in self.seen:
+                continue
+            self.seen.add(id(obj))
+            total += sys.getsizeof(obj)
+            if isinstance(obj, self.LEAF_TYPES):
+                continue
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            else:
+                if hasattr(obj, '__dict__'):
+                    stack.append(obj.__dict__)
+                for cls in type(obj).__mro__:
+                    for name in getattr(cls, '__slots__', ()):
+                        if hasattr(obj, name):
+                            stack.append(getattr(obj, name))
+        return total
+
+
+class IndexStats:
+    """
+    статистика индекса для оценки емкости: количества документов, слов и вхождений, самые частые слова
+    (по числу файлов и по числу вхождений - так видно служебные слова, которые раздувают индекс) и разбивка байт
+    по внутренним структурам в памяти (memory) и по разделам файла индекса (disk).
+    для индекса в памяти disk - то, что запишет FolderIndexSaveloader.save без сжатия,
+    для открытого файла индекса - разделы самого файла, а memory - None (все лежит на диске)
+    """
+
+    def __init__(self, docs_count: int, terms_count: int, postings_count: int, entries_count: int,
+                 top_by_df: list[tuple[str, int]], top_by_count: list[tuple[str, int]],
+                 memory: typing.Optional[dict[str, int]], disk: dict[str, int]):
+        """
+        :param postings_count: пар (слово, файл), то есть сумма df всех слов
+        :param entries_count: вхождений слов во все файлы
+        :param top_by_df: [(слово, в скольких файлах оно есть), ...] по убыванию
+        :param top_by_count: [(слово, сколько раз оно встречается), ...] по убыванию
+        :param memory: {структура: байт}
+        :param disk: {раздел файла индекса: байт}
+        """
+        self.docs_count = docs_count
+        self.terms_count = terms_count
+        self.postings_count = postings_count
+        self.entries_count = entries_count
+        self.top_by_df = top_by_df
+        self.top_by_count = top_by_count
+        self.memory = memory
+        self.disk = disk
+
+    @classmethod
+    def of(cls, folder_index: FolderIndex, top: int = 10) -> 'IndexStats':
+        if isinstance(folder_index, MappedFolderIndex):
+            return cls.of_mapped(folder_index, top)
+        df_by_word = {word: len(postings) for word, postings in folder_index.word_entires.items()}
+        # количества считаются по вхождениям, а не get_counts: та запоминает их в Postings и увеличила бы память
+        count_by_word = {word: sum(map(len, postings.entries)) for word, postings in folder_index.word_entires.items()}
+        return cls(folder_index.get_docs_count(), len(df_by_word), sum(df_by_word.values()),
+                   sum(count_by_word.values()), cls.get_top(df_by_word, top), cls.get_top(count_by_word, top),
+                   cls.get_memory_sizes(folder_index), cls.get_disk_sizes(folder_index))
+
+    @classmethod
+    def of_mapped(cls, folder_index: MappedFolderIndex, top: int = 10) -> 'IndexStats':
+        reader = folder_index.reader
+        term_entries = list(reader.iter_term_entries())
+        entry_size = 24 + (4 if reader.has_positions() else 0)
+        df_by_term_id = {term_id: df for term_id, (_, _, _, _, df) in enumerate(term_entries)}
+        count_by_term_id = {}
+        for term_id, (_, _, _, block_length, df) in enumerate(term_entries):
+            if reader.flags & FLAG_ZLIB:
+                count_by_term_id[term_id] = sum(reader.read_counts(term_id)[1])
+            else:
+                count_by_term_id[term_id] = (block_length - UINT32.size - 8 * df) // entry_size
+        return cls(reader.docs_count, reader.terms_count, sum(df_by_term_id.values()), sum(count_by_term_id.values()),
+                   [(reader.term(term_id), df) for term_id, df in cls.get_top(df_by_term_id, top)],
+                   [(reader.term(term_id), count) for term_id, count in cls.get_top(count_by_term_id, top)],
+                   None, reader.get_section_sizes())
+
+    @staticmethod
+    def get_top(values: dict, top: int) -> list[tuple[typing.Any, int]]:
+        """:return: top пар (ключ, значение) с наибольшими значениями по убыванию, при равных - по ключу"""
+        return heapq.nsmallest(top, values.items(), key=lambda item: (-item[1], item[0]))
+
+    @staticmethod
+    def get_memory_sizes(folder_index: FolderIndex) -> dict[str, int]:
+        """
+        :return: {структура: байт}. слова и пути считаются в первой структуре, где встречаются (word_entires.terms
+                 и filepaths), так что tf_idf_index.* - цена того, что TfIdfIndex заново раскладывает те же
+                 слова и файлы по своим словарям и множествам
+        """
+        counter = MemoryCounter()
+        word_entires = folder_index.word_entires
+        sizes = {'word_entires.terms': sys.getsizeof(word_entires) + sum(map(counter.size, word_entires))}
+        sizes['word_entires.postings'] = sizes['word_entires.entries'] = sizes['word_entires.positions'] = 0
+        for postings in word_entires.values():
+            sizes['word_entires.postings'] += (counter.size(postings.doc_ids) + counter.size(postings.bitmap)
+                                               + counter.size(postings.counts) + sys.getsizeof(postings)
+                                               + (sys.getsizeof(postings.entries) if postings.entries is not None
+                                                  else 0))
+            for entries in postings.entries or ():
+                sizes['word_entires.entries'] += sys.getsizeof(entries) + counter.size(entries.packed)
+                sizes['word_entires.positions'] += counter.size(entries.positions)
+        sizes['filepaths'] = counter.size(folder_index.filepaths)
+        sizes['doc_ids'] = counter.size(folder_index.doc_ids)
+        tf_idf_index = folder_index.tf_idf_index
+        for name in ('filepaths', 'word_count_in_file', 'filepaths_by_word', 'idf_by_word'):
+            sizes['tf_idf_index.' + name] = counter.size(getattr(tf_idf_index, name))
+        sizes['encodings'] = counter.size(folder_index.encodings)
+        sizes['file_stats'] = counter.size(folder_index.file_stats)
+        sizes['line_starts'] = counter.size(folder_index.line_starts)
+        sizes['doc_lengths'] = counter.size(folder_index.doc_lengths)
+        sizes['term_dictionary'] = counter.size(folder_index.term_dictionary.terms) \
+            if folder_index.term_dictionary is not None else 0
+        sizes['analyzer.memo'] = counter.size(folder_index.analyzer.memo)
+        return sizes
+
+    @staticmethod
+    def get_disk_sizes(folder_index: FolderIndex) -> dict[str, int]:
+        """:return: {раздел: байт} файла, который запишет FolderIndexSaveloader.save(..., compress=False)"""
+        analyzer_bytes = json.dumps(folder_index.analyzer.get_config(), sort_keys=True).encode('utf8')
+        sizes = {'header': HEADER.size + UINT32.size + len(analyzer_bytes), 'terms': 0,
+                 'blocks.doc_ids': 0, 'blocks.entries': 0, 'blocks.positions': 0}
+        positions = all(entries.positions is not None
+                        for postings in folder_index.word_entires.values() for entries in postings.entries)
+        for word, postings in folder_index.word_entires.items():
+            sizes['terms'] += len(word.encode('utf8'))
+            sizes['blocks.doc_ids'] += UINT32.size + 8 * len(postings)
+            total = sum(map(len, postings.entries))
+            sizes['blocks.entries'] += 24 * total
+            if positions:
+                sizes['blocks.positions'] += 4 * total
+        sizes['paths'] = sizes['line_starts'] = 0
+        for path in folder_index.doc_ids:
+            sizes['paths'] += len(path.encode('utf8')) + len((folder_index.encodings[path] or '').encode('utf8'))
+            line_starts = folder_index.line_starts.get(path)
+            if line_starts is not None:
+                sizes['line_starts'] += 8 * len(line_starts)
+        sizes['doc_table'] = DOC_ENTRY.size * len(folder_index.doc_ids)
+        sizes['term_table'] = TERM_ENTRY.size * len(folder_index.word_entires)
+        return sizes
+
+    def to_dict(self) -> dict:
+        return {
+            'docs_count': self.docs_count,
+            'terms_count': self.terms_count,
+            'postings_count': self.postings_count,
+            'entries_count': self.entries_count,
+            'top_by_df': self.top_by_df,
+            'top_by_count': self.top_by_count,
+            'memory': self.memory,
+            'disk': self.disk,
+        }
+
+    def format(self) -> str:
+        lines = [f'файлов: {self.docs_count}, слов: {self.terms_count}, '
+                 f'пар (слово, файл): {self.postings_count}, вхождений: {self.entries_count}']
+        lines.append('самые частые слова по числу файлов:')
+        for word, df in self.top_by_df:
+            share = df / self.docs_count * 100 if self.docs_count > 0 else 0
+            lines.append(f'  {word:<24} {df:>10} ({share:.1f}% файлов)')
+        lines.append('самые частые слова по числу вхождений:')
+        for word, count in self.top_by_count:
+            share = count / self.entries_count * 100 if self.entries_count > 0 else 0
+            lines.append(f'  {word:<24} {count:>10} ({share:.1f}% вхождений)')
+        for title, sizes in (('память', self.memory), ('диск', self.disk)):
+            if sizes is None: continue
+            total = sum(sizes.values())
+            lines.append(f'{title}: {self.format_size(total)}')
+            for name, size in sizes.items():
+                share = size / total * 100 if total > 0 else 0
+                lines.append(f'  {name:<32} {self.format_size(size):>10} ({share:.1f}%)')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def format_size(size: int) -> str:
+        for unit in ('Б', 'КБ', 'МБ'):
+            if size < 1024:
+                return f'{size:.0f} {unit}' if unit == 'Б' else f'{size:.1f} {unit}'
+            size /= 1024
+        return f'{size:.1f} ГБ'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='статистика индекса Foogle: размеры структур в памяти и на диске')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--index', help='файл индекса')
+    source.add_argument('--folder', help='папка, которую проиндексировать')
+    parser.add_argument('--top', type=int, default=10, help='сколько самых частых слов показать')
+    parser.add_argument('--memory', action='store_true',
+                        help='для --index: прочитать индекс в память и посчитать и ее')
+    parser.add_argument('--json', action='store_true', help='вывести статистику в JSON')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--analyzer', choices=Analyzer.PRESETS, default='raw', help='нормализация слов для --folder')
+    args = parser.parse_args()
+
+    if args.index is not None:
+        if os.path.isdir(args.index):
+            parser.error('статистика считается только по одному файлу индекса, не по папке шардов или сегментов')
+        index = FolderIndexSaveloader.load(args.index)
+        if isinstance(index, MappedFolderIndex):
+            stats = IndexStats.of(index, args.top)
+            if args.memory:
+                stats.memory = IndexStats.get_memory_sizes(index.to_folder_index())
+            index.close()
+        else:
+            # индекс в pickle загружается в память целиком
+            stats = IndexStats.of(index, args.top)
+    else:
+        index = FolderIndexer(args.workers, analyzer=Analyzer.of(args.analyzer)).index_folder(args.folder)
+        stats = IndexStats.of(index, args.top)
+
+    print(json.dumps(stats.to_dict(), ensure_ascii=False, indent=2) if args.json else stats.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import json
+import mmap
+import struct
+import typing
+import zlib
+from array import array
+
+# формат файла индекса (все числа little-endian):
+#   заголовок  HEADER
+#   анализатор uint32 длина, за ней шаги analyzer.Analyzer (get_config) в JSON utf-8 (только с версии 6)
+#   блоки      для каждого слова: слово в utf-8, сразу за ним блок вхождений
+#   строки     пути и кодировки файлов в utf-8, за каждым - int64 * k начала строк файла
+#   таблица файлов DOC_ENTRY по doc_id (в версии 1 - DOC_ENTRY_V1, без размера, mtime и хеша,
+#                                       в версии 2 - DOC_ENTRY_V2, без начал строк,
+#                                       в версии 3 - DOC_ENTRY_V3, без длины файла в словах)
+#   словарь    TERM_ENTRY, отсортированный по слову (в байтах utf-8), чтобы искать бинпоиском
+#
+# блок вхождений слова (целиком жмется zlib, если выставлен FLAG_ZLIB):
+#   uint32 n - в скольких файлах есть слово
+#   uint32 * n - doc_id файлов по возрастанию
+#   uint32 * n - количество вхождений в каждый файл
+#   int64 * 3 * (сумма количеств) - тройки (offset, line, length) подряд по файлам
+#   uint32 * (сумма количеств) - номера слов в файлах, параллельно тройкам (только если выставлен FLAG_POSITIONS,
+#                                 его нет в версиях до 5)
+
+MAGIC = b'FOOGLEIX'
+FORMAT_VERSION = 6
+SUPPORTED_VERSIONS = {1, 2, 3, 4, 5, 6}
+FLAG_ZLIB = 1
+FLAG_POSITIONS = 2
+
+# magic, version, flags, docs_count, files_with_words_count, terms_count, docs_offset, terms_offset
+HEADER = struct.Struct('<8sIIIIIQQ')
+# path_offset, path_length, encoding_offset, encoding_length
+DOC_ENTRY_V1 = struct.Struct('<QIQI')
+# path_offset, path_length, encoding_offset, encoding_length, size (-1 если неизвестен), mtime_ns, content_hash
+DOC_ENTRY_V2 = struct.Struct('<QIQIqq16s')
+# ... то же, что в DOC_ENTRY_V2, line_starts_offset, line_starts_count (-1 если неизвестны)
+DOC_ENTRY_V3 = struct.Struct('<QIQIqq16sQq')
+# ... то же, что в DOC_ENTRY_V3, length - количество слов в файле
+DOC_ENTRY = struct.Struct('<QIQIqq16sQqI')
+# term_offset, term_length, block_offset, block_length, df
+TERM_ENTRY = struct.Struct('<QIQII')
+UINT32 = struct.Struct('<I')
+
+IS_BIG_ENDIAN = array('I', [1]).tobytes()[0] == 0
+
+
+def is_index_file(filepath: str) -> bool:
+    with open(filepath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class IndexFileWriter:
+    @classmethod
+    def write(cls, filepath: str,
+              docs: typing.Iterable[tuple[str, typing.Optional[str], typing.Optional[tuple[int, int, bytes]],
+                                          typing.Optional[array], int]],
+              files_with_words_count: int,
+              terms: typing.Iterable[tuple[str, list[tuple[int, array, typing.Optional[array]]]]],
+              compress: bool = False, positions: bool = True, analyzer_config: dict[str, bool] = None):
+        """
+        :param docs: [(путь, кодировка, (размер, mtime_ns, хеш) или None, начала строк или None,
+                       количество слов), ...], индекс в списке - doc_id
+        :param files_with_words_count: количество файлов, в которых есть хотя бы одно слово
+        :param terms: [(слово, [(doc_id, упакованные тройки вхождений, номера слов вхождений), ...]), ...]
+                      в порядке возрастания слов
+        :param compress: сжимать блоки вхождений zlib
+        :param positions: сохранять номера слов (если False, в terms вместо них может быть None)
+        :param analyzer_config: шаги анализатора, которым построен индекс (None - без шагов)
+        """
+        blocks = ((term, len(postings), [cls.make_block(postings, positions)]) for term, postings in terms)
+        cls.write_blocks(filepath, docs, files_with_words_count, blocks, compress, positions, analyzer_config)
+
+    @classmethod
+    def write_blocks(cls, filepath: str,
+                     docs: typing.Iterable[tuple[str, typing.Optional[str], typing.Optional[tuple[int, int, bytes]],
+                                                 typing.Optional[array], int]],
+                     files_with_words_count: int,
+                     blocks: typing.Iterable[tuple[str, int, typing.Iterable[bytes]]],
+                     compress: bool = False, positions: bool = True, analyzer_config: dict[str, bool] = None):
+        """
+        то же, что write, но блоки вхождений уже собраны: [(слово, df, куски блока), ...] в порядке возрастания слов.
+        блок пишется по кускам, так что целиком в памяти он не нужен; docs тоже читаются по одному
+        """
+        with open(filepath, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            analyzer_bytes = json.dumps(analyzer_config or {}, sort_keys=True).encode('utf8')
+            f.write(UINT32.pack(len(analyzer_bytes)))
+            f.write(analyzer_bytes)
+
+            term_entries = bytearray()
+            terms_count = 0
+            for term, df, chunks in blocks:
+                term_bytes = term.encode('utf8')
+                term_offset = f.tell()
+                f.write(term_bytes)
+                block_offset = f.tell()
+                compressor = zlib.compressobj() if compress else None
+                for chunk in chunks:
+                    f.write(compressor.compress(chunk) if compressor is not None else chunk)
+                if compressor is not None:
+                    f.write(compressor.flush())
+                term_entries += TERM_ENTRY.pack(term_offset, len(term_bytes), block_offset, f.tell() - block_offset,
+                                                df)
+                terms_count += 1
+
+            doc_entries = bytearray()
+            docs_count = 0
+            for path, encoding, stat, line_starts, length in docs:
+                path_bytes = path.encode('utf8')
+                encoding_bytes = (encoding or '').encode('utf8')
+                path_offset = f.tell()
+                f.write(path_bytes)
+                encoding_offset = f.tell()
+                f.write(encoding_bytes)
+                line_starts_offset = f.tell()
+                if line_starts is not None:
+                    f.write(cls.to_le_bytes(line_starts))
+                size, mtime, content_hash = stat if stat is not None else (-1, 0, b'')
+                doc_entries += DOC_ENTRY.pack(path_offset, len(path_bytes), encoding_offset, len(encoding_bytes),
+                                              size, mtime, content_hash, line_starts_offset,
+                                              len(line_starts) if line_starts is not None else -1, length)
+                docs_count += 1
+
+            docs_offset = f.tell()
+            f.write(doc_entries)
+            terms_offset = f.tell()
+            f.write(term_entries)
+
+            f.seek(0)
+            flags = (FLAG_ZLIB if compress else 0) | (FLAG_POSITIONS if positions else 0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags,
+                                docs_count, files_with_words_count, terms_count, docs_offset, terms_offset))
+
+    @classmethod
+    def make_block(cls, postings: list[tuple[int, array, typing.Optional[array]]], positions: bool = True) -> bytes:
+        doc_ids = array('I', (doc_id for doc_id, _, _ in postings))
+        counts = array('I', (len(packed) // 3 for _, packed, _ in postings))
+        parts = [UINT32.pack(len(postings)), cls.to_le_bytes(doc_ids), cls.to_le_bytes(counts)]
+        parts.extend(cls.to_le_bytes(packed) for _, packed, _ in postings)
+        if positions:
+            parts.extend(cls.to_le_bytes(doc_positions) for _, _, doc_positions in postings)
+        return b''.join(parts)
+
+    @staticmethod
+    def to_le_bytes(arr: array) -> bytes:
+        if IS_BIG_ENDIAN:
+            arr = array(arr.typecode, arr)
+            arr.byteswap()
+        return arr.tobytes()
+
+
+class IndexFileReader:
+    """
+    читает файл индекса через mmap. при открытии читается только заголовок,
+    слова ищутся бинпоиском по словарю, блоки вхождений декодируются только по запросу
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.file = open(filepath, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.flags, self.docs_count, self.files_with_words_count, self.terms_count,
+         self.docs_offset, self.terms_offset) = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{filepath} не является файлом индекса')
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f'версия формата {filepath} - {version}, поддерживаются только {SUPPORTED_VERSIONS}')
+        self.version = version
+        self.doc_entry = {1: DOC_ENTRY_V1, 2: DOC_ENTRY_V2, 3: DOC_ENTRY_V3, 4: DOC_ENTRY, 5: DOC_ENTRY,
+                          6: DOC_ENTRY}[version]
+        # шаги анализатора, которым построен индекс (до версии 6 индексы строились без анализатора)
+        self.analyzer_config: dict[str, bool] = {}
+        if version >= 6:
+            analyzer_length = UINT32.unpack_from(self.mmap, HEADER.size)[0]
+            analyzer_offset = HEADER.size + UINT32.size
+            self.analyzer_config = json.loads(self.mmap[analyzer_offset:analyzer_offset + analyzer_length])
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def read_doc_entry(self, doc_id: int) -> tuple:
+        return self.doc_entry.unpack_from(self.mmap, self.docs_offset + doc_id * self.doc_entry.size)
+
+    def doc_path(self, doc_id: int) -> str:
+        path_offset, path_length = self.read_doc_entry(doc_id)[:2]
+        return self.mmap[path_offset:path_offset + path_length].decode('utf8')
+
+    def doc_encoding(self, doc_id: int) -> typing.Optional[str]:
+        encoding_offset, encoding_length = self.read_doc_entry(doc_id)[2:4]
+        encoding = self.mmap[encoding_offset:encoding_offset + encoding_length].decode('utf8')
+        return encoding if encoding else None
+
+    def doc_stat(self, doc_id: int) -> typing.Optional[tuple[int, int, bytes]]:
+        """:return: (размер, mtime_ns, хеш содержимого) или None, если они не сохранены"""
+        if self.version == 1:
+            return None
+        size, mtime, content_hash = self.read_doc_entry(doc_id)[4:7]
+        if size < 0:
+            return None
+        return size, mtime, content_hash
+
+    def doc_line_starts(self, doc_id: int) -> typing.Optional[array]:
+        """:return: смещения начал строк файла или None, если они не сохранены"""
+        if self.version < 3:
+            return None
+        line_starts_offset, line_starts_count = self.read_doc_entry(doc_id)[7:9]
+        if line_starts_count < 0:
+            return None
+        return self.from_le_bytes('q', self.mmap[line_starts_offset:line_starts_offset + 8 * line_starts_count])
+
+    def doc_lengths(self) -> typing.Optional[array]:
+        """:return: количество слов в каждом файле по doc_id или None, если они не сохранены"""
+        if self.version < 4:
+            return None
+        entries = self.mmap[self.docs_offset:self.docs_offset + self.docs_count * DOC_ENTRY.size]
+        return array('I', (entry[9] for entry in DOC_ENTRY.iter_unpack(entries)))
+
+    def iter_term_entries(self) -> typing.Iterator[tuple[int, int, int, int, int]]:
+        """:return: TERM_ENTRY всех слов по term_id: (term_offset, term_length, block_offset, block_length, df)"""
+        terms_end = self.terms_offset + self.terms_count * TERM_ENTRY.size
+        return TERM_ENTRY.iter_unpack(self.mmap[self.terms_offset:terms_end])
+
+    def get_section_sizes(self) -> dict[str, int]:
+        """
+        :return: {раздел: байт} файла индекса. блоки несжатого индекса разбиты на doc_id с количествами,
+                 тройки вхождений и номера слов, сжатые zlib - одним разделом blocks
+        """
+        sizes = {'header': HEADER.size, 'terms': 0}
+        if self.version >= 6:
+            sizes['header'] += UINT32.size + UINT32.unpack_from(self.mmap, HEADER.size)[0]
+        if self.flags & FLAG_ZLIB:
+            sizes['blocks'] = 0
+        else:
+            sizes.update({'blocks.doc_ids': 0, 'blocks.entries': 0, 'blocks.positions': 0})
+        entry_size = 24 + (4 if self.has_positions() else 0)
+        for _, term_length, _, block_length, df in self.iter_term_entries():
+            sizes['terms'] += term_length
+            if self.flags & FLAG_ZLIB:
+                sizes['blocks'] += block_length
+                continue
+            total = (block_length - UINT32.size - 8 * df) // entry_size
+            sizes['blocks.doc_ids'] += UINT32.size + 8 * df
+            sizes['blocks.entries'] += 24 * total
+            if self.has_positions():
+                sizes['blocks.positions'] += 4 * total
+        sizes['paths'] = 0
+        sizes['line_starts'] = 0
+        docs = self.mmap[self.docs_offset:self.docs_offset + self.docs_count * self.doc_entry.size]
+        for doc_entry in self.doc_entry.iter_unpack(docs):
+            sizes['paths'] += doc_entry[1] + doc_entry[3]
+            if self.version >= 3 and doc_entry[8] > 0:
+                sizes['line_starts'] += 8 * doc_entry[8]
+        sizes['doc_table'] = len(docs)
+        sizes['term_table'] = self.terms_count * TERM_ENTRY.size
+        return sizes
+
+    def term(self, term_id: int) -> str:
+        return self.term_bytes(term_id).decode('utf8')
+
+    def term_bytes(self, term_id: int) -> bytes:
+        term_offset, term_length, _, _, _ = TERM_ENTRY.unpack_from(self.mmap,
+                                                                   self.terms_offset + term_id * TERM_ENTRY.size)
+        return self.mmap[term_offset:term_offset + term_length]
+
+    def df(self, term_id: int) -> int:
+        return TERM_ENTRY.unpack_from(self.mmap, self.terms_offset + term_id * TERM_ENTRY.size)[4]
+
+    def find_term(self, term: str) -> typing.Optional[int]:
+        """бинпоиск слова в словаре, возвращает term_id или None"""
+        term_bytes = term.encode('utf8')
+        term_id = self.bisect_term(term_bytes)
+        if term_id < self.terms_count and self.term_bytes(term_id) == term_bytes:
+            return term_id
+        return None
+
+    def bisect_term(self, term_bytes: bytes) -> int:
+        """:return: первый term_id, слово которого не меньше term_bytes (порядок байт utf-8 совпадает с порядком str)"""
+        lo, hi = 0, self.terms_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_bytes(mid) < term_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def has_positions(self) -> bool:
+        return bool(self.flags & FLAG_POSITIONS)
+
+    def read_block(self, term_id: int) -> tuple[array, array, array, typing.Optional[array]]:
+        """
+        :return: (doc_ids, количества вхождений, упакованные тройки вхождений всех файлов подряд,
+                  номера слов вхождений всех файлов подряд или None, если индекс сохранен без них)
+        """
+        block = self.read_block_bytes(term_id)
+
+        n = UINT32.unpack_from(block, 0)[0]
+        cursor = UINT32.size
+        doc_ids = self.from_le_bytes('I', block[cursor:cursor + 4 * n])
+        cursor += 4 * n
+        counts = self.from_le_bytes('I', block[cursor:cursor + 4 * n])
+        cursor += 4 * n
+        if not self.has_positions():
+            return doc_ids, counts, self.from_le_bytes('q', block[cursor:]), None
+        total = sum(counts)
+        packed = self.from_le_bytes('q', block[cursor:cursor + 24 * total])
+        cursor += 24 * total
+        positions = self.from_le_bytes('I', block[cursor:cursor + 4 * total])
+        return doc_ids, counts, packed, positions
+
+    def read_counts(self, term_id: int) -> tuple[array, array]:
+        """:return: (doc_ids, количества вхождений) без чтения самих вхождений"""
+        n = self.df(term_id)
+        block = self.read_block_bytes(term_id, UINT32.size + 8 * n)
+        cursor = UINT32.size
+        doc_ids = self.from_le_bytes('I', block[cursor:cursor + 4 * n])
+        cursor += 4 * n
+        counts = self.from_le_bytes('I', block[cursor:cursor + 4 * n])
+        return doc_ids, counts
+
+    def read_block_bytes(self, term_id: int, max_length: int = None) -> bytes:
+        """:param max_length: сколько байт начала блока нужно, None - весь блок"""
+        _, _, block_offset, block_length, _ = TERM_ENTRY.unpack_from(self.mmap,
+                                                                     self.terms_offset + term_id * TERM_ENTRY.size)
+        if max_length is not None and not self.flags & FLAG_ZLIB:
+            block_length = min(block_length, max_length)
+        block = self.mmap[block_offset:block_offset + block_length]
+        if self.flags & FLAG_ZLIB:
+            if max_length is None:
+                return zlib.decompress(block)
+            return zlib.decompressobj().decompress(block, max_length)
+        return block
+
+    @staticmethod
+    def from_le_bytes(typecode: str, data: bytes) -> array:
+        arr = array(typecode)
+        arr.frombytes(data)
+        if IS_BIG_ENDIAN:
+            arr.byteswap()
+        return arr
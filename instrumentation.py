@@ -0,0 +1,79 @@
+import time
+import typing
+
+
+class Stats:
+    """
+    время по фазам (в секундах) и счетчики одного поиска, одного файла или всей индексации
+    - label:    запрос, путь к файлу или None
+    - times:    {фаза: секунды}
+    - counters: {счетчик: значение}
+    """
+    __slots__ = ('label', 'times', 'counters')
+
+    def __init__(self, label: str = None):
+        self.label = label
+        self.times: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+
+    def add_time(self, phase: str, seconds: float):
+        self.times[phase] = self.times.get(phase, 0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: 'Stats'):
+        for phase, seconds in other.times.items():
+            self.add_time(phase, seconds)
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def to_dict(self) -> dict[str, dict]:
+        return {'label': self.label,
+                'times_ms': {phase: round(seconds * 1000, 4) for phase, seconds in self.times.items()},
+                'counters': dict(self.counters)}
+
+    def __repr__(self):
+        return f'Stats({self.to_dict()})'
+
+
+class Instrumentation:
+    """
+    включает сбор Stats там, куда передана (Foogle, FolderIndexer), и отдает их хукам - функциям (событие, Stats):
+    - 'search' - после каждого поиска (Stats поиска также лежат в SearchResult.stats)
+    - 'file'   - после индексации каждого файла
+    - 'index'  - после индексации всех файлов (суммы по файлам)
+    без Instrumentation статистика не собирается: вместо Stats передается None, и код только
+    проверяет это и берет несколько отметок времени на запрос
+    """
+
+    def __init__(self, hooks: typing.Iterable[typing.Callable[[str, Stats], None]] = ()):
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook: typing.Callable[[str, Stats], None]):
+        self.hooks.append(hook)
+
+    def emit(self, event: str, stats: Stats):
+        for hook in self.hooks:
+            hook(event, stats)
+
+
+class StatsCollector:
+    """хук, который копит Stats по событиям: collector.stats['search'] - список Stats всех поисков"""
+
+    def __init__(self):
+        self.stats: dict[str, list[Stats]] = {}
+
+    def __call__(self, event: str, stats: Stats):
+        self.stats.setdefault(event, []).append(stats)
+
+    def get_total(self, event: str) -> Stats:
+        total = Stats()
+        for stats in self.stats.get(event, []):
+            total.merge(stats)
+        return total
+
+
+def log_hook(event: str, stats: Stats):
+    """хук, который печатает каждое событие"""
+    print(f'[{time.strftime("%H:%M:%S")}] {event}: {stats.to_dict()}')
@@ -1,3 +1,5 @@
+import typing
+
 import settings
 import tokenization
 
@@ -18,6 +20,35 @@ class WordAtom(Atom):
         return f'{self.value}'
 
 
+class WildcardAtom(Atom):
+    """слово с settings.WILDCARD, раскрывается в OR подходящих слов индекса"""
+
+    def __init__(self, pattern: str):
+        super().__init__(pattern)
+
+
+class PhraseAtom(Atom):
+    def __init__(self, words: list[str]):
+        super().__init__(words)
+
+    def __repr__(self):
+        return settings.PHRASE_QUOTE + ' '.join(self.value) + settings.PHRASE_QUOTE
+
+
+class NearAtom(Atom):
+    """atoms[0] NEAR/distances[0] atoms[1] NEAR/distances[1] ... - вычисляется слева направо"""
+
+    def __init__(self, atoms: list[Atom], distances: list[int]):
+        super().__init__(atoms)
+        self.distances = distances
+
+    def __repr__(self):
+        parts = [f'{self.value[0]}']
+        for distance, atom in zip(self.distances, self.value[1:]):
+            parts.append(f'{settings.NEAR_TERM}{distance} {atom}')
+        return ' '.join(parts)
+
+
 class TreeAtom(Atom):
     def __init__(self, tree: 'OrTree'):
         super().__init__(tree)
@@ -26,6 +57,19 @@ class TreeAtom(Atom):
         return f'({self.value})'
 
 
+class TermSetAtom(Atom):
+    """
+    OR хотя бы LogicTreeParser.TERM_SET_MIN_SIZE простых слов подряд: список слов вместо AndTree, ExclusionTree
+    и WordAtom на каждое слово
+    """
+
+    def __init__(self, words: list[str]):
+        super().__init__(words)
+
+    def __repr__(self):
+        return '(' + f' {settings.OR_TERM} '.join(self.value) + ')'
+
+
 class ExclusionTree:
     def __init__(self, atoms: list[Atom]):
         self.atoms = atoms
@@ -50,87 +94,160 @@ class OrTree:
         return f' {settings.OR_TERM} '.join([f'{a}' for a in self.and_trees])
 
 
+class ParserFrame:
+    """недостроенное дерево одной пары скобок (или всего запроса) в LogicTreeParser"""
+
+    def __init__(self):
+        self.and_trees: list[AndTree] = []
+        self.exclusion_trees: list[ExclusionTree] = []
+        self.atoms: list[Atom] = []
+        self.near_atoms: list[Atom] = []
+        self.distances: list[int] = []
+
+
 class LogicTreeParser:
+    """
+    грамматика:
+    or_tree        := and_tree       (OR_TERM     and_tree      )*
+    and_tree       := exclusion_tree (AND_TERM    exclusion_tree)*
+    exclusion_tree := near_tree      (EXLUDE_TERM near_tree     )*
+    near_tree      := atom           (NEAR_TERM   atom          )*
+    atom := word | wildcard | '"' word+ '"' | '(' tree ')'
+    (дерево не может быть пустым)
+
+    разбор идет за один проход по токенам без рекурсии: открытые скобки лежат в стеке ParserFrame, оператор
+    достраивает уровни с большим приоритетом. лишние скобки не добавляют вложенности:
+    - '(x)' с одним атомом внутри - сам атом;
+    - скобки внутри AND из одного AND (a & (b & c)) и внутри OR из одного OR (a | (b | c)) раскрываются
+      в родителя, так что глубина дерева - это только чередование AND и OR, а не количество скобок;
+    - TERM_SET_MIN_SIZE и больше простых слов подряд через OR собираются в один TermSetAtom.
+    QueryPlanner раскрывает вложенные AND/OR так же, поэтому план от этого не меняется
+    """
+    TERM_SET_MIN_SIZE = 16
 
     def __init__(self, query):
         self.tokens = tokenization.Tokenizator(query).tokenize()
         self.cursor = 0
 
-    def parse(self):
-        return self.parse_only_one_tree()
-
-    def parse_only_one_tree(self):
-        tree = self.parse_or_tree()
-        if self.cursor != len(self.tokens):
-            raise ValueError('в запросе несколько выражений, а не одно')
-        return tree
-
-    def parse_or_tree(self) -> OrTree:
-        # грамматика:
-        # or_tree        := and_tree       (OR_TERM     and_tree      )*
-        # and_tree       := exclusion_tree (AND_TERM    exclusion_tree)*
-        # exclusion_tree := atom           (EXLUDE_TERM exlusion_tree )*
-        # atom := word | '(' tree ')'
-
-        # примечание: дерево не может быть пустым
-
-        and_trees = [self.parse_and_tree()]
-        while True:
-            token = self.current_token()
-            if isinstance(token, tokenization.Operator) and token.value == settings.OR_TERM:
-                self.cursor += 1
-                and_trees.append(self.parse_and_tree())
+    def parse(self) -> OrTree:
+        stack = [ParserFrame()]
+        expects_atom = True
+        for self.cursor, token in enumerate(self.tokens):
+            frame = stack[-1]
+            if isinstance(token, (tokenization.Word, tokenization.Phrase, tokenization.LeftParenthesis)):
+                if not expects_atom:
+                    if len(stack) == 1:
+                        raise ValueError('в запросе несколько выражений, а не одно')
+                    raise ValueError(f'{self.cursor}-й токен запроса должен быть ), а не {token}')
+                if isinstance(token, tokenization.LeftParenthesis):
+                    stack.append(ParserFrame())
+                    continue
+                frame.near_atoms.append(self.make_atom(token))
+                expects_atom = False
+                continue
+            if expects_atom:
+                raise ValueError(f'{self.cursor}-й токен запроса должен быть словом, фразой или (, а не {token}')
+            if isinstance(token, tokenization.RightParenthesis):
+                if len(stack) == 1:
+                    raise ValueError('в запросе несколько выражений, а не одно')
+                stack.pop()
+                stack[-1].near_atoms.append(self.make_tree_atom(self.close_or_tree(frame)))
+            elif isinstance(token, tokenization.NearOperator):
+                frame.distances.append(token.distance)
+                expects_atom = True
+            elif isinstance(token, tokenization.Operator):
+                self.close_near_tree(frame)
+                if token.value != settings.EXCLUSION_TERM:
+                    self.close_exclusion_tree(frame)
+                if token.value == settings.OR_TERM:
+                    self.close_and_tree(frame)
+                expects_atom = True
             else:
-                break
-        return OrTree(and_trees)
-
-    def parse_and_tree(self) -> AndTree:
-        exclusion_trees = [self.parse_exclusion_tree()]
-        while True:
-            token = self.current_token()
-            if isinstance(token, tokenization.Operator) and token.value == settings.AND_TERM:
-                self.cursor += 1
-                exclusion_trees.append(self.parse_exclusion_tree())
+                raise AssertionError()
+        self.cursor = len(self.tokens)
+        if expects_atom:
+            raise ValueError(f'в запросе должен быть {self.cursor}-й токен, а там конец строки')
+        if len(stack) > 1:
+            raise ValueError(f'в запросе не закрыты {len(stack) - 1} (')
+        return self.close_or_tree(stack[0])
+
+    @staticmethod
+    def make_atom(token: tokenization.Token) -> Atom:
+        if isinstance(token, tokenization.Phrase):
+            return PhraseAtom(token.words)
+        if settings.WILDCARD in token.word:
+            return WildcardAtom(token.word)
+        return WordAtom(token.word)
+
+    @staticmethod
+    def make_tree_atom(tree: OrTree) -> Atom:
+        if len(tree.and_trees) == 1 and len(tree.and_trees[0].exclusion_trees) == 1 \
+                and len(tree.and_trees[0].exclusion_trees[0].atoms) == 1:
+            return tree.and_trees[0].exclusion_trees[0].atoms[0]
+        return TreeAtom(tree)
+
+    @staticmethod
+    def close_near_tree(frame: ParserFrame):
+        if len(frame.near_atoms) == 1:
+            frame.atoms.append(frame.near_atoms[0])
+        else:
+            frame.atoms.append(NearAtom(frame.near_atoms, frame.distances))
+        frame.near_atoms = []
+        frame.distances = []
+
+    @staticmethod
+    def close_exclusion_tree(frame: ParserFrame):
+        atom = frame.atoms[0]
+        if len(frame.atoms) == 1 and isinstance(atom, TreeAtom) and len(atom.value.and_trees) == 1:
+            # a & (b & c) = a & b & c
+            frame.exclusion_trees.extend(atom.value.and_trees[0].exclusion_trees)
+        else:
+            frame.exclusion_trees.append(ExclusionTree(frame.atoms))
+        frame.atoms = []
+
+    @staticmethod
+    def close_and_tree(frame: ParserFrame):
+        exclusion_tree = frame.exclusion_trees[0]
+        if len(frame.exclusion_trees) == 1 and len(exclusion_tree.atoms) == 1 \
+                and isinstance(exclusion_tree.atoms[0], TreeAtom):
+            # a | (b | c) = a | b | c
+            frame.and_trees.extend(exclusion_tree.atoms[0].value.and_trees)
+        else:
+            frame.and_trees.append(AndTree(frame.exclusion_trees))
+        frame.exclusion_trees = []
+
+    def close_or_tree(self, frame: ParserFrame) -> OrTree:
+        self.close_near_tree(frame)
+        self.close_exclusion_tree(frame)
+        self.close_and_tree(frame)
+        and_trees = []
+        # идущие подряд простые слова и их AndTree
+        words, words_and_trees = [], []
+        for and_tree in frame.and_trees + [None]:
+            and_tree_words = self.get_words(and_tree) if and_tree is not None else None
+            if and_tree_words is not None:
+                words.extend(and_tree_words)
+                words_and_trees.append(and_tree)
+                continue
+            if len(words) >= self.TERM_SET_MIN_SIZE:
+                and_trees.append(AndTree([ExclusionTree([TermSetAtom(words)])]))
             else:
-                break
-
-        return AndTree(exclusion_trees)
-
-    def parse_exclusion_tree(self) -> ExclusionTree:
-        atoms = [self.parse_atom()]
-        while True:
-            token = self.current_token()
-            if isinstance(token, tokenization.Operator) and token.value == settings.EXCLUSION_TERM:
-                self.cursor += 1
-                atoms.append(self.parse_atom())
-            else:
-                break
-        return ExclusionTree(atoms)
-
-    def parse_atom(self) -> Atom:
-        token = self.current_token()
-        if token is None:
-            raise ValueError(f'в {self.tokens} должен быть {self.cursor}-й токен, а там конец строки')
-        if isinstance(token, tokenization.Word):
-            token: tokenization.Word
-            self.cursor += 1
-            return WordAtom(token.word)
-        if isinstance(token, tokenization.LeftParenthesis):
-            token: tokenization.LeftParenthesis
-            self.cursor += 1
-            tree = self.parse_or_tree()
-
-            end_token = self.current_token()
-            if isinstance(end_token, tokenization.RightParenthesis):
-                self.cursor += 1
-                return TreeAtom(tree)
-            else:
-                raise ValueError(f'в {self.tokens} {self.cursor}-й токен должен быть ), а не {token}')
-        raise AssertionError()
+                and_trees.extend(words_and_trees)
+            words, words_and_trees = [], []
+            if and_tree is not None:
+                and_trees.append(and_tree)
+        return OrTree(and_trees)
 
-    def current_token(self):
-        if self.cursor < len(self.tokens):
-            return self.tokens[self.cursor]
+    @staticmethod
+    def get_words(and_tree: AndTree) -> typing.Optional[list[str]]:
+        """:return: слова, если and_tree - одно простое слово или TermSetAtom, иначе None"""
+        if len(and_tree.exclusion_trees) != 1 or len(and_tree.exclusion_trees[0].atoms) != 1:
+            return None
+        atom = and_tree.exclusion_trees[0].atoms[0]
+        if isinstance(atom, TermSetAtom):
+            return atom.value
+        if isinstance(atom, WordAtom):
+            return [atom.value]
         return None
 
 
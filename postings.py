@@ -0,0 +1,480 @@
+import bisect
+import heapq
+import itertools
+import typing
+from array import array
+
+
+class WordEntry:
+    """одно вхождение одного слова в один файл. position - номер слова в файле (None, если индекс его не хранит)"""
+    __slots__ = ('offset', 'line', 'length', 'position')
+
+    def __init__(self, offset: int, line: int, length: int, position: int = None):
+        self.offset = offset
+        self.length = length
+        self.line = line
+        self.position = position
+
+    def __repr__(self):
+        return f'WordEntry({self.offset}, {self.line}, {self.length})'
+
+    def __setstate__(self, state):
+        # в индексах, сохраненных до появления __slots__, состояние - словарь атрибутов
+        if isinstance(state, tuple):
+            state = state[1]
+        self.position = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class WordEntries:
+    """
+    вхождения в один файл, отсортированные по offset и упакованные в один массив
+    троек (offset, line, length), и параллельный им массив номеров слов в файле positions
+    (None, если вхождения прочитаны из индекса, сохраненного без позиций).
+    объекты WordEntry создаются только при обращении к конкретному вхождению
+    """
+    __slots__ = ('packed', 'positions')
+
+    def __init__(self, packed: array = None, positions: array = None):
+        if packed is None:
+            packed = array('q')
+            if positions is None: positions = array('I')
+        self.packed = packed
+        self.positions = positions
+
+    def append(self, offset: int, line: int, length: int, position: int):
+        self.packed.extend((offset, line, length))
+        self.positions.append(position)
+
+    @classmethod
+    def merge(cls, entries_list: list['WordEntries']) -> 'WordEntries':
+        """
+        сливает отсортированные списки вхождений в один отсортированный.
+        одно и то же вхождение из разных списков (запросы вида "кукуруза AND кукуруза") попадает в результат один раз
+        """
+        if len(entries_list) == 1: return entries_list[0]
+        if any(entries.positions is None for entries in entries_list):
+            packed = array('q')
+            previous = None
+            for triple in heapq.merge(*(entries.triples() for entries in entries_list)):
+                if triple != previous:
+                    packed.extend(triple)
+                    previous = triple
+            return cls(packed)
+
+        # номер слова однозначно задает вхождение, так что слияние - это объединение словарей по номерам слов
+        triples_by_position = {}
+        for entries in entries_list:
+            triples_by_position.update(zip(entries.positions, entries.triples()))
+        return cls.from_positions(triples_by_position)
+
+    @classmethod
+    def select(cls, entries_list: list['WordEntries'], positions_list: list[set[int]]) -> 'WordEntries':
+        """:return: вхождения entries_list[i] с номерами слов из positions_list[i], по порядку"""
+        triples_by_position = {}
+        for entries, positions in zip(entries_list, positions_list):
+            triples_by_position.update((position, triple) for position, triple
+                                       in zip(entries.get_positions(), entries.triples()) if position in positions)
+        return cls.from_positions(triples_by_position)
+
+    @classmethod
+    def from_positions(cls, triples_by_position: dict[int, tuple[int, int, int]]) -> 'WordEntries':
+        positions = sorted(triples_by_position)
+        packed = array('q', itertools.chain.from_iterable(map(triples_by_position.__getitem__, positions)))
+        return cls(packed, array('I', positions))
+
+    def triples(self) -> typing.Iterator[tuple[int, int, int]]:
+        packed = self.packed
+        return zip(packed[0::3], packed[1::3], packed[2::3])
+
+    def quads(self) -> typing.Iterator[tuple[int, int, int, int]]:
+        """(offset, line, length, position) по порядку"""
+        packed = self.packed
+        return zip(packed[0::3], packed[1::3], packed[2::3], self.get_positions())
+
+    def get_positions(self) -> array:
+        if self.positions is None:
+            raise ValueError('индекс сохранен без номеров слов в файлах, для фраз и NEAR его нужно переиндексировать')
+        return self.positions
+
+    def __len__(self):
+        return len(self.packed) // 3
+
+    def __getitem__(self, i) -> WordEntry:
+        if i < 0: i += len(self)
+        return WordEntry(*self.packed[3 * i:3 * i + 3], self.positions[i] if self.positions is not None else None)
+
+    def __iter__(self) -> typing.Iterator[WordEntry]:
+        if self.positions is None:
+            for offset, line, length in self.triples():
+                yield WordEntry(offset, line, length)
+        else:
+            for offset, line, length, position in self.quads():
+                yield WordEntry(offset, line, length, position)
+
+    def __eq__(self, other):
+        return isinstance(other, WordEntries) and self.packed == other.packed and self.positions == other.positions
+
+    def __setstate__(self, state):
+        # в индексах, сохраненных до появления positions, есть только packed
+        self.positions = None
+        for name, value in state[1].items():
+            setattr(self, name, value)
+
+
+# BIT_POSITIONS[b] - номера единичных битов байта b
+BIT_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class Postings:
+    """
+    вхождения слова (или результат запроса) по файлам:
+    doc_ids файлов по возрастанию и параллельный им список WordEntries.
+    для плотных списков (слово есть в большой доле файлов) по запросу строится битмап doc_id,
+    на котором пересечение и исключение делаются побитовыми операциями.
+    количества вхождений по файлам для ранжирования тоже считаются по запросу и запоминаются.
+    список без вхождений (entries is None, см. of_doc_ids) - только множество файлов: так выполняется запрос,
+    пока не известно, какие файлы попадут в результат. операции над ним не трогают вхождения вовсе
+    """
+    __slots__ = ('doc_ids', 'entries', 'bitmap', 'counts')
+
+    # минимальная доля doc_id из [0, последний doc_id], при которой строится битмап. None - не строить битмапы
+    BITMAP_MIN_DENSITY = 1 / 32
+
+    def __init__(self, doc_ids: array = None, entries: list[WordEntries] = None):
+        if doc_ids is None: doc_ids = array('I')
+        if entries is None: entries = []
+        self.doc_ids = doc_ids
+        self.entries = entries
+        self.bitmap = None
+        self.counts = None
+
+    @classmethod
+    def of_doc_ids(cls, doc_ids: array = None) -> 'Postings':
+        """список файлов без вхождений"""
+        postings = cls(doc_ids)
+        postings.entries = None
+        return postings
+
+    @classmethod
+    def make_empty(cls, with_entries: bool) -> 'Postings':
+        return cls() if with_entries else cls.of_doc_ids()
+
+    def has_entries(self) -> bool:
+        return self.entries is not None
+
+    def append(self, doc_id: int, entries: typing.Optional[WordEntries]):
+        """добавляет файл с doc_id больше всех имеющихся (entries игнорируются, если список без вхождений)"""
+        self.doc_ids.append(doc_id)
+        if self.entries is not None:
+            self.entries.append(entries)
+        self.bitmap = None
+        self.counts = None
+
+    def add_entry(self, doc_id: int, offset: int, line: int, length: int, position: int):
+        if len(self.doc_ids) == 0 or self.doc_ids[-1] < doc_id:
+            self.append(doc_id, WordEntries())
+            self.entries[-1].append(offset, line, length, position)
+            return
+        i = bisect.bisect_left(self.doc_ids, doc_id)
+        if i == len(self.doc_ids) or self.doc_ids[i] != doc_id:
+            self.doc_ids.insert(i, doc_id)
+            self.entries.insert(i, WordEntries())
+            self.bitmap = None
+        self.entries[i].append(offset, line, length, position)
+        self.counts = None
+
+    def extend(self, other: 'Postings', doc_id_shift: int = 0):
+        """добавляет файлы другого списка, doc_id которых после сдвига больше всех имеющихся"""
+        self.doc_ids.extend(doc_id + doc_id_shift for doc_id in other.doc_ids)
+        if self.entries is not None:
+            self.entries.extend(other.entries)
+        self.bitmap = None
+        self.counts = None
+
+    def remove(self, doc_id: int):
+        i = self.find(doc_id)
+        if i is None:
+            return
+        del self.doc_ids[i]
+        del self.entries[i]
+        self.bitmap = None
+        self.counts = None
+
+    def find(self, doc_id: int, lo: int = 0) -> typing.Optional[int]:
+        """:return: позиция doc_id в списке или None"""
+        i = bisect.bisect_left(self.doc_ids, doc_id, lo)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return i
+        return None
+
+    def get(self, doc_id: int) -> typing.Optional[WordEntries]:
+        i = self.find(doc_id)
+        return self.entries[i] if i is not None else None
+
+    def items(self) -> typing.Iterator[tuple[int, typing.Optional[WordEntries]]]:
+        """(doc_id, вхождения), у списка без вхождений - (doc_id, None)"""
+        return zip(self.doc_ids, self.entries if self.entries is not None else itertools.repeat(None))
+
+    def is_dense(self) -> bool:
+        if self.BITMAP_MIN_DENSITY is None or len(self.doc_ids) == 0:
+            return False
+        return len(self.doc_ids) >= self.BITMAP_MIN_DENSITY * (self.doc_ids[-1] + 1)
+
+    def get_bitmap(self) -> int:
+        """битмап doc_id: бит d выставлен, если файл d есть в списке"""
+        if self.bitmap is None:
+            bits = bytearray(self.doc_ids[-1] // 8 + 1 if len(self.doc_ids) > 0 else 0)
+            for doc_id in self.doc_ids:
+                bits[doc_id >> 3] |= 1 << (doc_id & 7)
+            self.bitmap = int.from_bytes(bits, 'little')
+        return self.bitmap
+
+    def get_size(self) -> int:
+        """:return: примерный размер doc_id и вхождений в байтах"""
+        return (len(self.doc_ids) * self.doc_ids.itemsize
+                + sum(len(entries.packed) * entries.packed.itemsize
+                      + (len(entries.positions) * entries.positions.itemsize if entries.positions is not None else 0)
+                      for entries in self.entries or ()))
+
+    def get_counts(self) -> array:
+        """количество вхождений в каждый файл, параллельно doc_ids"""
+        if self.counts is None:
+            self.counts = array('I', map(len, self.entries))
+        return self.counts
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __eq__(self, other):
+        return isinstance(other, Postings) and self.doc_ids == other.doc_ids and self.entries == other.entries
+
+    def __repr__(self):
+        return f'Postings({list(self.doc_ids)})'
+
+    @classmethod
+    def intersect(cls, postings_list: list['Postings']) -> 'Postings':
+        """
+        AND: идем по самому короткому списку и ищем его doc_id в остальных галопом.
+        если хотя бы один список без вхождений, результат тоже без них (и для плотных списков - пересечение битмапов)
+        """
+        if len(postings_list) == 0: raise ValueError('перресечение пустого набора результатов')
+        if len(postings_list) == 1: return postings_list[0]
+
+        if not all(postings.has_entries() for postings in postings_list):
+            if all(postings.is_dense() for postings in postings_list):
+                # без вхождений позиции в списках не нужны, хватает пересечения битмапов
+                bits = postings_list[0].get_bitmap()
+                for postings in postings_list[1:]:
+                    bits &= postings.get_bitmap()
+                return cls.of_doc_ids(array('I', iter_bits(bits)))
+            return cls.of_doc_ids(array('I', (doc_id for doc_id, _ in cls.iter_common(postings_list))))
+        result = cls()
+        for doc_id, found in cls.iter_common(postings_list):
+            result.append(doc_id, WordEntries.merge(found))
+        return result
+
+    @classmethod
+    def phrase(cls, postings_list: list['Postings'], with_entries: bool = True) -> 'Postings':
+        """
+        фраза: файлы, где слово i списка стоит на месте p + i для какого-то p.
+        вхождения результата - вхождения слов найденных фраз
+        :param with_entries: False - вернуть только файлы (вхождения слов все равно нужны для номеров слов)
+        """
+        if len(postings_list) == 0: raise ValueError('пустая фраза')
+        if len(postings_list) == 1:
+            return postings_list[0] if with_entries else cls.of_doc_ids(postings_list[0].doc_ids)
+
+        result = cls.make_empty(with_entries)
+        for doc_id, found in cls.iter_common(postings_list):
+            starts = cls.find_phrase_starts(found)
+            if starts:
+                result.append(doc_id, cls.select_phrase(found, starts) if with_entries else None)
+        return result
+
+    @staticmethod
+    def find_phrase_starts(found: list[WordEntries]) -> set[int]:
+        """:return: номера слов, с которых в файле начинается фраза (found[i] - вхождения i-го слова фразы)"""
+        positions_list = [entries.get_positions() for entries in found]
+        # начала фраз ищутся от самого редкого в файле слова фразы
+        rarest = min(range(len(found)), key=lambda i: len(positions_list[i]))
+        starts = {position - rarest for position in positions_list[rarest]}
+        for i, positions in enumerate(positions_list):
+            if not starts:
+                break
+            if i != rarest:
+                starts.intersection_update([position - i for position in positions])
+        return starts
+
+    @staticmethod
+    def select_phrase(found: list[WordEntries], starts: set[int]) -> WordEntries:
+        return WordEntries.select(found, [{start + i for start in starts} for i in range(len(found))])
+
+    @classmethod
+    def near(cls, left: 'Postings', right: 'Postings', distance: int) -> 'Postings':
+        """
+        NEAR/distance: файлы, где вхождения left и right стоят не дальше distance слов друг от друга (в любом порядке).
+        вхождения результата - вхождения обеих сторон, у которых нашлась пара
+        """
+        if distance < 1: raise ValueError(f'расстояние NEAR должно быть положительным, а не {distance}')
+
+        result = cls()
+        for doc_id, (left_entries, right_entries) in cls.iter_common([left, right]):
+            entries = cls.select_near(left_entries, right_entries, distance)
+            if entries is not None:
+                result.append(doc_id, entries)
+        return result
+
+    @classmethod
+    def select_near(cls, left_entries: WordEntries, right_entries: WordEntries,
+                    distance: int) -> typing.Optional[WordEntries]:
+        """:return: вхождения одного файла, у которых нашлась пара на расстоянии до distance, или None, если их нет"""
+        left_positions = left_entries.get_positions()
+        right_positions = right_entries.get_positions()
+        matched_left = cls.find_near(left_positions, right_positions, distance)
+        if not matched_left:
+            return None
+        matched_right = cls.find_near(right_positions, left_positions, distance)
+        return WordEntries.select([left_entries, right_entries], [matched_left, matched_right])
+
+    @staticmethod
+    def find_near(positions: array, other_positions: array, distance: int) -> set[int]:
+        """:return: номера слов из positions, от которых в other_positions есть другое слово не дальше distance"""
+        matched = set()
+        for position in positions:
+            lo = bisect.bisect_left(other_positions, position - distance)
+            hi = bisect.bisect_right(other_positions, position + distance)
+            # то же самое слово (запросы вида "кукуруза NEAR/3 кукуруза") парой себе не считается
+            if hi - lo > 1 or (hi - lo == 1 and other_positions[lo] != position):
+                matched.add(position)
+        return matched
+
+    @classmethod
+    def iter_common(cls, postings_list: list['Postings']) -> typing.Iterator[tuple[int, list[WordEntries]]]:
+        """
+        doc_id, которые есть во всех списках, и вхождения каждого списка в этот файл (в порядке postings_list,
+        None для списков без вхождений).
+        идем по самому короткому списку и ищем его doc_id в остальных галопом
+        (или по пересечению битмапов, если все списки плотные)
+        """
+        order = sorted(range(len(postings_list)), key=lambda k: len(postings_list[k]))
+        ordered = [postings_list[k] for k in order]
+        if len(ordered[0]) == 0:
+            return
+        if all(postings.is_dense() for postings in ordered):
+            bits = ordered[0].get_bitmap()
+            for postings in ordered[1:]:
+                bits &= postings.get_bitmap()
+            candidates = iter_bits(bits)
+        else:
+            candidates = ordered[0].doc_ids
+
+        cursors = [0] * len(ordered)
+        found = [None] * len(ordered)
+        for doc_id in candidates:
+            for k, postings in enumerate(ordered):
+                i = gallop(postings.doc_ids, doc_id, cursors[k])
+                if i == len(postings.doc_ids):
+                    return
+                cursors[k] = i
+                if postings.doc_ids[i] != doc_id:
+                    break
+                if postings.entries is not None:
+                    found[order[k]] = postings.entries[i]
+            else:
+                yield doc_id, list(found)
+
+    @classmethod
+    def restrict(cls, postings: 'Postings', allowed: 'Postings') -> 'Postings':
+        """файлы postings, которые есть и в allowed. вхождения берутся только из postings"""
+        result = cls.make_empty(postings.has_entries())
+        if len(postings) <= len(allowed):
+            cursor = 0
+            for doc_id, entries in postings.items():
+                cursor = gallop(allowed.doc_ids, doc_id, cursor)
+                if cursor == len(allowed.doc_ids):
+                    break
+                if allowed.doc_ids[cursor] == doc_id:
+                    result.append(doc_id, entries)
+        else:
+            cursor = 0
+            for doc_id in allowed.doc_ids:
+                cursor = gallop(postings.doc_ids, doc_id, cursor)
+                if cursor == len(postings.doc_ids):
+                    break
+                if postings.doc_ids[cursor] == doc_id:
+                    result.append(doc_id, postings.entries[cursor] if postings.has_entries() else None)
+        return result
+
+    @classmethod
+    def unite(cls, postings_list: list['Postings']) -> 'Postings':
+        """OR: k-way слияние списков кучей (без вхождений, если хотя бы один список без них)"""
+        if len(postings_list) == 0: return cls()
+        if len(postings_list) == 1: return postings_list[0]
+
+        if not all(postings.has_entries() for postings in postings_list):
+            if all(postings.is_dense() for postings in postings_list):
+                bits = 0
+                for postings in postings_list:
+                    bits |= postings.get_bitmap()
+                return cls.of_doc_ids(array('I', iter_bits(bits)))
+            merged = heapq.merge(*(postings.doc_ids for postings in postings_list))
+            return cls.of_doc_ids(array('I', (doc_id for doc_id, _ in itertools.groupby(merged))))
+
+        result = cls()
+        merged = heapq.merge(*(zip(postings.doc_ids, postings.entries, itertools.repeat(k))
+                               for k, postings in enumerate(postings_list)),
+                             key=lambda item: (item[0], item[2]))
+        for doc_id, group in itertools.groupby(merged, key=lambda item: item[0]):
+            result.append(doc_id, WordEntries.merge([entries for _, entries, _ in group]))
+        return result
+
+    @classmethod
+    def exclude(cls, postings: 'Postings', exclusions: list['Postings']) -> 'Postings':
+        """разность отсортированных списков (или проверка по битмапу, если все исключаемые списки плотные)"""
+        if len(exclusions) == 0:
+            return postings
+
+        result = cls.make_empty(postings.has_entries())
+        if all(exclusion.is_dense() for exclusion in exclusions):
+            bits = 0
+            for exclusion in exclusions:
+                bits |= exclusion.get_bitmap()
+            excluded = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+            for doc_id, entries in postings.items():
+                byte_index = doc_id >> 3
+                if byte_index >= len(excluded) or not excluded[byte_index] >> (doc_id & 7) & 1:
+                    result.append(doc_id, entries)
+            return result
+
+        excluded = heapq.merge(*(exclusion.doc_ids for exclusion in exclusions))
+        excluded_doc_id = next(excluded, None)
+        for doc_id, entries in postings.items():
+            while excluded_doc_id is not None and excluded_doc_id < doc_id:
+                excluded_doc_id = next(excluded, None)
+            if excluded_doc_id != doc_id:
+                result.append(doc_id, entries)
+        return result
+
+
+def gallop(doc_ids: array, target: int, lo: int) -> int:
+    """:return: первая позиция не раньше lo, где doc_ids[позиция] >= target (экспоненциальный, затем бинарный поиск)"""
+    n = len(doc_ids)
+    step = 1
+    hi = lo
+    while hi < n and doc_ids[hi] < target:
+        lo = hi + 1
+        hi = lo + step
+        step *= 2
+    return bisect.bisect_left(doc_ids, target, lo, min(hi, n))
+
+
+def iter_bits(bits: int) -> typing.Iterator[int]:
+    """номера единичных битов по возрастанию"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index * 8
+            for bit in BIT_POSITIONS[byte]:
+                yield base + bit
@@ -0,0 +1,74 @@
+import collections
+import threading
+import typing
+
+
+class QueryCache:
+    """
+    LRU-кеш, ограниченный и количеством записей, и их суммарным размером (размер записи сообщает тот, кто ее кладет).
+    записи действительны для одного поколения индекса (FolderIndex.generation):
+    при обращении с другим поколением кеш очищается.
+    считает попадания, промахи, вытеснения и сбросы.
+    потокобезопасен (поисковый сервер обслуживает запросы из нескольких потоков)
+    """
+
+    def __init__(self, max_items: int = 1024, max_size: int = 64 * 2 ** 20):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.values: collections.OrderedDict[typing.Hashable, tuple[typing.Any, int]] = collections.OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: typing.Hashable, generation: int) -> typing.Optional[typing.Any]:
+        """:return: значение или None, если его нет в кеше"""
+        with self.lock:
+            self.check_generation(generation)
+            if key not in self.values:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.values.move_to_end(key)
+            return self.values[key][0]
+
+    def put(self, key: typing.Hashable, value: typing.Any, size: int, generation: int):
+        with self.lock:
+            self.check_generation(generation)
+            if size > self.max_size:
+                return
+            if key in self.values:
+                self.size -= self.values.pop(key)[1]
+            self.values[key] = (value, size)
+            self.size += size
+            self.evict()
+
+    def check_generation(self, generation: int):
+        if generation != self.generation:
+            if len(self.values) > 0:
+                self.invalidations += 1
+            self.clear()
+            self.generation = generation
+
+    def evict(self):
+        while len(self.values) > self.max_items or self.size > self.max_size:
+            _, (_, size) = self.values.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.values.clear()
+        self.size = 0
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'items': len(self.values),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
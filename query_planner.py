@@ -0,0 +1,250 @@
+import typing
+
+import logic_tree
+
+
+class PlanNode:
+    """
+    узел плана запроса.
+    - key:      каноническая форма узла, одинаковые подвыражения имеют одинаковый key
+    - estimate: оценка количества файлов в результате
+    """
+
+    def __init__(self, key: tuple, estimate: float):
+        self.key = key
+        self.estimate = estimate
+
+    def explain(self, indent: int = 0) -> str:
+        raise NotImplementedError()
+
+    def explain_line(self, indent: int, text: str) -> str:
+        return '  ' * indent + f'{text}  (~{round(self.estimate)} файлов)'
+
+
+class TermNode(PlanNode):
+    def __init__(self, word: str, df: int):
+        super().__init__(('term', word), df)
+        self.word = word
+
+    def explain(self, indent: int = 0) -> str:
+        return self.explain_line(indent, f'слово {self.word!r}')
+
+
+class PhraseNode(PlanNode):
+    """слова подряд: вычисляется слиянием номеров слов в файлах, общих для всех слов"""
+
+    def __init__(self, words: list[str], estimate: float):
+        super().__init__(('phrase', tuple(words)), estimate)
+        self.words = words
+
+    def explain(self, indent: int = 0) -> str:
+        return self.explain_line(indent, f'фраза {" ".join(self.words)!r}')
+
+
+class NearNode(PlanNode):
+    """left и right не дальше distance слов друг от друга. right вычисляется только среди файлов left"""
+
+    def __init__(self, left: PlanNode, right: PlanNode, distance: int, estimate: float):
+        super().__init__(('near', distance, frozenset((left.key, right.key))), estimate)
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def explain(self, indent: int = 0) -> str:
+        return '\n'.join([self.explain_line(indent, f'NEAR/{self.distance}'),
+                          self.left.explain(indent + 1),
+                          self.right.explain(indent + 1)])
+
+
+class AndNode(PlanNode):
+    """пересечение, дети упорядочены по возрастанию оценки"""
+
+    def __init__(self, children: list[PlanNode], estimate: float):
+        super().__init__(('and', frozenset(child.key for child in children)), estimate)
+        self.children = children
+
+    def explain(self, indent: int = 0) -> str:
+        return '\n'.join([self.explain_line(indent, 'AND')] + [child.explain(indent + 1) for child in self.children])
+
+
+class OrNode(PlanNode):
+    def __init__(self, children: list[PlanNode], estimate: float):
+        super().__init__(('or', frozenset(child.key for child in children)), estimate)
+        self.children = children
+
+    def explain(self, indent: int = 0) -> str:
+        return '\n'.join([self.explain_line(indent, 'OR')] + [child.explain(indent + 1) for child in self.children])
+
+
+class ExcludeNode(PlanNode):
+    """positive без файлов excluded. excluded вычисляется только среди файлов positive"""
+
+    def __init__(self, positive: PlanNode, excluded: PlanNode, estimate: float):
+        super().__init__(('exclude', positive.key, excluded.key), estimate)
+        self.positive = positive
+        self.excluded = excluded
+
+    def explain(self, indent: int = 0) -> str:
+        return '\n'.join([self.explain_line(indent, 'EXCLUDE'),
+                          self.positive.explain(indent + 1),
+                          '  ' * (indent + 1) + 'без',
+                          self.excluded.explain(indent + 2)])
+
+
+class QueryPlanner:
+    """
+    переводит дерево из LogicTreeParser в план:
+    - вложенные AND/OR раскрываются в родителя
+    - одинаковые атомы и поддеревья внутри AND/OR остаются в одном экземпляре
+    - исключения поднимаются над AND: x & (a \\ b) = (x & a) \\ b, так что b проверяется только на тех файлах,
+      что прошли все условия AND
+    - дети AND упорядочены по возрастанию оценки (для слов - по количеству файлов со словом)
+    - у NEAR первой вычисляется сторона с меньшей оценкой
+    - слово с * раскрывается по словарю индекса в OR подходящих слов (не больше max_expansions)
+    - слова нормализуются анализатором индекса, выброшенные анализатором слова (служебные) пропускаются:
+      в AND/OR и фразе их как будто нет, у NEAR остается другая сторона, исключение служебного слова не действует,
+      а запрос из одних служебных слов ничего не находит
+    оценки считаются в предположении независимости слов, фраза и NEAR оцениваются сверху, как AND своих слов
+    """
+
+    MAX_EXPANSIONS = 1024
+
+    def __init__(self, folder_index, max_expansions: int = MAX_EXPANSIONS):
+        """
+        :param folder_index: folder_index.FolderIndex
+        :param max_expansions: сколько слов может подойти под шаблон, при большем количестве - ValueError
+        """
+        self.folder_index = folder_index
+        self.analyzer = folder_index.tf_idf_index.analyzer
+        self.max_expansions = max_expansions
+        self.files_count = max(folder_index.get_docs_count(), 1)
+
+    def plan(self, or_tree: logic_tree.OrTree) -> PlanNode:
+        node = self.plan_or_tree(or_tree)
+        # запрос из одних выброшенных анализатором слов - пустое OR, ничего не находит
+        return node if node is not None else self.make_or([])
+
+    def plan_or_tree(self, or_tree: logic_tree.OrTree) -> typing.Optional[PlanNode]:
+        """:return: None, если все слова поддерева выброшены анализатором (так же у plan_* ниже)"""
+        nodes = [self.plan_and_tree(and_tree) for and_tree in or_tree.and_trees]
+        nodes = [node for node in nodes if node is not None]
+        return self.make_or(nodes) if len(nodes) > 0 else None
+
+    def plan_and_tree(self, and_tree: logic_tree.AndTree) -> typing.Optional[PlanNode]:
+        nodes = [self.plan_exclusion_tree(exclusion_tree) for exclusion_tree in and_tree.exclusion_trees]
+        nodes = [node for node in nodes if node is not None]
+        return self.make_and(nodes) if len(nodes) > 0 else None
+
+    def plan_exclusion_tree(self, exclusion_tree: logic_tree.ExclusionTree) -> typing.Optional[PlanNode]:
+        positive = self.plan_atom(exclusion_tree.atoms[0])
+        excluded = [self.plan_atom(atom) for atom in exclusion_tree.atoms[1:]]
+        excluded = [node for node in excluded if node is not None]
+        if positive is None or len(excluded) == 0:
+            return positive
+        return self.make_exclude(positive, self.make_or(excluded))
+
+    def plan_atom(self, atom: logic_tree.Atom) -> typing.Optional[PlanNode]:
+        if isinstance(atom, logic_tree.WordAtom):
+            word = self.analyzer.normalize(atom.value)
+            if word is None:
+                return None
+            return TermNode(word, self.folder_index.get_doc_frequency(word))
+        if isinstance(atom, logic_tree.TermSetAtom):
+            words = [self.analyzer.normalize(word) for word in atom.value]
+            nodes = [TermNode(word, self.folder_index.get_doc_frequency(word)) for word in words if word is not None]
+            return self.make_or(nodes) if len(nodes) > 0 else None
+        if isinstance(atom, logic_tree.WildcardAtom):
+            words = self.folder_index.expand_terms(atom.value, self.max_expansions)
+            return self.make_or([TermNode(word, self.folder_index.get_doc_frequency(word)) for word in words])
+        if isinstance(atom, logic_tree.PhraseAtom):
+            atom: logic_tree.PhraseAtom
+            return self.make_phrase(atom.value)
+        if isinstance(atom, logic_tree.NearAtom):
+            atom: logic_tree.NearAtom
+            node = self.plan_atom(atom.value[0])
+            for distance, right in zip(atom.distances, atom.value[1:]):
+                right = self.plan_atom(right)
+                if node is None or right is None:
+                    node = node if right is None else right
+                else:
+                    node = self.make_near(node, right, distance)
+            return node
+        if isinstance(atom, logic_tree.TreeAtom):
+            atom: logic_tree.TreeAtom
+            return self.plan_or_tree(atom.value)
+        raise AssertionError()
+
+    def make_phrase(self, words: list[str]) -> typing.Optional[PlanNode]:
+        words = [self.analyzer.normalize(word) for word in words]
+        words = [word for word in words if word is not None]
+        if len(words) == 0:
+            return None
+        dfs = [self.folder_index.get_doc_frequency(word) for word in words]
+        if len(words) == 1:
+            return TermNode(words[0], dfs[0])
+        return PhraseNode(words, self.estimate_and(dfs))
+
+    def make_near(self, left: PlanNode, right: PlanNode, distance: int) -> PlanNode:
+        if right.estimate < left.estimate:
+            left, right = right, left
+        return NearNode(left, right, distance, self.estimate_and([left.estimate, right.estimate]))
+
+    def estimate_and(self, estimates: list[float]) -> float:
+        estimate = self.files_count
+        for child_estimate in estimates:
+            estimate *= child_estimate / self.files_count
+        return estimate
+
+    def make_and(self, nodes: list[PlanNode]) -> PlanNode:
+        children = []
+        excluded = []
+        for node in self.flatten(nodes, AndNode):
+            if isinstance(node, ExcludeNode):
+                excluded.append(node.excluded)
+                node = node.positive
+            children.extend(self.flatten([node], AndNode))
+        children = self.deduplicate(children)
+        children.sort(key=lambda child: child.estimate)
+
+        if len(children) == 1:
+            node = children[0]
+        else:
+            node = AndNode(children, self.estimate_and([child.estimate for child in children]))
+
+        if len(excluded) > 0:
+            return self.make_exclude(node, self.make_or(excluded))
+        return node
+
+    def make_or(self, nodes: list[PlanNode]) -> PlanNode:
+        children = self.deduplicate(self.flatten(nodes, OrNode))
+        if len(children) == 1:
+            return children[0]
+        missing_share = 1
+        for child in children:
+            missing_share *= 1 - min(child.estimate / self.files_count, 1)
+        return OrNode(children, self.files_count * (1 - missing_share))
+
+    def make_exclude(self, positive: PlanNode, excluded: PlanNode) -> PlanNode:
+        if isinstance(positive, ExcludeNode):
+            excluded = self.make_or([positive.excluded, excluded])
+            positive = positive.positive
+        estimate = positive.estimate * (1 - min(excluded.estimate / self.files_count, 1))
+        return ExcludeNode(positive, excluded, estimate)
+
+    @staticmethod
+    def flatten(nodes: list[PlanNode], node_type: type) -> list[PlanNode]:
+        flat = []
+        for node in nodes:
+            if isinstance(node, node_type):
+                flat.extend(node.children)
+            else:
+                flat.append(node)
+        return flat
+
+    @staticmethod
+    def deduplicate(nodes: list[PlanNode]) -> list[PlanNode]:
+        unique = {}
+        for node in nodes:
+            if node.key not in unique:
+                unique[node.key] = node
+        return list(unique.values())
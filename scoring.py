@@ -0,0 +1,112 @@
+import math
+import typing
+
+import numpy as np
+
+
+class Scorer:
+    """
+    ранжирует найденные файлы: оценки всех кандидатов считаются разом операциями NumPy
+    над массивами doc_id и количеств вхождений слов запроса
+    """
+    NAME = ''
+
+    def rank(self, folder_index, querry: str, search_result, k: int = None,
+             offset: int = 0) -> list[tuple[str, float]]:
+        """
+        :param folder_index: folder_index.FolderIndex
+        :param search_result: folder_index.SearchResult
+        :param k: сколько лучших файлов вернуть (None - все)
+        :param offset: сколько лучших файлов пропустить
+        :return: [(файл, оценка), ...] по убыванию оценки, при равной оценке - в порядке doc_id
+        """
+        filepaths = search_result.filepaths
+        return [(filepaths[doc_id], score)
+                for doc_id, score in self.rank_doc_ids(folder_index, querry, search_result.postings, k, offset)]
+
+    def rank_doc_ids(self, folder_index, querry: str, postings, k: int = None,
+                     offset: int = 0) -> list[tuple[int, float]]:
+        """то же, что rank, но по postings.Postings и с doc_id вместо путей: [(doc_id, оценка), ...]"""
+        if k is not None and k <= 0: return []
+        doc_ids = np.array(postings.doc_ids)
+        words_list = folder_index.tf_idf_index.get_words_list(querry)
+        scores = self.score(folder_index, words_list, doc_ids)
+        order = self.get_order(scores, k, offset)
+        return list(zip(doc_ids[order].tolist(), scores[order].tolist()))
+
+    def score(self, folder_index, words_list: list[str], doc_ids: np.ndarray) -> np.ndarray:
+        """:return: оценки файлов doc_ids"""
+        raise NotImplementedError()
+
+    @staticmethod
+    def get_order(scores: np.ndarray, k: typing.Optional[int], offset: int) -> np.ndarray:
+        """:return: позиции оценок по убыванию (устойчиво), с offset по offset + k"""
+        if k is None:
+            return np.argsort(-scores, kind='stable')[offset:]
+        needed = offset + k
+        if needed < len(scores):
+            # все файлы с оценкой не ниже needed-й по величине, включая всех равных ей
+            threshold = np.partition(scores, len(scores) - needed)[len(scores) - needed]
+            selected = np.flatnonzero(scores >= threshold)
+        else:
+            selected = np.arange(len(scores))
+        return selected[np.argsort(-scores[selected], kind='stable')][offset:needed]
+
+    @staticmethod
+    def get_counts(folder_index, word: str, doc_ids: np.ndarray) -> np.ndarray:
+        """:return: количество вхождений слова в каждый из файлов doc_ids"""
+        term_doc_ids, term_counts = (np.array(arr) for arr in folder_index.get_term_counts(word))
+        if len(term_doc_ids) == 0:
+            return np.zeros(len(doc_ids), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(term_doc_ids, doc_ids), len(term_doc_ids) - 1)
+        return np.where(term_doc_ids[positions] == doc_ids, term_counts[positions], 0).astype(np.int64)
+
+
+class TfIdfScorer(Scorer):
+    """сумма tf * idf по словам запроса, совпадает с TfIdfIndex.get_tf_idf"""
+    NAME = 'TF-IDF'
+
+    def score(self, folder_index, words_list: list[str], doc_ids: np.ndarray) -> np.ndarray:
+        tf_idf_index = folder_index.tf_idf_index
+        scores = np.zeros(len(doc_ids))
+        counts_by_word = {}
+        # слова складываются в том же порядке, что и в TfIdfIndex.get_tf_idf, чтобы совпадать до последнего бита
+        for word in words_list:
+            if tf_idf_index.get_df(word) == 0:
+                continue
+            if word not in counts_by_word:
+                counts_by_word[word] = self.get_counts(folder_index, word, doc_ids)
+            scores += counts_by_word[word] * tf_idf_index.get_idf(word)
+        return scores
+
+
+class Bm25Scorer(Scorer):
+    """Okapi BM25, длины файлов - количество слов в них (FolderIndex.doc_lengths)"""
+    NAME = 'BM25'
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, folder_index, words_list: list[str], doc_ids: np.ndarray) -> np.ndarray:
+        tf_idf_index = folder_index.tf_idf_index
+        scores = np.zeros(len(doc_ids))
+        files_count = tf_idf_index.get_files_count()
+        if files_count == 0 or len(doc_ids) == 0:
+            return scores
+
+        lengths = np.array(folder_index.get_doc_lengths())
+        average_length = folder_index.get_average_doc_length()
+        norms = self.k1 * (1 - self.b + self.b * lengths[doc_ids] / average_length)
+
+        counts_by_word = {}
+        for word in words_list:
+            df = tf_idf_index.get_df(word)
+            if df == 0:
+                continue
+            if word not in counts_by_word:
+                counts_by_word[word] = self.get_counts(folder_index, word, doc_ids)
+            counts = counts_by_word[word]
+            idf = math.log(1 + (files_count - df + 0.5) / (df + 0.5))
+            scores += idf * counts * (self.k1 + 1) / (counts + norms)
+        return scores
@@ -0,0 +1,245 @@
+import argparse
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+import typing
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from analyzer import Analyzer
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+from segmented_index import SegmentedIndex
+from sharded_index import ShardedIndex
+
+
+class RequestStats:
+    """количество запросов, ошибок и задержки последних MAX_LATENCIES запросов поиска (потокобезопасно)"""
+    MAX_LATENCIES = 10000
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.latencies: collections.deque[float] = collections.deque(maxlen=self.MAX_LATENCIES)
+        self.lock = threading.Lock()
+
+    def add(self, latency: float, error: bool = False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.latencies.append(latency)
+
+    def get_stats(self) -> dict[str, typing.Any]:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            requests, errors = self.requests, self.errors
+        uptime = time.perf_counter() - self.started
+        return {
+            'requests': requests,
+            'errors': errors,
+            'uptime_s': round(uptime, 3),
+            'requests_per_s': round(requests / uptime, 3) if uptime > 0 else 0,
+            'latency_ms': {name: round(self.percentile(latencies, q) * 1000, 3)
+                           for name, q in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1)]},
+        }
+
+    @staticmethod
+    def percentile(sorted_values: list[float], q: float) -> float:
+        if len(sorted_values) == 0:
+            return 0
+        return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class FoogleHTTPServer(ThreadingHTTPServer):
+    # очередь соединений по умолчанию (5) переполняется уже при десятке одновременных клиентов,
+    # и лишние соединения ждут повторной отправки SYN около секунды
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class SearchServer:
+    """
+    держит индекс загруженным и отвечает на запросы по HTTP (ThreadingHTTPServer, поток на соединение):
+    - GET  /search?q=...&k=10&offset=0&snippets=1 - результаты в JSON: файлы, оценки, вхождения и сниппеты
+    - POST /reload {"index": путь} | {"folder": путь, "analyzer": набор из Analyzer.PRESETS} -
+      загружает новый индекс и подменяет им текущий
+    - GET  /stats - счетчики и задержки запросов, статистика кешей
+    новый индекс загружается, пока запросы обслуживаются старым; запросы, начатые до подмены,
+    дорабатывают со старым Foogle, следующие идут в новый
+    """
+    DEFAULT_K = 10
+
+    def __init__(self, foogle: Foogle, host: str = '127.0.0.1', port: int = 8080, workers: int = 1):
+        """:param workers: количество процессов для построения индекса папки и запросов к шардам при /reload"""
+        self.foogle = foogle
+        self.workers = workers
+        self.stats = RequestStats()
+        # перезагрузки идут по одной, поиск не блокируют
+        self.reload_lock = threading.Lock()
+        self.http_server = FoogleHTTPServer((host, port), self.make_handler())
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.http_server.server_address[:2]
+
+    def serve_forever(self):
+        self.http_server.serve_forever()
+
+    def shutdown(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def search(self, params: dict[str, str]) -> dict[str, typing.Any]:
+        querry = params.get('q', '')
+        if querry.strip() == '':
+            raise ValueError('пустой запрос')
+        k = int(params.get('k', self.DEFAULT_K))
+        offset = int(params.get('offset', 0))
+        if k < 0 or offset < 0:
+            raise ValueError(f'k и offset не могут быть отрицательными: k={k}, offset={offset}')
+        with_snippets = params.get('snippets', '0') not in ('0', 'false', '')
+
+        foogle = self.foogle
+        result, filepaths_with_score = foogle.search(querry, k, offset)
+        results = []
+        for filepath, score in filepaths_with_score:
+            entries = result[filepath]
+            shown_entries = list(itertools.islice(entries, foogle.snippets_per_file))
+            item = {
+                'path': filepath,
+                'score': score,
+                'entries_count': len(entries),
+                'entries': [{'offset': entry.offset, 'line': entry.line, 'length': entry.length}
+                            for entry in shown_entries],
+            }
+            if with_snippets:
+                item['snippets'] = [self.make_snippet(foogle, result.folder_index, filepath, entry)
+                                    for entry in shown_entries]
+            results.append(item)
+        return {'query': querry, 'total': len(result.postings), 'results': results}
+
+    @staticmethod
+    def make_snippet(foogle: Foogle, folder_index, filepath: str, entry) -> dict[str, typing.Any]:
+        """:param folder_index: индекс, по которому выполнен поиск (SearchResult.folder_index)"""
+        before, word, after = foogle.cut_snippet(filepath, entry, folder_index=folder_index)
+        return {'line': entry.line, 'text': before + word + after,
+                'highlight': [len(before), len(before) + len(word)]}
+
+    def reload(self, params: dict[str, str]) -> dict[str, typing.Any]:
+        with self.reload_lock:
+            if 'index' in params:
+                index = self.load_index(params['index'], self.workers)
+            elif 'folder' in params:
+                analyzer = Analyzer.of(params.get('analyzer', 'raw'))
+                index = FolderIndexer(self.workers, analyzer=analyzer).index_folder(params['folder'])
+            else:
+                raise ValueError('нужен путь к индексу ("index") или к папке ("folder")')
+            old = self.foogle
+            # ссылка на Foogle подменяется одним присваиванием, старый индекс закроется сборщиком мусора,
+            # когда его дочитают начатые до подмены запросы
+            self.foogle = Foogle(index=index, snippets_per_file=old.snippets_per_file, scorer=old.scorer,
+                                 max_expansions=old.max_expansions)
+        return {'files': self.foogle.folder_index.get_docs_count()}
+
+    @staticmethod
+    def load_index(path: str, workers: int = 1):
+        """файл индекса (FolderIndexSaveloader), папка сегментов (SegmentedIndex) или папка шардов (ShardedIndex)"""
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, SegmentedIndex.MANIFEST_NAME)):
+            return SegmentedIndex(path)
+        if os.path.isdir(path):
+            return ShardedIndex.load(path, workers)
+        return FolderIndexSaveloader.load(path)
+
+    def get_stats(self) -> dict[str, typing.Any]:
+        return {'requests': self.stats.get_stats(), 'cache': self.foogle.get_cache_stats(),
+                'files': self.foogle.folder_index.get_docs_count()}
+
+    def make_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                if url.path == '/search':
+                    self.respond_timed(server.search, params)
+                elif url.path == '/stats':
+                    self.respond(200, server.get_stats())
+                else:
+                    self.respond(404, {'error': f'неизвестный путь {url.path}'})
+
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if url.path != '/reload':
+                    self.respond(404, {'error': f'неизвестный путь {url.path}'})
+                    return
+                try:
+                    params = json.loads(body) if body else {}
+                except ValueError as e:
+                    self.respond(400, {'error': f'тело запроса не JSON: {e}'})
+                    return
+                self.respond_timed(server.reload, params, record=False)
+
+            def respond_timed(self, handle, params: dict[str, str], record: bool = True):
+                start = time.perf_counter()
+                try:
+                    response, status = handle(params), 200
+                except (ValueError, OSError) as e:
+                    response, status = {'error': str(e)}, 400
+                except Exception as e:
+                    # например, RecursionError на запросе с сотнями уровней чередования AND и OR:
+                    # планировщик и поиск рекурсивны по плану
+                    response, status = {'error': f'внутренняя ошибка: {type(e).__name__}: {e}'}, 500
+                latency = time.perf_counter() - start
+                if record:
+                    server.stats.add(latency, error=status != 200)
+                response['took_ms'] = round(latency * 1000, 3)
+                self.respond(status, response)
+
+            def respond(self, status: int, response: dict):
+                body = json.dumps(response, ensure_ascii=False).encode('utf8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # журнал каждого запроса в stderr замедляет сервер под нагрузкой
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='поисковый сервер Foogle')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--index', help='файл индекса, папка сегментов или папка шардов')
+    source.add_argument('--folder', help='папка, которую проиндексировать при запуске')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--analyzer', choices=Analyzer.PRESETS, default='raw', help='нормализация слов для --folder')
+    args = parser.parse_args()
+
+    if args.index is not None:
+        index = SearchServer.load_index(args.index, args.workers)
+    else:
+        index = FolderIndexer(args.workers, analyzer=Analyzer.of(args.analyzer)).index_folder(args.folder)
+    server = SearchServer(Foogle(index=index), args.host, args.port, args.workers)
+    print(f'Foogle слушает http://{server.address[0]}:{server.address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
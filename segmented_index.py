@@ -0,0 +1,435 @@
+import json
+import math
+import os
+import threading
+import typing
+from array import array
+
+from analyzer import Analyzer
+from folder_index import FileStat, FolderIndex, FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
+from if_idf import TfIdfIndex
+from postings import Postings
+from sharded_index import ShardedFilepaths
+
+
+class Segment:
+    """неизменяемый сегмент: файл индекса и doc_id (в сегменте) удаленных из него файлов"""
+    __slots__ = ('name', 'index', 'deleted')
+
+    def __init__(self, name: str, index: MappedFolderIndex, deleted: frozenset[int] = frozenset()):
+        self.name = name
+        self.index = index
+        self.deleted = deleted
+
+    def with_deleted(self, doc_ids: typing.Iterable[int]) -> 'Segment':
+        return Segment(self.name, self.index, self.deleted | frozenset(doc_ids))
+
+    def find(self, filepath: str) -> typing.Optional[int]:
+        """:return: doc_id файла в сегменте или None, если его там нет или он удален"""
+        doc_id = self.index.doc_ids.get(filepath)
+        return doc_id if doc_id is not None and doc_id not in self.deleted else None
+
+    def get_live_count(self) -> int:
+        return len(self.index.filepaths) - len(self.deleted)
+
+
+class SnapshotMapping(typing.Mapping[str, typing.Any]):
+    """{файл: значение} живых файлов снимка - отображение attribute сегмента, где лежит файл (encodings, ...)"""
+
+    def __init__(self, snapshot: 'IndexSnapshot', attribute: str):
+        self.snapshot = snapshot
+        self.attribute = attribute
+
+    def __getitem__(self, filepath: str):
+        for segment in self.snapshot.segments:
+            if segment.find(filepath) is not None:
+                return getattr(segment.index, self.attribute)[filepath]
+        raise KeyError(filepath)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for segment in self.snapshot.segments:
+            for filepath in getattr(segment.index, self.attribute):
+                if segment.find(filepath) is not None:
+                    yield filepath
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SnapshotTfIdfIndex(TfIdfIndex):
+    """df и количество файлов снимка без удаленных файлов, так что idf совпадает с индексом только живых файлов"""
+
+    def __init__(self, snapshot: 'IndexSnapshot'):
+        super().__init__(snapshot.analyzer)
+        self.snapshot = snapshot
+
+    def get_idf(self, word: str) -> float:
+        df = self.get_df(word)
+        if df == 0:
+            return 0
+        return math.log(self.get_files_count() / df)
+
+    def get_df(self, word: str) -> int:
+        return self.snapshot.get_doc_frequency(word)
+
+    def get_files_count(self) -> int:
+        return self.snapshot.files_with_words_count
+
+
+class IndexSnapshot:
+    """
+    неизменяемое состояние SegmentedIndex на момент commit: сегменты и удаленные из них файлы.
+    doc_id - как в ShardedIndex: doc_id в сегменте, сдвинутый на количество файлов в сегментах перед ним
+    (удаленные файлы тоже занимают doc_id, но ни в одном списке не встречаются).
+    снимок - FolderIndex только для чтения: то, что нужно QueryPlanner, ExpressionSearcher, Scorer и Foogle
+    """
+
+    def __init__(self, segments: tuple[Segment, ...], generation: int, analyzer: Analyzer):
+        self.segments = segments
+        self.analyzer = analyzer
+        self.generation = generation
+        self.shifts = []
+        shift = 0
+        deleted = []
+        for segment in segments:
+            self.shifts.append(shift)
+            deleted.extend(doc_id + shift for doc_id in sorted(segment.deleted))
+            shift += len(segment.index.filepaths)
+        self.deleted = Postings.of_doc_ids(array('I', deleted))
+
+        self.filepaths = ShardedFilepaths([segment.index for segment in segments], self.shifts)
+        self.encodings = SnapshotMapping(self, 'encodings')
+        self.file_stats = SnapshotMapping(self, 'file_stats')
+        self.line_starts = SnapshotMapping(self, 'line_starts')
+        self.tf_idf_index = SnapshotTfIdfIndex(self)
+        self.files_with_words_count = sum(
+            segment.index.tf_idf_index.get_files_count()
+            - sum(1 for doc_id in segment.deleted if segment.index.get_doc_lengths()[doc_id] > 0)
+            for segment in segments)
+        self.doc_lengths = None
+        # df слов, в которых пришлось считать удаленные файлы
+        self.df_by_word: dict[str, int] = {}
+
+    def __getitem__(self, word: str) -> Postings:
+        postings = Postings()
+        for segment, shift in zip(self.segments, self.shifts):
+            postings.extend(segment.index[word], shift)
+        if len(self.deleted) == 0:
+            return postings
+        return Postings.exclude(postings, [self.deleted])
+
+    def get_term_counts(self, word: str) -> tuple[array, array]:
+        doc_ids, counts = array('I'), array('I')
+        for segment, shift in zip(self.segments, self.shifts):
+            segment_doc_ids, segment_counts = segment.index.get_term_counts(word)
+            if not segment.deleted:
+                doc_ids.extend(doc_id + shift for doc_id in segment_doc_ids)
+                counts.extend(segment_counts)
+                continue
+            for doc_id, count in zip(segment_doc_ids, segment_counts):
+                if doc_id not in segment.deleted:
+                    doc_ids.append(doc_id + shift)
+                    counts.append(count)
+        return doc_ids, counts
+
+    def get_term_doc_ids(self, word: str) -> array:
+        return self.get_term_counts(word)[0]
+
+    def get_doc_frequency(self, word: str) -> int:
+        # без удаленных файлов df - сумма df сегментов из словарей, блоки вхождений не читаются
+        if not any(segment.deleted for segment in self.segments):
+            return sum(segment.index.get_doc_frequency(word) for segment in self.segments)
+        df = self.df_by_word.get(word)
+        if df is None:
+            df = len(self.get_term_doc_ids(word))
+            self.df_by_word[word] = df
+        return df
+
+    def expand_terms(self, pattern: str, max_expansions: int) -> list[str]:
+        """слова всех сегментов, подходящие под шаблон (слово могло остаться только в удаленных файлах)"""
+        terms = sorted(set().union(*(segment.index.expand_terms(pattern, max_expansions)
+                                     for segment in self.segments)))
+        if len(terms) > max_expansions:
+            raise ValueError(f'шаблон {pattern} подходит больше чем к {max_expansions} словам')
+        return terms
+
+    def get_docs_count(self) -> int:
+        return sum(segment.get_live_count() for segment in self.segments)
+
+    def get_doc_lengths(self) -> array:
+        """длины файлов по doc_id, у удаленных - 0"""
+        if self.doc_lengths is None:
+            doc_lengths = array('I')
+            for segment in self.segments:
+                doc_lengths.extend(segment.index.get_doc_lengths())
+            for doc_id in self.deleted.doc_ids:
+                doc_lengths[doc_id] = 0
+            self.doc_lengths = doc_lengths
+        return self.doc_lengths
+
+    def get_average_doc_length(self) -> float:
+        files_count = self.tf_idf_index.get_files_count()
+        return sum(self.get_doc_lengths()) / files_count if files_count > 0 else 0
+
+    def locate(self, filepath: str) -> typing.Optional[tuple[int, int]]:
+        """:return: (номер сегмента, doc_id в сегменте) живого файла или None"""
+        for segment_no, segment in enumerate(self.segments):
+            doc_id = segment.find(filepath)
+            if doc_id is not None:
+                return segment_no, doc_id
+        return None
+
+
+class SegmentedIndex:
+    """
+    индекс для поиска во время обновлений: неизменяемые сегменты (файлы индекса в directory), буфер записи
+    (FolderIndex в памяти) и удаленные файлы сегментов (tombstones).
+    - add_file и remove_file меняют только буфер и список файлов на удаление, поиск их не видит;
+    - commit сохраняет буфер новым сегментом, помечает удаленные файлы и публикует новый снимок (IndexSnapshot)
+      одним присваиванием. запрос берет снимок один раз (snapshot) и до конца работает с ним, так что видит
+      либо все изменения commit, либо ни одного, а снимок не меняется, пока его читают;
+    - мелкие соседние сегменты сливаются (merge) в фоновом потоке: сливаемые сегменты читаются в память,
+      удаленные файлы выбрасываются, результат сохраняется новым сегментом на их место, и публикуется снимок
+      с ним. файлы, удаленные за время слияния, переносятся в новый сегмент.
+    изменения (add_file, remove_file, commit и подмена сегментов после слияния) идут под одной блокировкой,
+    поиск блокировок не берет. список сегментов и удаленные файлы хранятся в манифесте, так что индекс
+    открывается заново из той же папки (буфер, не попавший в commit, теряется). анализатор индекса тоже
+    записан в манифесте: все сегменты строятся с ним, и открыть папку с другим анализатором нельзя
+    """
+    MANIFEST_NAME = 'segments.json'
+
+    def __init__(self, directory: str, max_buffered_files: int = 1000, merge_factor: int = 4,
+                 max_merge_files: int = 10000, background_merge: bool = True, analyzer: Analyzer = None):
+        """
+        :param max_buffered_files: при таком количестве файлов в буфере commit делается сам
+        :param merge_factor: сколько подряд идущих мелких сегментов набирается для слияния
+        :param max_merge_files: сегмент мелкий, если в нем не больше стольких живых файлов
+        :param background_merge: сливать сегменты в фоновом потоке после commit, False - только вызовом merge
+        :param analyzer: анализатор нового индекса, None - как в манифесте (или без шагов, если индекса еще нет)
+        """
+        if merge_factor < 2: raise ValueError(f'сливать можно хотя бы 2 сегмента, а не {merge_factor}')
+        self.directory = directory
+        self.max_buffered_files = max_buffered_files
+        self.merge_factor = merge_factor
+        self.max_merge_files = max_merge_files
+        self.background_merge = background_merge
+        # файлы сегментов, которые commit пометит удаленными
+        self.pending_deletes: set[str] = set()
+        self.lock = threading.Lock()
+        # слияния идут по одному
+        self.merge_lock = threading.Lock()
+        self.merge_thread: typing.Optional[threading.Thread] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.next_segment_no = 0
+        segments = []
+        manifest_path = os.path.join(directory, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf8') as f:
+                manifest = json.load(f)
+            self.next_segment_no = manifest['next_segment_no']
+            stored_analyzer = Analyzer.from_config(manifest.get('analyzer', {}))
+            if analyzer is not None and analyzer != stored_analyzer:
+                raise ValueError(f'индекс в {directory} построен с {stored_analyzer}, а не {analyzer}')
+            analyzer = stored_analyzer
+            segments = [Segment(item['name'], self.open_segment(item['name']), frozenset(item['deleted']))
+                        for item in manifest['segments']]
+        self.analyzer = analyzer if analyzer is not None else Analyzer()
+        self.indexer = FolderIndexer(analyzer=self.analyzer)
+        self.buffer = FolderIndex(self.analyzer)
+        self.current = IndexSnapshot(tuple(segments), 0, self.analyzer)
+
+    def snapshot(self) -> IndexSnapshot:
+        """:return: последний опубликованный снимок, он не меняется"""
+        return self.current
+
+    @property
+    def generation(self) -> int:
+        return self.current.generation
+
+    def get_docs_count(self) -> int:
+        return self.current.get_docs_count()
+
+    def add_file(self, filepath: str):
+        """индексирует файл в буфер. если файл уже есть в индексе, после commit останется только новая версия"""
+        with self.lock:
+            self.remove_file_locked(filepath)
+            self.indexer.index_file(self.buffer, filepath)
+            if len(self.buffer.doc_ids) >= self.max_buffered_files:
+                self.commit_locked()
+
+    def remove_file(self, filepath: str):
+        with self.lock:
+            self.remove_file_locked(filepath)
+
+    def remove_file_locked(self, filepath: str):
+        self.buffer.remove_file(filepath)
+        if self.current.locate(filepath) is not None:
+            self.pending_deletes.add(filepath)
+
+    def update(self, folderpath: str) -> tuple[list[str], list[str], list[str]]:
+        """
+        добавляет новые и измененные файлы папки, удаляет удаленные и делает commit
+        (изменения определяются так же, как в FolderIndexer.update_folder: при изменившихся размере или mtime
+        сравнивается хеш содержимого). сегменты не перезаписываются, так что файл с новым mtime, но прежним
+        содержимым не переиндексируется, но хешируется заново при каждом update
+        :return: (новые, измененные, удаленные) файлы
+        """
+        snapshot = self.current
+        filepaths = list(self.indexer.iter_filepaths(folderpath))
+        present_filepaths = set(filepaths)
+        deleted = [filepath for filepath in snapshot.encodings
+                   if filepath.startswith(folderpath + '/') and filepath not in present_filepaths]
+        added, changed = [], []
+        for filepath in filepaths:
+            old_stat = snapshot.file_stats.get(filepath)
+            if old_stat is None:
+                (changed if filepath in snapshot.encodings else added).append(filepath)
+            elif not old_stat.is_same_stat(os.stat(filepath)) \
+                    and FileStat.of(filepath).content_hash != old_stat.content_hash:
+                changed.append(filepath)
+
+        for filepath in deleted:
+            self.remove_file(filepath)
+        for filepath in added + changed:
+            self.add_file(filepath)
+        self.commit()
+        return added, changed, deleted
+
+    def commit(self):
+        with self.lock:
+            self.commit_locked()
+
+    def commit_locked(self):
+        segments = list(self.current.segments)
+        deleted_by_segment: dict[int, list[int]] = {}
+        for filepath in self.pending_deletes:
+            location = self.current.locate(filepath)
+            if location is not None:
+                deleted_by_segment.setdefault(location[0], []).append(location[1])
+        for segment_no, doc_ids in deleted_by_segment.items():
+            segments[segment_no] = segments[segment_no].with_deleted(doc_ids)
+        if len(self.buffer.doc_ids) > 0:
+            name = self.make_segment_name()
+            FolderIndexSaveloader.save(os.path.join(self.directory, name), self.buffer)
+            segments.append(Segment(name, self.open_segment(name)))
+        self.buffer = FolderIndex(self.analyzer)
+        self.pending_deletes = set()
+        if not deleted_by_segment and len(segments) == len(self.current.segments):
+            return
+        self.publish(segments)
+        if self.background_merge:
+            self.start_background_merge()
+
+    def merge(self) -> bool:
+        """
+        сливает одну группу мелких сегментов (см. select_merge)
+        :return: было ли что сливать
+        """
+        with self.merge_lock:
+            snapshot = self.current
+            group = self.select_merge(snapshot.segments)
+            if group is None:
+                return False
+            start, end = group
+            sources = snapshot.segments[start:end]
+            merged = FolderIndex(self.analyzer)
+            for source in sources:
+                folder_index = source.index.to_folder_index()
+                for doc_id in source.deleted:
+                    folder_index.remove_file(folder_index.filepaths[doc_id])
+                merged.merge(folder_index)
+            with self.lock:
+                name = self.make_segment_name()
+            FolderIndexSaveloader.save(os.path.join(self.directory, name), merged)
+            segment = Segment(name, self.open_segment(name))
+
+            with self.lock:
+                # пока шло слияние, из сливаемых сегментов могли удалить файлы (или удалить сегмент целиком)
+                current_by_name = {current.name: current for current in self.current.segments}
+                deleted = []
+                for source in sources:
+                    current = current_by_name.get(source.name)
+                    doc_ids = range(len(source.index.filepaths)) if current is None else current.deleted
+                    deleted.extend(segment.index.doc_ids[source.index.filepaths[doc_id]]
+                                   for doc_id in doc_ids if doc_id not in source.deleted)
+                if deleted:
+                    segment = segment.with_deleted(deleted)
+                source_names = {source.name for source in sources}
+                segments = []
+                for current in self.current.segments:
+                    if current.name not in source_names:
+                        segments.append(current)
+                    elif segment is not None:
+                        # новый сегмент встает на место сливаемых, порядок файлов не меняется
+                        segments.append(segment)
+                        segment = None
+                self.publish(segments)
+            for source_name in source_names:
+                self.remove_segment_file(source_name)
+            if segment is not None:
+                # все сливаемые сегменты удалены целиком, новый не понадобился
+                self.remove_segment_file(name)
+            return True
+
+    def select_merge(self, segments: tuple[Segment, ...]) -> typing.Optional[tuple[int, int]]:
+        """:return: [start, end) первой серии из хотя бы merge_factor подряд идущих мелких сегментов или None"""
+        start = 0
+        for end in range(len(segments) + 1):
+            if end < len(segments) and segments[end].get_live_count() <= self.max_merge_files:
+                continue
+            if end - start >= self.merge_factor:
+                return start, end
+            start = end + 1
+        return None
+
+    def start_background_merge(self):
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            return
+        self.merge_thread = threading.Thread(target=self.merge_all, daemon=True)
+        self.merge_thread.start()
+
+    def merge_all(self):
+        while self.merge():
+            pass
+
+    def wait_for_merges(self):
+        thread = self.merge_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.wait_for_merges()
+
+    def publish(self, segments: list[Segment]):
+        """сохраняет манифест и подменяет снимок (под self.lock). полностью удаленные сегменты выбрасываются"""
+        live_segments = []
+        for segment in segments:
+            if segment.get_live_count() > 0:
+                live_segments.append(segment)
+            else:
+                self.remove_segment_file(segment.name)
+        manifest = {'next_segment_no': self.next_segment_no, 'analyzer': self.analyzer.get_config(),
+                    'segments': [{'name': segment.name, 'deleted': sorted(segment.deleted)}
+                                 for segment in live_segments]}
+        manifest_path = os.path.join(self.directory, self.MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='utf8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self.current = IndexSnapshot(tuple(live_segments), self.current.generation + 1, self.analyzer)
+
+    def remove_segment_file(self, name: str):
+        # открытые снимки дочитывают удаленный файл через mmap. сегмент, удаленный целиком во время
+        # слияния, удаляется и при публикации, и после слияния
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def make_segment_name(self) -> str:
+        name = f'segment-{self.next_segment_no}.idx'
+        self.next_segment_no += 1
+        return name
+
+    def open_segment(self, name: str) -> MappedFolderIndex:
+        return FolderIndexSaveloader.load(os.path.join(self.directory, name))
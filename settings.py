@@ -2,5 +2,11 @@ AND_TERM = '&'
 OR_TERM = '|'
 EXCLUSION_TERM = '\\'
 LOGIC_TERMS = {AND_TERM, OR_TERM, EXCLUSION_TERM}
+# "слово слово ..." - фраза, слово NEAR/k слово - слова не дальше k слов друг от друга (запрос после casefold)
+PHRASE_QUOTE = '"'
+NEAR_TERM = 'near/'
+NEAR_REGEX = r'near/(\d+)'
+# шифр* - любое слово, начинающееся с "шифр", ш*фр - с "ш" в начале и "фр" в конце
+WILDCARD = '*'
 
 WORD_REGEX = r'\S+'
@@ -0,0 +1,315 @@
+import bisect
+import functools
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import typing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from analyzer import Analyzer
+from folder_index import SearchResult, FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
+from if_idf import TfIdfIndex
+from index_storage import IndexFileReader
+from postings import Postings
+from query_planner import PlanNode
+
+
+class GlobalTfIdfIndex(TfIdfIndex):
+    """
+    df слов запроса, количество файлов и средняя длина файла по всем шардам -
+    передается в воркеры, чтобы шард ранжировал свои файлы так же, как нешардированный индекс
+    """
+
+    def __init__(self, files_count: int, df_by_word: dict[str, int], average_doc_length: float,
+                 analyzer: Analyzer = None):
+        super().__init__(analyzer)
+        self.files_count = files_count
+        self.df_by_word = df_by_word
+        self.average_doc_length = average_doc_length
+
+    def get_idf(self, word: str) -> float:
+        df = self.get_df(word)
+        if df == 0:
+            return 0
+        return math.log(self.files_count / df)
+
+    def get_df(self, word: str) -> int:
+        return self.df_by_word.get(word, 0)
+
+    def get_files_count(self) -> int:
+        return self.files_count
+
+
+class ShardedTfIdfIndex(TfIdfIndex):
+    """df и количество файлов - суммы по шардам (шарды не пересекаются по файлам), анализатор - общий у шардов"""
+
+    def __init__(self, shards: list[MappedFolderIndex]):
+        super().__init__(shards[0].tf_idf_index.analyzer if shards else None)
+        self.shards = shards
+
+    def get_idf(self, word: str) -> float:
+        df = self.get_df(word)
+        if df == 0:
+            return 0
+        return math.log(self.get_files_count() / df)
+
+    def get_df(self, word: str) -> int:
+        return sum(shard.get_doc_frequency(word) for shard in self.shards)
+
+    def get_files_count(self) -> int:
+        return sum(shard.tf_idf_index.get_files_count() for shard in self.shards)
+
+
+class ShardView:
+    """шард с глобальной статистикой вместо своей: то, что нужно ExpressionSearcher и Scorer в воркере"""
+
+    def __init__(self, shard: MappedFolderIndex, tf_idf_index: GlobalTfIdfIndex):
+        self.shard = shard
+        self.tf_idf_index = tf_idf_index
+
+    def get_average_doc_length(self) -> float:
+        return self.tf_idf_index.average_doc_length
+
+    def __getattr__(self, name):
+        return getattr(self.shard, name)
+
+    def __getitem__(self, word: str) -> Postings:
+        return self.shard[word]
+
+
+class ShardedFilepaths(typing.Sequence[str]):
+    """[путь к файлу по глобальному doc_id]: doc_id шарда сдвинут на количество файлов в шардах перед ним"""
+
+    def __init__(self, shards: list[MappedFolderIndex], shifts: list[int]):
+        self.shards = shards
+        self.shifts = shifts
+
+    def __getitem__(self, doc_id: int) -> str:
+        if not 0 <= doc_id < len(self):
+            raise IndexError(doc_id)
+        shard_no = bisect.bisect_right(self.shifts, doc_id) - 1
+        return self.shards[shard_no].filepaths[doc_id - self.shifts[shard_no]]
+
+    def __len__(self):
+        return self.shifts[-1] + len(self.shards[-1].filepaths) if self.shards else 0
+
+
+class ShardedMapping(typing.Mapping[str, typing.Any]):
+    """{файл: значение} - отображение attribute того шарда, в котором лежит файл (encodings, line_starts, ...)"""
+
+    def __init__(self, shards: list[MappedFolderIndex], attribute: str):
+        self.shards = shards
+        self.attribute = attribute
+
+    def __getitem__(self, filepath: str):
+        for shard in self.shards:
+            if filepath in shard.doc_ids:
+                return getattr(shard, self.attribute)[filepath]
+        raise KeyError(filepath)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for shard in self.shards:
+            yield from getattr(shard, self.attribute)
+
+    def __len__(self):
+        return sum(len(getattr(shard, self.attribute)) for shard in self.shards)
+
+
+# шарды, открытые в процессе-воркере пула запросов
+_worker_shards: list[MappedFolderIndex] = []
+
+
+def _open_shards(shard_paths: list[str]):
+    _worker_shards.extend(MappedFolderIndex(IndexFileReader(path)) for path in shard_paths)
+
+
+def _search_worker_shard(shard_no: int, plan: PlanNode, querry: str, scorer,
+                         tf_idf_index: GlobalTfIdfIndex, k: typing.Optional[int]):
+    return _search_shard(_worker_shards[shard_no], plan, querry, scorer, tf_idf_index, k)
+
+
+def _search_shard(shard: MappedFolderIndex, plan: PlanNode, querry: str, scorer,
+                  tf_idf_index: GlobalTfIdfIndex, k: typing.Optional[int]) -> tuple[Postings, list[tuple[int, float]]]:
+    """:return: (файлы шарда из результата без вхождений, k лучших файлов шарда [(doc_id шарда, оценка), ...])"""
+    # foogle импортирует этот модуль, поэтому ExpressionSearcher импортируется при первом запросе
+    from foogle import ExpressionSearcher
+    view = ShardView(shard, tf_idf_index)
+    result = ExpressionSearcher(view).search(plan)
+    return result.postings, scorer.rank_doc_ids(view, querry, result.postings, k)
+
+
+def _build_shard(filepaths: list[str], shard_path: str, analyzer: Analyzer):
+    """строит и сохраняет шард в процессе-воркере"""
+    FolderIndexSaveloader.save(shard_path, FolderIndexer(analyzer=analyzer).index_files(filepaths))
+
+
+class ShardedIndex:
+    """
+    индекс, разбитый по файлам на шарды - независимые файлы индекса (index_storage), и манифест со списком шардов.
+    шарды - подряд идущие куски списка файлов папки, поэтому глобальный doc_id (doc_id шарда, сдвинутый на
+    количество файлов в шардах перед ним) совпадает с doc_id нешардированного индекса.
+    запрос планируется по глобальным df, выполняется в каждом шарде (в пуле процессов, если workers > 1),
+    шард ранжирует свои файлы по глобальной статистике, а частичные результаты сливаются по doc_id,
+    так что результат и оценки совпадают с нешардированным индексом. из воркеров возвращаются только doc_id,
+    вхождения файла собираются в его шарде в текущем процессе, когда к ним обращаются.
+    индекс доступен только для чтения: generation всегда 0
+    """
+    MANIFEST_NAME = 'shards.json'
+
+    def __init__(self, shard_paths: list[str], workers: int = 1):
+        """:param workers: количество процессов для запросов, 1 - искать во всех шардах в текущем процессе"""
+        if workers < 1: raise ValueError(f'количество воркеров должно быть положительным, а не {workers}')
+        self.shard_paths = shard_paths
+        self.workers = workers
+        self.shards = [MappedFolderIndex(IndexFileReader(path)) for path in shard_paths]
+        self.shifts = []
+        shift = 0
+        for shard in self.shards:
+            self.shifts.append(shift)
+            shift += len(shard.filepaths)
+
+        self.filepaths = ShardedFilepaths(self.shards, self.shifts)
+        self.encodings = ShardedMapping(self.shards, 'encodings')
+        self.file_stats = ShardedMapping(self.shards, 'file_stats')
+        self.line_starts = ShardedMapping(self.shards, 'line_starts')
+        self.tf_idf_index = ShardedTfIdfIndex(self.shards)
+        self.generation = 0
+        self.average_doc_length = None
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, folderpath: str, directory: str, shards_count: int, workers: int = 1,
+              analyzer: Analyzer = None) -> 'ShardedIndex':
+        """
+        индексирует папку в shards_count шардов и сохраняет их с манифестом в directory.
+        каждый шард строится отдельно (в пуле процессов, если workers > 1), в памяти одновременно только
+        индексы шардов, которые строятся в данный момент. все шарды строятся с одним анализатором
+        """
+        analyzer = analyzer if analyzer is not None else Analyzer()
+        if shards_count < 1: raise ValueError(f'количество шардов должно быть положительным, а не {shards_count}')
+        os.makedirs(directory, exist_ok=True)
+        batches = cls.split_into_shards(list(FolderIndexer().iter_filepaths(folderpath)), shards_count)
+        names = [f'shard-{shard_no}.idx' for shard_no in range(len(batches))]
+        shard_paths = [os.path.join(directory, name) for name in names]
+        if workers == 1:
+            for batch, shard_path in zip(batches, shard_paths):
+                _build_shard(batch, shard_path, analyzer)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                list(executor.map(_build_shard, batches, shard_paths, itertools.repeat(analyzer)))
+        with open(os.path.join(directory, cls.MANIFEST_NAME), 'w', encoding='utf8') as f:
+            json.dump({'shards': names}, f, ensure_ascii=False)
+        return cls(shard_paths, workers)
+
+    @classmethod
+    def load(cls, directory: str, workers: int = 1) -> 'ShardedIndex':
+        with open(os.path.join(directory, cls.MANIFEST_NAME), encoding='utf8') as f:
+            names = json.load(f)['shards']
+        return cls([os.path.join(directory, name) for name in names], workers)
+
+    @staticmethod
+    def split_into_shards(filepaths: list[str], shards_count: int) -> list[list[str]]:
+        shards_count = max(min(len(filepaths), shards_count), 1)
+        shard_size, remainder = divmod(len(filepaths), shards_count)
+        shards = []
+        start = 0
+        for i in range(shards_count):
+            end = start + shard_size + (1 if i < remainder else 0)
+            shards.append(filepaths[start:end])
+            start = end
+        return shards
+
+    def search(self, plan: PlanNode, querry: str, scorer, k: int = None,
+               offset: int = 0) -> tuple[SearchResult, list[tuple[str, float]]]:
+        """
+        выполняет план во всех шардах и сливает результаты
+        :return: (результат, [(файл, оценка), ...] с offset по offset + k по убыванию оценки)
+        """
+        if k is not None and k <= 0:
+            needed = 0
+        else:
+            needed = offset + k if k is not None else None
+        tf_idf_index = self.get_global_tf_idf_index(querry)
+        if self.workers == 1:
+            partial_results = [_search_shard(shard, plan, querry, scorer, tf_idf_index, needed)
+                               for shard in self.shards]
+        else:
+            executor = self.get_executor()
+            futures = [executor.submit(_search_worker_shard, shard_no, plan, querry, scorer, tf_idf_index, needed)
+                       for shard_no in range(len(self.shards))]
+            partial_results = [future.result() for future in futures]
+
+        postings = Postings.of_doc_ids()
+        rankings = []
+        for shift, (partial_postings, ranking) in zip(self.shifts, partial_results):
+            postings.extend(partial_postings, shift)
+            rankings.append([(-score, doc_id + shift) for doc_id, score in ranking])
+        # внутри шарда файлы уже упорядочены по (-оценка, doc_id), так что хватает слияния
+        merged = heapq.merge(*rankings)
+        ranking = [(self.filepaths[doc_id], -score) for score, doc_id in merged][offset:needed]
+        # ExpressionSearcher создается один на шард на весь результат, а не на каждый показанный файл
+        searchers = {}
+        return SearchResult(postings, self.filepaths, functools.partial(self.get_entries, plan, searchers)), ranking
+
+    def get_entries(self, plan: PlanNode, searchers: dict, doc_id: int):
+        """
+        :param searchers: {номер шарда: ExpressionSearcher} результата, недостающие создаются
+        :return: вхождения, которыми файл с глобальным doc_id удовлетворяет плану
+        """
+        from foogle import ExpressionSearcher
+        shard_no = bisect.bisect_right(self.shifts, doc_id) - 1
+        if shard_no not in searchers:
+            searchers[shard_no] = ExpressionSearcher(self.shards[shard_no])
+        return searchers[shard_no].get_entries(plan, doc_id - self.shifts[shard_no])
+
+    def get_global_tf_idf_index(self, querry: str) -> GlobalTfIdfIndex:
+        words = self.tf_idf_index.get_words_list(querry)
+        return GlobalTfIdfIndex(self.tf_idf_index.get_files_count(),
+                                {word: self.tf_idf_index.get_df(word) for word in set(words)},
+                                self.get_average_doc_length(), self.tf_idf_index.analyzer)
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        # каждый воркер открывает все шарды один раз и дальше отвечает на запросы к любому из них
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.workers, initializer=_open_shards,
+                                                    initargs=(self.shard_paths,))
+            return self.executor
+
+    def get_doc_frequency(self, word: str) -> int:
+        return self.tf_idf_index.get_df(word)
+
+    def expand_terms(self, pattern: str, max_expansions: int) -> list[str]:
+        """слова всех шардов, подходящие под шаблон (см. TermDictionary.expand)"""
+        terms = sorted(set().union(*(shard.expand_terms(pattern, max_expansions) for shard in self.shards)))
+        if len(terms) > max_expansions:
+            raise ValueError(f'шаблон {pattern} подходит больше чем к {max_expansions} словам')
+        return terms
+
+    def get_docs_count(self) -> int:
+        return len(self.filepaths)
+
+    def get_average_doc_length(self) -> float:
+        if self.average_doc_length is None:
+            files_count = self.tf_idf_index.get_files_count()
+            total_length = sum(sum(shard.get_doc_lengths()) for shard in self.shards)
+            self.average_doc_length = total_length / files_count if files_count > 0 else 0
+        return self.average_doc_length
+
+    def get_doc_lengths(self) -> array:
+        lengths = array('I')
+        for shard in self.shards:
+            lengths.extend(shard.get_doc_lengths())
+        return lengths
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,268 @@
+class RussianStemmer:
+    """
+    стеммер Snowball для русского (https://snowballstem.org/algorithms/russian/stemmer.html).
+    окончания ищутся только в RV - части слова после первой гласной, из подходящих окончаний группы
+    берется самое длинное. окончания, отмеченные как требующие а/я, отрезаются, только если перед ними а или я
+    """
+    VOWELS = frozenset('аеиоуыэюя')
+    # группы окончаний: (все окончания, те из них, перед которыми должна быть а или я)
+    PERFECTIVE_GERUND = ({'в', 'вши', 'вшись', 'ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'},
+                         {'в', 'вши', 'вшись'})
+    ADJECTIVE = ({'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+                  'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'}, set())
+    PARTICIPLE = ({'ем', 'нн', 'вш', 'ющ', 'щ', 'ивш', 'ывш', 'ующ'}, {'ем', 'нн', 'вш', 'ющ', 'щ'})
+    REFLEXIVE = ({'ся', 'сь'}, set())
+    VERB = ({'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+             'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+             'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'},
+            {'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'})
+    NOUN = ({'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+             'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья',
+             'я'}, set())
+    DERIVATIONAL = ({'ост', 'ость'}, set())
+    TIDY_UP = ({'ейш', 'ейше', 'н', 'ь'}, set())
+    # самое длинное окончание - ившись
+    MAX_ENDING_LENGTH = 6
+
+    def stem(self, word: str) -> str:
+        word = word.replace('ё', 'е')
+        rv = min(self.skip_to_vowel(word, 0) + 1, len(word))
+        r2 = self.get_region(word, self.get_region(word, 0))
+
+        # шаг 1: деепричастие, иначе возвратная частица и прилагательное (с причастием), глагол или существительное
+        stem = self.remove_ending(word, rv, self.PERFECTIVE_GERUND)
+        if stem is None:
+            word = self.remove_ending(word, rv, self.REFLEXIVE) or word
+            stem = self.remove_adjectival(word, rv)
+            if stem is None:
+                stem = self.remove_ending(word, rv, self.VERB)
+            if stem is None:
+                stem = self.remove_ending(word, rv, self.NOUN)
+        if stem is not None:
+            word = stem
+
+        # шаг 2
+        if word.endswith('и') and len(word) > rv:
+            word = word[:-1]
+
+        # шаг 3: словообразовательное окончание, если оно целиком в R2
+        ending = self.find_ending(word, rv, self.DERIVATIONAL)
+        if ending is not None and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+
+        # шаг 4: превосходная степень и двойное н, или мягкий знак
+        ending = self.find_ending(word, rv, self.TIDY_UP)
+        if ending == 'ь':
+            return word[:-1]
+        if ending is not None and ending != 'н':
+            word = word[:-len(ending)]
+        if ending is not None and word.endswith('нн') and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+
+    def skip_to_vowel(self, word: str, start: int) -> int:
+        """:return: позиция первой гласной начиная со start (len(word), если ее нет)"""
+        while start < len(word) and word[start] not in self.VOWELS:
+            start += 1
+        return start
+
+    def get_region(self, word: str, start: int) -> int:
+        """:return: начало R1 части word[start:] - позиция после первой согласной, перед которой гласная"""
+        i = self.skip_to_vowel(word, start)
+        while i < len(word) and word[i] in self.VOWELS:
+            i += 1
+        return min(i + 1, len(word))
+
+    def find_ending(self, word: str, start: int, group: tuple[set[str], set[str]]) -> str:
+        """:return: самое длинное окончание группы, которым заканчивается word[start:], или None"""
+        for length in range(min(len(word) - start, self.MAX_ENDING_LENGTH), 0, -1):
+            if word[-length:] in group[0]:
+                return word[-length:]
+        return None
+
+    def remove_ending(self, word: str, rv: int, group: tuple[set[str], set[str]]) -> str:
+        """:return: word без окончания группы или None, если окончания нет или перед ним нет нужной а/я"""
+        ending = self.find_ending(word, rv, group)
+        if ending is None:
+            return None
+        stem = word[:-len(ending)]
+        if ending in group[1] and not (len(stem) > rv and stem[-1] in 'ая'):
+            return None
+        return stem
+
+    def remove_adjectival(self, word: str, rv: int) -> str:
+        stem = self.remove_ending(word, rv, self.ADJECTIVE)
+        if stem is None:
+            return None
+        participle_stem = self.remove_ending(stem, rv, self.PARTICIPLE)
+        return participle_stem if participle_stem is not None else stem
+
+
+class EnglishStemmer:
+    """
+    стеммер Snowball для английского (Porter2, https://snowballstem.org/algorithms/english/stemmer.html).
+    суффиксы снимаются шагами 1a-5, из подходящих суффиксов шага берется самый длинный, и если его условие
+    не выполнено, шаг ничего не меняет. Y - y, которая считается согласной
+    """
+    VOWELS = frozenset('aeiouy')
+    # не может быть последней буквой короткого слога
+    NOT_SHORT_END = VOWELS | frozenset('wxY')
+    VALID_LI = frozenset('cdeghkmnrt')
+    DOUBLES = frozenset(('bb', 'dd', 'ff', 'gg', 'mm', 'nn', 'pp', 'rr', 'tt'))
+    EXCEPTIONS = {'skis': 'ski', 'skies': 'sky', 'idly': 'idl', 'gently': 'gentl', 'ugly': 'ugli', 'early': 'earli',
+                  'only': 'onli', 'singly': 'singl', 'sky': 'sky', 'news': 'news', 'howe': 'howe', 'atlas': 'atlas',
+                  'cosmos': 'cosmos', 'bias': 'bias', 'andes': 'andes'}
+    # слова с этими началами получают R1 сразу после них
+    REGION_PREFIXES = ('arsen', 'commun', 'emerg', 'gener', 'inter', 'later', 'organ', 'past', 'univers')
+    # перед ing (и ed в 1b) не снимаются, если это все слово
+    INVARIANT_BEFORE_ING = ('even', 'cann', 'inn', 'earr', 'herr', 'out')
+    # {суффикс: замена}, None - суффикс с особым условием
+    STEP_2 = {'tional': 'tion', 'enci': 'ence', 'anci': 'ance', 'abli': 'able', 'entli': 'ent', 'izer': 'ize',
+              'ization': 'ize', 'ational': 'ate', 'ation': 'ate', 'ator': 'ate', 'alism': 'al', 'aliti': 'al',
+              'alli': 'al', 'fulness': 'ful', 'ousli': 'ous', 'ousness': 'ous', 'iveness': 'ive', 'iviti': 'ive',
+              'biliti': 'ble', 'bli': 'ble', 'ogist': 'og', 'fulli': 'ful', 'lessli': 'less', 'ogi': None, 'li': None}
+    STEP_3 = {'tional': 'tion', 'ational': 'ate', 'alize': 'al', 'icate': 'ic', 'iciti': 'ic', 'ical': 'ic',
+              'ful': '', 'ness': '', 'ative': None}
+    STEP_4 = {'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ism', 'ate', 'iti',
+              'ous', 'ive', 'ize', 'ion'}
+    MAX_SUFFIX_LENGTH = 7
+
+    def stem(self, word: str) -> str:
+        if word in self.EXCEPTIONS:
+            return self.EXCEPTIONS[word]
+        if len(word) < 3:
+            return word
+        if word.startswith("'"):
+            word = word[1:]
+        # y в начале и после гласной - согласная
+        chars = list(word)
+        for i, char in enumerate(chars):
+            if char == 'y' and (i == 0 or chars[i - 1] in self.VOWELS):
+                chars[i] = 'Y'
+        word = ''.join(chars)
+        r1, r2 = self.get_regions(word)
+
+        word = self.step_1a(word)
+        word = self.step_1b(word, r1)
+        if len(word) > 2 and word[-1] in 'yY' and word[-2] not in self.VOWELS:
+            word = word[:-1] + 'i'
+        word = self.step_2(word, r1)
+        word = self.step_3(word, r1, r2)
+        word = self.step_4(word, r2)
+        word = self.step_5(word, r1, r2)
+        return word.replace('Y', 'y')
+
+    def get_regions(self, word: str) -> tuple[int, int]:
+        for prefix in self.REGION_PREFIXES:
+            if word.startswith(prefix):
+                r1 = len(prefix)
+                break
+        else:
+            r1 = self.get_region(word, 0)
+        return r1, self.get_region(word, r1)
+
+    def get_region(self, word: str, start: int) -> int:
+        """:return: позиция после первой согласной, перед которой гласная, в word[start:] (len(word), если ее нет)"""
+        i = start
+        while i < len(word) and word[i] not in self.VOWELS:
+            i += 1
+        while i < len(word) and word[i] in self.VOWELS:
+            i += 1
+        return min(i + 1, len(word))
+
+    def ends_with_short_syllable(self, word: str) -> bool:
+        if len(word) >= 3 and word[-1] not in self.NOT_SHORT_END and word[-2] in self.VOWELS \
+                and word[-3] not in self.VOWELS:
+            return True
+        if len(word) == 2 and word[1] not in self.VOWELS and word[0] in self.VOWELS:
+            return True
+        return word.endswith('past')
+
+    def has_vowel(self, text: str) -> bool:
+        return any(char in self.VOWELS for char in text)
+
+    def find_suffix(self, word: str, suffixes) -> str:
+        """:return: самый длинный из suffixes, которым заканчивается word, или None"""
+        for length in range(min(len(word), self.MAX_SUFFIX_LENGTH), 0, -1):
+            if word[-length:] in suffixes:
+                return word[-length:]
+        return None
+
+    def step_1a(self, word: str) -> str:
+        for suffix in ("'s'", "'s", "'"):
+            if word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        if word.endswith('sses'):
+            return word[:-2]
+        if word.endswith('ied') or word.endswith('ies'):
+            return word[:-3] + ('i' if len(word) > 4 else 'ie')
+        if word.endswith('ss') or word.endswith('us'):
+            return word
+        if word.endswith('s') and self.has_vowel(word[:-2]):
+            return word[:-1]
+        return word
+
+    def step_1b(self, word: str, r1: int) -> str:
+        suffix = self.find_suffix(word, ('eedly', 'ingly', 'edly', 'eed', 'ing', 'ed'))
+        if suffix is None:
+            return word
+        stem = word[:-len(suffix)]
+        if suffix in ('eed', 'eedly'):
+            if len(stem) >= r1 and stem not in ('succ', 'proc', 'exc'):
+                return stem + 'ee'
+            return word
+        if suffix == 'ing':
+            if len(stem) == 2 and stem[1] == 'y' and stem[0] not in self.VOWELS:
+                return stem[0] + 'ie'
+            if stem in self.INVARIANT_BEFORE_ING:
+                return word
+        if not self.has_vowel(stem):
+            return word
+        if stem[-2:] in ('at', 'bl', 'iz'):
+            return stem + 'e'
+        if stem[-2:] in self.DOUBLES:
+            if len(stem) == 3 and stem[0] in 'aeo':
+                return stem
+            return stem[:-1]
+        if len(stem) == r1 and self.ends_with_short_syllable(stem):
+            return stem + 'e'
+        return stem
+
+    def step_2(self, word: str, r1: int) -> str:
+        suffix = self.find_suffix(word, self.STEP_2)
+        if suffix is None or len(word) - len(suffix) < r1:
+            return word
+        stem = word[:-len(suffix)]
+        if suffix == 'ogi':
+            return stem + 'og' if stem.endswith('l') else word
+        if suffix == 'li':
+            return stem if stem and stem[-1] in self.VALID_LI else word
+        return stem + self.STEP_2[suffix]
+
+    def step_3(self, word: str, r1: int, r2: int) -> str:
+        suffix = self.find_suffix(word, self.STEP_3)
+        if suffix is None or len(word) - len(suffix) < r1:
+            return word
+        stem = word[:-len(suffix)]
+        if suffix == 'ative':
+            return stem if len(stem) >= r2 else word
+        return stem + self.STEP_3[suffix]
+
+    def step_4(self, word: str, r2: int) -> str:
+        suffix = self.find_suffix(word, self.STEP_4)
+        if suffix is None or len(word) - len(suffix) < r2:
+            return word
+        stem = word[:-len(suffix)]
+        if suffix == 'ion' and not stem.endswith(('s', 't')):
+            return word
+        return stem
+
+    def step_5(self, word: str, r1: int, r2: int) -> str:
+        if word.endswith('e'):
+            stem = word[:-1]
+            if len(stem) >= r2 or (len(stem) >= r1 and not self.ends_with_short_syllable(stem)):
+                return stem
+        elif word.endswith('ll') and len(word) - 1 >= r2:
+            return word[:-1]
+        return word
@@ -0,0 +1,76 @@
+import bisect
+import re
+import typing
+
+import settings
+
+
+class TermDictionary:
+    """
+    отсортированный словарь индекса: слова с общим префиксом лежат подряд, и их отрезок находится бинпоиском,
+    так что раскрытие шаблона с префиксом стоит O(log(размер словаря) + слов в отрезке)
+    """
+    # сколько символов перед первым * нужно шаблону, без них он перебирал бы весь словарь
+    MIN_PREFIX_LENGTH = 1
+
+    def __init__(self, terms: list[str]):
+        """:param terms: слова по возрастанию"""
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, term_id: int) -> str:
+        return self.terms[term_id]
+
+    def bisect(self, term: str) -> int:
+        """:return: позиция первого слова не меньше term"""
+        return bisect.bisect_left(self.terms, term)
+
+    def iter_prefix(self, prefix: str) -> typing.Iterator[str]:
+        """слова, начинающиеся с prefix, по возрастанию"""
+        for term_id in range(self.bisect(prefix), len(self)):
+            term = self[term_id]
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def expand(self, pattern: str, max_expansions: int) -> list[str]:
+        """
+        :param pattern: слово с settings.WILDCARD (любое количество любых символов)
+        :return: слова словаря, подходящие под шаблон, по возрастанию
+        :raises ValueError: если у шаблона слишком короткий префикс или он подходит больше чем к max_expansions словам
+        """
+        prefix = pattern.split(settings.WILDCARD, 1)[0]
+        if len(prefix) < self.MIN_PREFIX_LENGTH:
+            raise ValueError(f'шаблон {pattern} должен начинаться хотя бы с {self.MIN_PREFIX_LENGTH} символов до '
+                             f'{settings.WILDCARD}')
+        regex = self.compile(pattern)
+        terms = []
+        for term in self.iter_prefix(prefix):
+            if regex.fullmatch(term) is not None:
+                if len(terms) == max_expansions:
+                    raise ValueError(f'шаблон {pattern} подходит больше чем к {max_expansions} словам')
+                terms.append(term)
+        return terms
+
+    @staticmethod
+    def compile(pattern: str) -> re.Pattern:
+        return re.compile('.*'.join(re.escape(part) for part in pattern.split(settings.WILDCARD)), re.DOTALL)
+
+
+class MappedTermDictionary(TermDictionary):
+    """словарь файла индекса (index_storage.IndexFileReader): он уже отсортирован, слова читаются при обращении"""
+
+    def __init__(self, reader):
+        super().__init__([])
+        self.reader = reader
+
+    def __len__(self):
+        return self.reader.terms_count
+
+    def __getitem__(self, term_id: int) -> str:
+        return self.reader.term(term_id)
+
+    def bisect(self, term: str) -> int:
+        return self.reader.bisect_term(term.encode('utf8'))
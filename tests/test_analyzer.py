@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from analyzer import Analyzer
+from folder_index import FolderIndex, FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+from instrumentation import Instrumentation, StatsCollector
+from segmented_index import SegmentedIndex
+from stemming import EnglishStemmer, RussianStemmer
+
+
+class TestAnalyzer(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, 'folder')
+        os.makedirs(self.folder)
+        self.filepath = self.folder + '/a.txt'
+        with open(self.filepath, 'w', encoding='utf8') as f:
+            f.write('ключ к шифру\nкукуруза на поле, (шифром) и ключами.\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stemmers(self):
+        russian = RussianStemmer()
+        self.assertEqual([russian.stem(word) for word in ['шифра', 'шифром', 'кукурузой', 'красивейший', 'ёлка']],
+                         ['шифр', 'шифр', 'кукуруз', 'красив', 'елк'])
+        english = EnglishStemmer()
+        self.assertEqual([english.stem(word) for word in ['running', 'generously', 'skies', 'news']],
+                         ['run', 'generous', 'sky', 'news'])
+
+    def test_punctuation_and_stem(self):
+        raw = Foogle(self.folder)
+        self.assertEqual(len(raw.search('шифра')[0].postings), 0)
+
+        foogle = Foogle(self.folder, analyzer=Analyzer.of('stem'))
+        result, _ = foogle.search('шифра')
+        entries = result.entries[self.filepath]
+        self.assertEqual(len(entries), 2)
+        # выделяется слово без скобок
+        self.assertEqual([foogle.cut_snippet(self.filepath, entry)[1] for entry in entries], ['шифру', 'шифром'])
+        self.assertEqual(len(foogle.search('ключ & кукурузы')[0].postings), 1)
+
+    def test_stopwords(self):
+        foogle = Foogle(self.folder, analyzer=Analyzer.of('full'))
+        # служебные слова не занимают номеров слов
+        for querry in ['"кукуруза поле"', '"кукуруза на поле"', '"кукуруза в поле"', 'кукуруза \\ на',
+                       'кукуруза NEAR/1 на NEAR/1 поле']:
+            self.assertEqual(len(foogle.search(querry)[0].postings), 1, querry)
+        for querry in ['на', 'на & и', '"на и"']:
+            self.assertEqual(len(foogle.search(querry)[0].postings), 0, querry)
+
+    def test_indexing_times(self):
+        collector = StatsCollector()
+        indexer = FolderIndexer(instrumentation=Instrumentation([collector]), analyzer=Analyzer.of('full'))
+        indexer.index_folder(self.folder)
+        [file_stats] = collector.stats['file']
+        # границы слова из анализатора не подменяют отметки времени
+        for phase in ('read', 'detect', 'tokenize'):
+            self.assertTrue(0 <= file_stats.times[phase] < 1, phase)
+
+    def test_saved_analyzer(self):
+        analyzer = Analyzer.of('full')
+        folder_index = FolderIndexer(analyzer=analyzer).index_folder(self.folder)
+        index_path = os.path.join(self.tmp.name, 'index.idx')
+        FolderIndexSaveloader.save(index_path, folder_index)
+        mapped_index = FolderIndexSaveloader.load(index_path)
+        self.assertEqual(mapped_index.analyzer, analyzer)
+        expected = Foogle(index=folder_index)
+        foogle = Foogle(index=mapped_index)
+        for querry in ['шифра', '"кукурузу на поле"', 'ключ*']:
+            self.assertEqual(foogle.search(querry)[1], expected.search(querry)[1], querry)
+        mapped_index.close()
+
+        with self.assertRaises(ValueError):
+            FolderIndex().merge(folder_index)
+
+    def test_segmented_analyzer(self):
+        directory = os.path.join(self.tmp.name, 'segments')
+        index = SegmentedIndex(directory, background_merge=False, analyzer=Analyzer.of('stem'))
+        index.update(self.folder)
+        self.assertEqual(len(Foogle(index=index).search('шифра')[0].postings), 1)
+
+        reopened = SegmentedIndex(directory)
+        self.assertEqual(reopened.analyzer, Analyzer.of('stem'))
+        self.assertEqual(len(Foogle(index=reopened).search('шифра')[0].postings), 1)
+        with self.assertRaises(ValueError):
+            SegmentedIndex(directory, analyzer=Analyzer())
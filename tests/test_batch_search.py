@@ -0,0 +1,47 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from batch_search import BatchSearcher
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+
+
+class TestBatchSearch(TestCase):
+    def setUp(self):
+        self.index = FolderIndexer().index_folder('files/test_dir2')
+        self.querries = ['шифр', 'и & в', 'в & и', 'шифр | текст \\ и', '"и в"', 'ш* & на', 'шифр near/3 текст',
+                         'и & в', 'нет_такого_слова', 'и & ( в', 'шифр | текст \\ и']
+
+    def assert_same_as_foogle(self, results: list[dict], k: int):
+        foogle = Foogle(index=self.index)
+        self.assertEqual(len(results), len(self.querries))
+        for querry, result in zip(self.querries, results):
+            self.assertEqual(result['query'], querry)
+            if querry == 'и & ( в':
+                self.assertIn('error', result)
+                continue
+            expected, ranking = foogle.search(querry, k)
+            self.assertEqual(result['total'], len(expected.postings), querry)
+            self.assertEqual([(item['path'], item['score']) for item in result['results']], ranking, querry)
+
+    def test_same_as_foogle(self):
+        searcher = BatchSearcher(self.index)
+        self.assert_same_as_foogle(searcher.search(self.querries, 3), 3)
+        self.assertEqual(searcher.stats['queries'], len(self.querries))
+        self.assertEqual(searcher.stats['errors'], 1)
+        # повторы и "в & и" выполняются вместе с "и & в"
+        self.assertEqual(searcher.stats['unique_plans'], 7)
+
+    def test_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.idx')
+            FolderIndexSaveloader.save(path, self.index)
+            mapped_index = FolderIndexSaveloader.load(path)
+            for index in [self.index, mapped_index]:
+                searcher = BatchSearcher(index, workers=2)
+                try:
+                    self.assert_same_as_foogle(searcher.search(self.querries, None), None)
+                finally:
+                    searcher.close()
+            mapped_index.close()
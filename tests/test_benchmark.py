@@ -0,0 +1,45 @@
+import os
+import tempfile
+from unittest import TestCase
+from benchmark import Benchmark
+from corpus_generator import CorpusGenerator
+
+
+class TestCorpusGenerator(TestCase):
+    def read_all(self, folderpath: str) -> dict[str, bytes]:
+        result = {}
+        for filename in sorted(os.listdir(folderpath)):
+            with open(os.path.join(folderpath, filename), 'rb') as f:
+                result[filename] = f.read()
+        return result
+
+    def test_same_seed_same_corpus(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            CorpusGenerator(seed=3, files_count=12).generate(tmp + '/a')
+            CorpusGenerator(seed=3, files_count=12).generate(tmp + '/b')
+            CorpusGenerator(seed=4, files_count=12).generate(tmp + '/c')
+            self.assertEqual(self.read_all(tmp + '/a'), self.read_all(tmp + '/b'))
+            self.assertNotEqual(self.read_all(tmp + '/a'), self.read_all(tmp + '/c'))
+
+    def test_encodings_and_sizes(self):
+        generator = CorpusGenerator(files_count=6, min_words=20, max_words=40, vocabulary_size=500)
+        with tempfile.TemporaryDirectory() as tmp:
+            filepaths = generator.generate(tmp)
+            for file_no, filepath in enumerate(filepaths):
+                with open(filepath, encoding=generator.encodings[file_no % 3]) as f:
+                    words = f.read().split()
+                self.assertTrue(20 <= len(words) <= 40)
+                self.assertTrue(set(words) <= set(generator.vocabulary))
+
+
+class TestBenchmark(TestCase):
+    def test_run(self):
+        benchmark = Benchmark(CorpusGenerator(files_count=30, vocabulary_size=1000), queries_per_template=2,
+                              measure_memory=False)
+        result = benchmark.run()
+        self.assertEqual(result['corpus']['files'], 30)
+        for section in ['in_memory', 'mapped']:
+            self.assertEqual(set(result['queries'][section]), {name for name, _ in Benchmark.QUERY_MIX} | {'all'})
+        self.assertEqual(benchmark.make_querries(), benchmark.make_querries())
+        rows = Benchmark.compare(result, result)
+        self.assertIn(('indexing.seconds', result['indexing']['seconds'], result['indexing']['seconds']), rows)
@@ -1,4 +1,8 @@
+import codecs
+import os
+import tempfile
 from unittest import TestCase
+from encoding_detection import EncodingDetector
 from folder_index import FolderIndexer
 from foogle import Foogle
 
@@ -25,3 +29,26 @@ class TestFolderIndexer(TestCase):
         self.assertEqual(filename_and_ofset[1], ('files/encoding_test/cp1251.txt', 0))
         self.assertEqual(filename_and_ofset[2], ('files/encoding_test/utf16LE.txt', 0))
         self.assertEqual(filename_and_ofset[3], ('files/encoding_test/utf8.txt', 0))
+
+
+class TestEncodingDetector(TestCase):
+    def test_fast_path(self):
+        detector = EncodingDetector()
+        self.assertEqual(detector.detect('текст'.encode('utf-16')), ('UTF-16', None))
+        self.assertEqual(detector.detect(codecs.BOM_UTF8 + 'текст'.encode('utf8')), ('UTF-8-SIG', None))
+        self.assertEqual(detector.detect(b'text'), ('ascii', 'text'))
+        self.assertEqual(detector.detect('текст'.encode('utf8')), ('utf-8', 'текст'))
+
+    def test_cached_by_stat(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = tmp + '/a.txt'
+            with open(filepath, 'wb') as f:
+                f.write('первая вторая третья'.encode('cp1251'))
+            detector = EncodingDetector()
+            with open(filepath, 'rb') as f:
+                data, stat = f.read(), os.fstat(f.fileno())
+            encoding, _ = detector.get_encoding(filepath, data, stat, complete=True)
+            self.assertEqual(data.decode(encoding), 'первая вторая третья')
+
+            detector.detect = None
+            self.assertEqual(detector.get_encoding(filepath, data, stat, complete=True), (encoding, None))
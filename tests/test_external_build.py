@@ -0,0 +1,37 @@
+import filecmp
+import os
+import tempfile
+from unittest import TestCase
+
+from external_build import ExternalIndexBuilder
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+
+
+class TestExternalBuild(TestCase):
+    def test_same_as_save(self):
+        index = FolderIndexer().index_folder('files/test_dir2')
+        with tempfile.TemporaryDirectory() as tmp:
+            for compress in [False, True]:
+                expected_path = os.path.join(tmp, f'expected-{compress}.idx')
+                FolderIndexSaveloader.save(expected_path, index, compress)
+                # 1 байт - прогон на каждый файл, 10 ** 9 - один прогон
+                for memory_limit, runs_count in [(1, len(index.filepaths)), (10 ** 9, 1)]:
+                    path = os.path.join(tmp, 'index.idx')
+                    builder = ExternalIndexBuilder(memory_limit, compress)
+                    builder.build('files/test_dir2', path).close()
+                    self.assertEqual(builder.runs_count, runs_count)
+                    self.assertTrue(filecmp.cmp(path, expected_path, shallow=False), (compress, memory_limit))
+            # временные прогоны удалены
+            self.assertEqual(sorted(os.listdir(tmp)), ['expected-False.idx', 'expected-True.idx', 'index.idx'])
+
+    def test_search(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            mapped_index = ExternalIndexBuilder(50000).build('files/test_dir2', os.path.join(tmp, 'index.idx'))
+            expected = Foogle('files/test_dir2')
+            for querry in ['шифр', 'и & в \\ на', '"и в"', 'ш* | текст']:
+                result, ranking = Foogle(index=mapped_index).search(querry)
+                expected_result, expected_ranking = expected.search(querry)
+                self.assertEqual(result.load_postings(), expected_result.load_postings(), querry)
+                self.assertEqual(ranking, expected_ranking, querry)
+            mapped_index.close()
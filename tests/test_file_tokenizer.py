@@ -0,0 +1,56 @@
+import os
+import random
+import re
+import tempfile
+from unittest import TestCase
+import settings
+from file_tokenizer import FileTokenizer
+from folder_index import FolderIndexer
+
+
+def tokenize_by_lines(text: str):
+    """разбор всего текста по строкам, как до FileTokenizer"""
+    tokens = []
+    line_starts = []
+    total_char_count = 0
+    for i, line in enumerate(text.splitlines(keepends=True)):
+        line_starts.append(total_char_count)
+        line = line.casefold()
+        for match in re.finditer(settings.WORD_REGEX, line):
+            tokens.append((match.group(), match.start() + total_char_count, i + 1, match.end() - match.start()))
+        total_char_count += len(line)
+    return tokens, line_starts
+
+
+class TestFileTokenizer(TestCase):
+    def test_same_as_by_lines(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            text = ''.join(rng.choice(['слово', 'Straße', 'a', ' ', '  ', '\n', '\n\n', 'ЁЖ']) for _ in range(60))
+            chunk_size = rng.randint(1, 20)
+            tokenizer = FileTokenizer()
+            tokenizer.MAX_LINE_BUFFER = rng.randint(1, 30)
+            chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+            tokens = list(tokenizer.tokenize(chunks))
+            expected_tokens, expected_line_starts = tokenize_by_lines(text)
+            self.assertEqual(tokens, expected_tokens, repr(text))
+            self.assertEqual(list(tokenizer.line_starts), expected_line_starts, repr(text))
+
+    def test_large_file_streamed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = tmp + '/big.txt'
+            text = ''.join(f'строка {i} с\\r\\nсловами\r\n' if i % 7 else 'длинная ' * 50 for i in range(300))
+            with open(filepath, 'w', encoding='cp1251', newline='') as f:
+                f.write(text)
+
+            indexer = FolderIndexer()
+            indexer.MAX_WHOLE_FILE_SIZE = 1000
+            indexer.CHUNK_SIZE = 100
+            streamed = indexer.index_folder(tmp)
+            whole = FolderIndexer().index_folder(tmp)
+
+            self.assertEqual(streamed.word_entires, whole.word_entires)
+            self.assertEqual(streamed.line_starts, whole.line_starts)
+            self.assertEqual(streamed.file_stats, whole.file_stats)
+            self.assertEqual(streamed.encodings[filepath].lower(), 'windows-1251')
+            self.assertEqual(os.path.getsize(filepath), streamed.file_stats[filepath].size)
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from folder_index import FolderIndexer, FolderIndex
+
+
+class TestIncrementalUpdate(TestCase):
+    def assert_same_index(self, expected: FolderIndex, actual: FolderIndex):
+        # doc_id после обновления другие, поэтому вхождения сравниваются по путям
+        self.assertEqual({word: expected.entries_by_file(word) for word in expected.word_entires},
+                         {word: actual.entries_by_file(word) for word in actual.word_entires})
+        self.assertEqual(expected.encodings, actual.encodings)
+        self.assertEqual(expected.file_stats, actual.file_stats)
+        self.assertEqual(expected.tf_idf_index.filepaths, actual.tf_idf_index.filepaths)
+        self.assertEqual(expected.tf_idf_index.word_count_in_file, actual.tf_idf_index.word_count_in_file)
+        self.assertEqual(expected.tf_idf_index.filepaths_by_word, actual.tf_idf_index.filepaths_by_word)
+
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folderpath = tmp + '/test_dir2'
+            shutil.copytree('files/test_dir2', folderpath)
+            index = FolderIndexer().index_folder(folderpath)
+
+            filepaths = sorted(FolderIndexer().iter_filepaths(folderpath))
+            with open(filepaths[0], 'a', encoding='utf8') as f:
+                f.write('\nкукуруза новая строка')
+            os.remove(filepaths[1])
+            with open(folderpath + '/new.txt', 'w', encoding='utf8') as f:
+                f.write('совсем новый файл про кукурузу')
+            os.utime(filepaths[2])  # mtime поменялся, а содержимое - нет
+
+            added, changed, deleted = index.update(folderpath)
+            self.assertEqual(added, [folderpath + '/new.txt'])
+            self.assertEqual(changed, [filepaths[0]])
+            self.assertEqual(deleted, [filepaths[1]])
+            self.assert_same_index(FolderIndexer().index_folder(folderpath), index)
+
+            self.assertEqual(index.update(folderpath), ([], [], []))
@@ -1,5 +1,6 @@
+import pickle
 from unittest import TestCase
-from folder_index import FolderIndexer, FolderIndexSaveloader
+from folder_index import FolderIndexer, FolderIndexSaveloader, MappedFolderIndex
 from foogle import Foogle
 from tests.test_encodings import TestFolderIndexer
 
@@ -11,3 +12,27 @@ class TestFolderIndexSaveloader(TestCase):
         FolderIndexSaveloader.save(path, index)
         index = FolderIndexSaveloader.load(path)
         TestFolderIndexer().test_foogle(Foogle(index=index))
+
+    def test_compressed_not_lazy(self):
+        path = 'files/_indexes/saveload_test_zlib.txt'
+        index = FolderIndexer().index_folder('files/encoding_test')
+        FolderIndexSaveloader.save(path, index, compress=True)
+        index = FolderIndexSaveloader.load(path, lazy=False)
+        self.assertNotIsInstance(index, MappedFolderIndex)
+        TestFolderIndexer().test_foogle(Foogle(index=index))
+
+    def test_convert_pickle(self):
+        pickle_path = 'files/_indexes/saveload_test_pickle.txt'
+        path = 'files/_indexes/saveload_test_converted.txt'
+        index = FolderIndexer().index_folder('files/test_dir2')
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(index, f)
+        FolderIndexSaveloader.convert(pickle_path, path)
+        loaded = FolderIndexSaveloader.load(path)
+
+        self.assertEqual(sorted(index.word_entires), list(loaded.word_entires))
+        for word, postings in index.word_entires.items():
+            self.assertEqual(postings, loaded.word_entires[word])
+        self.assertEqual(index.filepaths, list(loaded.filepaths))
+        self.assertEqual(dict(index.encodings), dict(loaded.encodings))
+        self.assertEqual(index.doc_lengths, loaded.get_doc_lengths())
@@ -0,0 +1,42 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from index_stats import IndexStats
+
+
+class TestIndexStats(TestCase):
+    def setUp(self):
+        self.folder_index = FolderIndexer().index_folder('files/test_dir2')
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_counts_and_top(self):
+        stats = IndexStats.of(self.folder_index, top=3)
+        self.assertEqual(stats.docs_count, self.folder_index.get_docs_count())
+        self.assertEqual(stats.terms_count, len(self.folder_index.word_entires))
+        self.assertEqual(stats.postings_count, sum(map(len, self.folder_index.word_entires.values())))
+        self.assertEqual(stats.top_by_count[0], ('в', sum(map(len, self.folder_index.entries_by_file('в').values()))))
+        self.assertEqual([df for _, df in stats.top_by_df], [stats.docs_count] * 3)
+        self.assertGreater(stats.memory['word_entires.entries'], 0)
+        self.assertGreater(stats.memory['tf_idf_index.filepaths_by_word'], 0)
+        # подсчет не запоминает количества вхождений в Postings
+        self.assertTrue(all(postings.counts is None for postings in self.folder_index.word_entires.values()))
+
+    def test_disk_sizes(self):
+        stats = IndexStats.of(self.folder_index)
+        for compress in (False, True):
+            index_path = os.path.join(self.tmp.name, f'index{compress}.idx')
+            FolderIndexSaveloader.save(index_path, self.folder_index, compress)
+            mapped_index = FolderIndexSaveloader.load(index_path)
+            mapped_stats = IndexStats.of(mapped_index)
+            self.assertEqual(sum(mapped_stats.disk.values()), os.path.getsize(index_path))
+            if not compress:
+                self.assertEqual(mapped_stats.disk, stats.disk)
+            self.assertIsNone(mapped_stats.memory)
+            for name in ('docs_count', 'terms_count', 'postings_count', 'entries_count', 'top_by_df', 'top_by_count'):
+                self.assertEqual(getattr(mapped_stats, name), getattr(stats, name), name)
+            mapped_index.close()
@@ -0,0 +1,48 @@
+import contextlib
+import io
+import os
+from unittest import TestCase
+from folder_index import FolderIndexer
+from foogle import Foogle
+from instrumentation import Instrumentation, StatsCollector
+
+
+class TestInstrumentation(TestCase):
+    def search(self, foogle: Foogle, querry: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return foogle.search_expression(querry)
+
+    def test_search_stats(self):
+        collector = StatsCollector()
+        foogle = Foogle('files/test_dir2', instrumentation=Instrumentation([collector]))
+        result = self.search(foogle, 'и & ( в | не ) \\ квайн')
+
+        stats = result.stats
+        self.assertEqual(collector.stats['search'], [stats])
+        self.assertEqual(set(stats.times), {'tokenize', 'parse', 'plan', 'search', 'rank', 'snippets'})
+        self.assertEqual(stats.counters['postings_touched'], 4)
+        self.assertEqual(stats.counters['result_files'], len(result.entries))
+        self.assertEqual(stats.counters['files_opened'], len(result.entries))
+        self.assertEqual(stats.counters['and.evaluations'], 1)
+        self.assertEqual(stats.counters['results_cache_hits'], 0)
+
+        self.assertEqual(self.search(foogle, 'и & ( в | не ) \\ квайн').stats.counters['results_cache_hits'], 1)
+        # повторный поиск берет результат из кеша, но не меняет Stats первого
+        self.assertEqual(result.stats.counters['results_cache_hits'], 0)
+        self.assertEqual(collector.stats['search'][0], stats)
+
+    def test_disabled(self):
+        self.assertIsNone(self.search(Foogle('files/test_dir2'), 'и').stats)
+
+    def test_indexing_stats(self):
+        filepaths = list(FolderIndexer().iter_filepaths('files/test_dir2'))
+        for workers in [1, 2]:
+            collector = StatsCollector()
+            folder_index = FolderIndexer(workers, Instrumentation([collector])).index_folder('files/test_dir2')
+
+            self.assertEqual(sorted(stats.label for stats in collector.stats['file']), sorted(filepaths))
+            [total] = collector.stats['index']
+            self.assertEqual(total.counters['files'], len(filepaths))
+            self.assertEqual(total.counters['bytes_read'], sum(os.path.getsize(path) for path in filepaths))
+            self.assertEqual(total.counters['words'], sum(folder_index.doc_lengths))
+            self.assertEqual(set(total.times), {'read', 'detect', 'tokenize', 'build'})
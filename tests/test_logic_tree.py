@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+import logic_tree
+from folder_index import FolderIndexer
+from foogle import Foogle
+
+
+class TestLogicTree(TestCase):
+    def test_term_set(self):
+        foogle = Foogle(index=FolderIndexer().index_folder('files/test_dir2'))
+        words = sorted(word for word in foogle.folder_index.word_entires if word.isalnum())[:100]
+        querry = ' | '.join(words + ['нетвтакомслове']) + ' | md5 & шифр'
+        tree = logic_tree.LogicTreeParser(querry).parse()
+        self.assertIsInstance(tree.and_trees[0].exclusion_trees[0].atoms[0], logic_tree.TermSetAtom)
+        self.assertEqual(len(tree.and_trees), 2)
+
+        result, ranking = foogle.search(querry)
+        index = foogle.folder_index
+        expected_files = set(index.entries_by_file('md5')) & set(index.entries_by_file('шифр'))
+        for word in words:
+            expected_files |= set(index.entries_by_file(word))
+        self.assertEqual(set(result.entries), expected_files)
+        self.assertEqual(len(ranking), len(expected_files))
+
+    def test_deep_nesting(self):
+        depth = 10000
+        tree = logic_tree.LogicTreeParser('( ' * depth + 'a' + ' )' * depth + ' & ( b & ( c | ( d | e ) ) )').parse()
+        self.assertEqual(repr(tree), 'a & b & (c | d | e)')
+
+    def test_errors(self):
+        for querry in ['', 'a b', 'a &', '& a', '( a', 'a )', '( )', 'a | ( b c )', 'a near/0 b', '"a b']:
+            with self.assertRaises(ValueError, msg=querry):
+                logic_tree.LogicTreeParser(querry).parse()
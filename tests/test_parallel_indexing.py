@@ -0,0 +1,20 @@
+from unittest import TestCase
+from folder_index import FolderIndexer
+
+
+class TestParallelIndexing(TestCase):
+    def test_same_as_serial(self):
+        serial = FolderIndexer().index_folder('files/test_dir2')
+        parallel = FolderIndexer(workers=2).index_folder('files/test_dir2')
+
+        self.assertEqual(serial.filepaths, parallel.filepaths)
+        self.assertEqual(serial.doc_ids, parallel.doc_ids)
+        self.assertEqual(list(serial.word_entires), list(parallel.word_entires))
+        self.assertEqual(serial.word_entires, parallel.word_entires)
+        self.assertEqual(serial.encodings, parallel.encodings)
+        self.assertEqual(serial.tf_idf_index.word_count_in_file, parallel.tf_idf_index.word_count_in_file)
+        self.assertEqual(serial.tf_idf_index.filepaths_by_word, parallel.tf_idf_index.filepaths_by_word)
+        self.assertEqual(serial.tf_idf_index.filepaths, parallel.tf_idf_index.filepaths)
+        self.assertEqual(serial.file_stats, parallel.file_stats)
+        self.assertEqual(serial.line_starts, parallel.line_starts)
+        self.assertEqual(serial.doc_lengths, parallel.doc_lengths)
@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+
+
+class TestPhraseSearch(TestCase):
+    def setUp(self):
+        self.index = FolderIndexer().index_folder('files/test_dir2')
+        self.words_by_file = {}
+        for filepath in self.index.filepaths:
+            with open(filepath, encoding=self.index.encodings[filepath]) as f:
+                self.words_by_file[filepath] = f.read().casefold().split()
+        self.frequent = ['и', 'в', 'на', 'не', 'с', 'что', 'шифр', 'текст']
+
+    def find_phrase(self, phrase: list[str]) -> set[str]:
+        """перебором по тексту файлов"""
+        return {filepath for filepath, words in self.words_by_file.items()
+                if any(words[i:i + len(phrase)] == phrase for i in range(len(words) - len(phrase) + 1))}
+
+    def find_near(self, left: str, right: str, distance: int) -> set[str]:
+        found = set()
+        for filepath, words in self.words_by_file.items():
+            left_positions = [i for i, word in enumerate(words) if word == left]
+            right_positions = [i for i, word in enumerate(words) if word == right]
+            if any(0 < abs(i - j) <= distance for i in left_positions for j in right_positions):
+                found.add(filepath)
+        return found
+
+    def test_phrase_same_as_scan(self):
+        foogle = Foogle(index=self.index)
+        rng = random.Random(0)
+        phrases = [phrase for phrase in (rng.choice(list(self.words_by_file.values()))[i:i + 3]
+                                         for i in range(0, 60, 5))
+                   if all(word.isalnum() for word in phrase)]
+        phrases += [[rng.choice(self.frequent) for _ in range(2)] for _ in range(30)]
+        for phrase in phrases:
+            querry = '"' + ' '.join(phrase) + '"'
+            result, _ = foogle.search(querry)
+            self.assertEqual(set(result.entries), self.find_phrase(phrase), querry)
+            for filepath, entries in result.entries.items():
+                words = self.words_by_file[filepath]
+                # вхождения результата - слова найденных фраз
+                self.assertTrue(all(words[entry.position] in phrase for entry in entries))
+
+    def test_near_same_as_scan(self):
+        foogle = Foogle(index=self.index)
+        rng = random.Random(1)
+        texts = list(self.words_by_file.values())
+        for _ in range(60):
+            distance = rng.randint(1, 6)
+            if rng.random() < 0.5:
+                left, right = rng.choice(self.frequent), rng.choice(self.frequent)
+            else:
+                # пара слов, которая точно стоит рядом хотя бы в одном файле
+                words = rng.choice(texts)
+                i = rng.randrange(len(words) - distance)
+                left, right = words[i], words[i + rng.randint(1, distance)]
+                if not (left.isalnum() and right.isalnum()):
+                    # скобки и кавычки - часть синтаксиса запроса
+                    continue
+            querry = f'{left} NEAR/{distance} {right}'
+            result, _ = foogle.search(querry)
+            self.assertEqual(set(result.entries), self.find_near(left, right, distance), querry)
+
+    def test_mapped_index(self):
+        querries = ['"и в"', 'шифр near/5 текст', '"не в" | на near/2 и', '( и | в ) near/1 на \\ "и на"']
+        expected = [Foogle(index=self.index).search(querry)[0].load_postings() for querry in querries]
+        with tempfile.TemporaryDirectory() as tmp:
+            for compress in [False, True]:
+                path = os.path.join(tmp, f'index-{compress}.idx')
+                FolderIndexSaveloader.save(path, self.index, compress)
+                mapped_index = FolderIndexSaveloader.load(path)
+                foogle = Foogle(index=mapped_index)
+                for querry, postings in zip(querries, expected):
+                    self.assertEqual(foogle.search(querry)[0].load_postings(), postings, querry)
+                mapped_index.close()
+
+    def test_index_without_positions(self):
+        index = FolderIndexer().index_folder('files/test_dir2')
+        for postings in index.word_entires.values():
+            for entries in postings.entries:
+                entries.positions = None
+        foogle = Foogle(index=index)
+        self.assertGreater(len(foogle.search('и & в')[0].postings), 0)
+        with self.assertRaises(ValueError):
+            foogle.search('"и в"')
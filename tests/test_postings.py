@@ -0,0 +1,53 @@
+import random
+from unittest import TestCase
+from postings import Postings, WordEntries
+
+
+def make_postings(doc_ids: list[int]) -> Postings:
+    postings = Postings()
+    for doc_id in sorted(doc_ids):
+        entries = WordEntries()
+        entries.append(doc_id, 1, 1, 0)
+        postings.append(doc_id, entries)
+    return postings
+
+
+class TestPostings(TestCase):
+    def check_set_algebra(self, density: float):
+        rng = random.Random(density)
+        for _ in range(50):
+            doc_sets = [set(d for d in range(300) if rng.random() < density) for _ in range(rng.randint(1, 4))]
+            postings_list = [make_postings(list(doc_set)) for doc_set in doc_sets]
+
+            self.assertEqual(list(Postings.intersect(postings_list).doc_ids),
+                             sorted(set.intersection(*doc_sets)))
+            self.assertEqual(list(Postings.unite(postings_list).doc_ids),
+                             sorted(set.union(*doc_sets)))
+            self.assertEqual(list(Postings.exclude(postings_list[0], postings_list[1:]).doc_ids),
+                             sorted(doc_sets[0].difference(*doc_sets[1:])))
+
+    def test_sparse(self):
+        self.check_set_algebra(0.01)
+
+    def test_dense(self):
+        self.check_set_algebra(0.5)
+
+    def test_without_bitmaps(self):
+        Postings.BITMAP_MIN_DENSITY = None
+        try:
+            self.check_set_algebra(0.5)
+        finally:
+            Postings.BITMAP_MIN_DENSITY = 1 / 32
+
+    def test_no_duplicates(self):
+        postings = make_postings([1, 5])
+        self.assertEqual(len(Postings.intersect([postings, postings]).entries[0]), 1)
+        self.assertEqual(len(Postings.unite([postings, postings]).entries[1]), 1)
+
+    def test_restrict(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            doc_set = set(d for d in range(300) if rng.random() < rng.random())
+            allowed = set(d for d in range(300) if rng.random() < rng.random())
+            restricted = Postings.restrict(make_postings(list(doc_set)), make_postings(list(allowed)))
+            self.assertEqual(list(restricted.doc_ids), sorted(doc_set & allowed))
@@ -0,0 +1,50 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from foogle import Foogle
+from query_cache import QueryCache
+
+
+class TestQueryCache(TestCase):
+    def search(self, foogle: Foogle, querry: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return foogle.search_expression(querry)
+
+    def test_same_entry_for_equivalent_queries(self):
+        foogle = Foogle('files/test_dir2')
+        first = self.search(foogle, 'и & в')
+        second = self.search(foogle, 'в & ( и )')
+        self.assertIs(first, second)
+        self.assertEqual(foogle.get_cache_stats()['results']['hits'], 1)
+        self.assertEqual(foogle.get_cache_stats()['results']['misses'], 1)
+
+    def test_invalidated_by_index_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copytree('files/test_dir2', tmp, dirs_exist_ok=True)
+            foogle = Foogle(tmp)
+            before = self.search(foogle, 'и')
+            with open(tmp + '/новый.txt', 'w', encoding='utf8') as f:
+                f.write('и еще один файл')
+            foogle.folder_index.update(tmp)
+            after = self.search(foogle, 'и')
+
+            self.assertEqual(len(after.entries), len(before.entries) + 1)
+            self.assertIn(os.path.join(tmp, 'новый.txt'), after.entries)
+            self.assertEqual(foogle.get_cache_stats()['results']['invalidations'], 1)
+            self.assertEqual(foogle.get_cache_stats()['postings']['invalidations'], 1)
+
+    def test_eviction(self):
+        cache = QueryCache(max_items=2, max_size=10)
+        cache.put('a', 1, 4, generation=0)
+        cache.put('b', 2, 4, generation=0)
+        cache.get('a', generation=0)
+        cache.put('c', 3, 4, generation=0)
+        self.assertEqual(list(cache.values), ['a', 'c'])
+        cache.put('d', 4, 8, generation=0)
+        self.assertEqual(list(cache.values), ['d'])
+        self.assertEqual(cache.get_stats()['evictions'], 3)
+        self.assertIsNone(cache.get('a', generation=0))
+        self.assertIsNone(cache.get('d', generation=1))
@@ -0,0 +1,70 @@
+import random
+from unittest import TestCase
+import logic_tree
+from folder_index import FolderIndexer
+from foogle import ExpressionSearcher, Foogle
+from postings import Postings
+from query_planner import QueryPlanner, TermNode, ExcludeNode
+
+
+def search_without_plan(index, or_tree: logic_tree.OrTree) -> Postings:
+    """вычисление дерева запроса как есть, без плана"""
+    and_results = []
+    for and_tree in or_tree.and_trees:
+        exclusion_results = []
+        for exclusion_tree in and_tree.exclusion_trees:
+            atom_results = [index[atom.value] if isinstance(atom, logic_tree.WordAtom)
+                            else search_without_plan(index, atom.value)
+                            for atom in exclusion_tree.atoms]
+            exclusion_results.append(Postings.exclude(atom_results[0], atom_results[1:]))
+        and_results.append(Postings.intersect(exclusion_results))
+    return Postings.unite(and_results)
+
+
+class TestQueryPlanner(TestCase):
+    def setUp(self):
+        self.index = FolderIndexer().index_folder('files/test_dir2')
+
+    def test_same_as_without_plan(self):
+        words = ['и', 'в', 'на', 'шифр', 'текст', 'не', 'md5', 'нетвтакомслове']
+        rng = random.Random(0)
+
+        def make_querry(depth: int) -> str:
+            parts = []
+            for _ in range(rng.randint(1, 3)):
+                part = rng.choice(words) if depth == 0 or rng.random() < 0.6 else f'( {make_querry(depth - 1)} )'
+                parts.append(part)
+                parts.append(rng.choice(['&', '|', '\\']))
+            return ' '.join(parts[:-1])
+
+        for _ in range(200):
+            querry = make_querry(2)
+            expected = search_without_plan(self.index, logic_tree.LogicTreeParser(querry).parse())
+            actual = ExpressionSearcher(self.index).search_by_or_tree(logic_tree.LogicTreeParser(querry).parse())
+            self.assertEqual(actual.load_postings(), expected, querry)
+
+    def test_duplicates_removed(self):
+        plan = QueryPlanner(self.index).plan(logic_tree.LogicTreeParser('шифр & ( шифр ) & шифр').parse())
+        self.assertIsInstance(plan, TermNode)
+
+    def test_exclusion_lifted(self):
+        plan = QueryPlanner(self.index).plan(logic_tree.LogicTreeParser('и & в \\ шифр & на \\ md5').parse())
+        self.assertIsInstance(plan, ExcludeNode)
+        self.assertEqual(plan.excluded.key, ('or', frozenset({('term', 'шифр'), ('term', 'md5')})))
+        self.assertEqual([child.estimate for child in plan.positive.children],
+                         sorted(child.estimate for child in plan.positive.children))
+
+    def test_explain(self):
+        explanation = Foogle(index=self.index).explain('шифр & и')
+        self.assertIn('AND', explanation)
+        self.assertIn(f"слово 'шифр'  (~{self.index.get_doc_frequency('шифр')} файлов)", explanation)
+
+    def test_entries_loaded_lazily(self):
+        querry = '( и | в | на | не ) & шестнадцатеричной'
+        result = ExpressionSearcher(self.index).search_by_or_tree(logic_tree.LogicTreeParser(querry).parse())
+        self.assertFalse(result.postings.has_entries())
+        self.assertEqual(result.loaded_entries, {})
+        filepath = next(iter(result.entries))
+        entries = result[filepath]
+        self.assertEqual(list(result.loaded_entries.values()), [entries])
+        self.assertGreater(len(entries), 1)
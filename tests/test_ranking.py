@@ -0,0 +1,36 @@
+from unittest import TestCase
+import logic_tree
+from folder_index import FolderIndexer
+from foogle import ExpressionSearcher
+from folder_index import FolderIndexSaveloader
+from scoring import TfIdfScorer, Bm25Scorer
+
+
+class TestScorers(TestCase):
+    def setUp(self):
+        self.index = FolderIndexer().index_folder('files/test_dir2')
+
+    def search(self, querry):
+        return ExpressionSearcher(self.index).search_by_or_tree(logic_tree.LogicTreeParser(querry).parse())
+
+    def test_tf_idf_same_as_tf_idf_index(self):
+        for querry in ['и | в | на', 'и & в', 'шифр | md5 | квайн | и | и', 'текст', 'нетвтакомслове']:
+            result = self.search(querry)
+            full = self.index.tf_idf_index.get_odered_filepaths_with_tf_idf(querry, result)
+            self.assertEqual(TfIdfScorer().rank(self.index, querry, result), full)
+            for k, offset in [(1, 0), (2, 1), (3, 0), (100, 0), (2, 100)]:
+                self.assertEqual(TfIdfScorer().rank(self.index, querry, result, k, offset), full[offset:offset + k])
+
+    def test_bm25(self):
+        path = 'files/_indexes/bm25_test.txt'
+        FolderIndexSaveloader.save(path, self.index)
+        mapped = FolderIndexSaveloader.load(path)
+        scorer = Bm25Scorer()
+        for querry in ['и | в | на', 'шифр | md5 | квайн']:
+            result = self.search(querry)
+            ranking = scorer.rank(self.index, querry, result)
+            self.assertEqual(len(ranking), len(result.entries))
+            self.assertEqual([score for _, score in ranking], sorted((score for _, score in ranking), reverse=True))
+            self.assertEqual(scorer.rank(mapped, querry, result), ranking)
+            self.assertEqual(scorer.rank(self.index, querry, result, 2, 1), ranking[1:3])
+        mapped.close()
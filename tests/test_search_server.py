@@ -0,0 +1,63 @@
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from unittest import TestCase
+from foogle import Foogle
+from search_server import SearchServer
+
+
+class TestSearchServer(TestCase):
+    def setUp(self):
+        self.foogle = Foogle('files/test_dir2')
+        self.server = SearchServer(self.foogle, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://%s:%d' % self.server.address
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def get(self, path: str, **params):
+        with urllib.request.urlopen(self.url + path + '?' + urllib.parse.urlencode(params)) as response:
+            return json.loads(response.read())
+
+    def post(self, path: str, body: dict):
+        request = urllib.request.Request(self.url + path, json.dumps(body).encode('utf8'), method='POST')
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_search(self):
+        response = self.get('/search', q='и & в', k=2, snippets=1)
+        result, filepaths_with_score = self.foogle.search('и & в', 2)
+        self.assertEqual([(item['path'], item['score']) for item in response['results']], filepaths_with_score)
+        self.assertEqual(response['total'], len(result.entries))
+        for item in response['results']:
+            entries = result[item['path']]
+            self.assertEqual(item['entries_count'], len(entries))
+            self.assertEqual([entry['offset'] for entry in item['entries']], [entry.offset for entry in entries][:self.foogle.snippets_per_file])
+            for snippet in item['snippets']:
+                start, end = snippet['highlight']
+                self.assertIn(snippet['text'][start:end].casefold(), ['и', 'в'])
+        self.assertEqual(self.get('/stats')['requests']['requests'], 1)
+
+    def test_bad_query(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get('/search', q='( и')
+        self.assertEqual(context.exception.code, 400)
+
+    def test_errors(self):
+        for params, code in [({'q': 'и', 'k': -1}, 400), ({'q': 'и', 'offset': -1}, 400),
+                             ({'q': 'a & ( b | ( ' * 600 + 'c' + ' ) )' * 600}, 500)]:
+            with self.assertRaises(urllib.error.HTTPError, msg=code) as context:
+                self.get('/search', **params)
+            self.assertEqual(context.exception.code, code)
+            self.assertIn('error', json.loads(context.exception.read()))
+        self.assertEqual(self.get('/stats')['requests']['errors'], 3)
+
+    def test_reload(self):
+        before = self.get('/search', q='квайн')
+        self.assertGreater(before['total'], 0)
+        self.assertEqual(self.post('/reload', {'folder': 'files/test_dir1'})['files'], 2)
+        after = self.get('/search', q='квайн')
+        self.assertEqual(after['total'], 0)
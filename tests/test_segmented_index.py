@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from folder_index import FolderIndexer
+from foogle import Foogle
+from segmented_index import SegmentedIndex
+
+
+class TestSegmentedIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, 'folder')
+        self.segments = os.path.join(self.tmp.name, 'segments')
+        os.makedirs(self.folder)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name: str, text: str) -> str:
+        filepath = self.folder + '/' + name
+        with open(filepath, 'w', encoding='utf8') as f:
+            f.write(text)
+        return filepath
+
+    def assert_same_as_folder_index(self, index: SegmentedIndex):
+        expected = Foogle(index=FolderIndexer().index_folder(self.folder))
+        foogle = Foogle(index=index)
+        for querry in ['кукуруза', 'кукуруза & поле', 'поле | трактор \\ кукуруза', '"кукуруза на"', 'кук*',
+                       'кукуруза near/2 поле']:
+            result, ranking = foogle.search(querry)
+            expected_result, expected_ranking = expected.search(querry)
+            self.assertEqual(dict(ranking), dict(expected_ranking), querry)
+            self.assertEqual(dict(result.entries), dict(expected_result.entries), querry)
+
+    def test_commit_and_delete(self):
+        index = SegmentedIndex(self.segments, background_merge=False)
+        texts = ['кукуруза на поле', 'трактор на поле', 'кукуруза кукуруза и трактор', 'поле']
+        paths = [self.write(f'{i}.txt', text) for i, text in enumerate(texts)]
+        index.add_file(paths[0])
+        index.add_file(paths[1])
+        snapshot = index.snapshot()
+        # до commit поиск изменений не видит
+        self.assertEqual(snapshot.get_docs_count(), 0)
+        index.commit()
+        self.assertEqual(snapshot.get_docs_count(), 0)
+        index.add_file(paths[2])
+        index.add_file(paths[3])
+        index.commit()
+        self.assert_same_as_folder_index(index)
+
+        self.write('1.txt', 'кукуруза на поле и трактор')
+        index.add_file(paths[1])
+        index.remove_file(paths[3])
+        os.remove(paths[3])
+        index.commit()
+        self.assertEqual(index.get_docs_count(), 3)
+        self.assert_same_as_folder_index(index)
+
+        # снова открытый индекс читает сегменты и удаленные файлы из манифеста
+        self.assert_same_as_folder_index(SegmentedIndex(self.segments, background_merge=False))
+
+    def test_update_same_content(self):
+        index = SegmentedIndex(self.segments, background_merge=False)
+        path = self.write('0.txt', 'кукуруза на поле')
+        self.write('1.txt', 'трактор на поле')
+        self.assertEqual(len(index.update(self.folder)[0]), 2)
+        segments = index.current.segments
+
+        # файл с новым mtime, но прежним содержимым не переиндексируется
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(index.update(self.folder), ([], [], []))
+        self.assertEqual(index.current.segments, segments)
+
+        self.write('0.txt', 'кукуруза и трактор')
+        self.assertEqual(index.update(self.folder), ([], [path], []))
+        self.assert_same_as_folder_index(index)
+
+    def test_snippets_after_commit(self):
+        index = SegmentedIndex(self.segments, background_merge=False)
+        paths = [self.write('a.txt', 'кукуруза на поле'), self.write('b.txt', 'трактор\nи кукуруза')]
+        for path in paths:
+            index.add_file(path)
+        index.commit()
+        foogle = Foogle(index=index)
+        result, ranking = foogle.search('кукуруза')
+        self.assertEqual(len(ranking), 2)
+
+        # сниппеты берутся из снимка, по которому шел поиск, а не из текущего
+        index.remove_file(paths[0])
+        index.commit()
+        for path in paths:
+            entry = result[path][0]
+            self.assertEqual(foogle.cut_snippet(path, entry, folder_index=result.folder_index)[1], 'кукуруза')
+
+    def test_merge(self):
+        index = SegmentedIndex(self.segments, merge_factor=3, background_merge=False)
+        for i in range(7):
+            index.add_file(self.write(f'{i}.txt', 'кукуруза ' * i + 'поле трактор'))
+            if i % 2 == 1:
+                index.remove_file(self.folder + f'/{i - 1}.txt')
+                os.remove(self.folder + f'/{i - 1}.txt')
+            index.commit()
+        self.assertEqual(len(index.snapshot().segments), 4)
+        old_snapshot = index.snapshot()
+        self.assertTrue(index.merge())
+        self.assertFalse(index.merge())
+        self.assertEqual(len(index.snapshot().segments), 1)
+        self.assertEqual(len(os.listdir(self.segments)), 2)
+        self.assert_same_as_folder_index(index)
+        # старый снимок дочитывает удаленные файлы сегментов
+        self.assertEqual(len(Foogle(index=old_snapshot).search('кукуруза')[0].postings), 4)
+
+    def test_search_during_updates(self):
+        shutil.copytree('files/test_dir2', self.folder, dirs_exist_ok=True)
+        index = SegmentedIndex(self.segments, merge_factor=2)
+        index.update(self.folder)
+        foogle = Foogle(index=index, results_cache_size=0)
+        errors = []
+        counts = []
+        stop = threading.Event()
+
+        def search():
+            try:
+                while not stop.is_set():
+                    result, _ = foogle.search('зюзюка')
+                    counts.append(len(result.postings))
+                    # вхождения читаются из того же снимка, что и файлы
+                    for filepath in result.entries:
+                        self.assertEqual(len(result.entries[filepath]), 1)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=search)
+        thread.start()
+        for i in range(30):
+            # каждый commit добавляет по два файла со словом
+            index.add_file(self.write(f'new-{i}-a.txt', 'зюзюка'))
+            index.add_file(self.write(f'new-{i}-b.txt', 'зюзюка'))
+            index.commit()
+        stop.set()
+        thread.join()
+        index.close()
+        self.assertEqual(errors, [])
+        self.assertTrue(all(count % 2 == 0 for count in counts))
+        self.assertEqual(len(foogle.search('зюзюка')[0].postings), 60)
+        self.assertLess(len(index.snapshot().segments), 31)
+        self.assert_same_as_folder_index(index)
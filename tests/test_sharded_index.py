@@ -0,0 +1,44 @@
+import contextlib
+import io
+import tempfile
+from unittest import TestCase
+from foogle import Foogle
+from scoring import TfIdfScorer, Bm25Scorer
+from sharded_index import ShardedIndex
+
+
+class TestShardedIndex(TestCase):
+    QUERRIES = ['и', 'и & в', 'квайн | программа', r'и \ в', 'шифр', 'не & ( и | на )']
+
+    def search(self, foogle: Foogle, querry: str, k: int = None, offset: int = 0):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = foogle.search_expression(querry, k, offset)
+        return result, output.getvalue()
+
+    def assert_same_as_unsharded(self, folderpath: str, shards_count: int, workers: int, scorer_type):
+        unsharded = Foogle(folderpath, scorer=scorer_type())
+        with tempfile.TemporaryDirectory() as tmp:
+            ShardedIndex.build(folderpath, tmp, shards_count, workers).close()
+            index = ShardedIndex.load(tmp, workers)
+            sharded = Foogle(index=index, scorer=scorer_type())
+            for querry in self.QUERRIES:
+                for k, offset in [(None, 0), (1, 0), (2, 1)]:
+                    expected, expected_output = self.search(unsharded, querry, k, offset)
+                    result, output = self.search(sharded, querry, k, offset)
+                    self.assertEqual(result.entries, expected.entries)
+                    # вывод содержит файлы, оценки и сниппеты в порядке ранжирования
+                    self.assertEqual(output, expected_output)
+            self.assertEqual(sharded.explain('и & шифр'), unsharded.explain('и & шифр'))
+            index.close()
+
+    def test_same_as_unsharded(self):
+        self.assert_same_as_unsharded('files/wiki_test', 3, 1, TfIdfScorer)
+
+    def test_bm25_in_worker_processes(self):
+        self.assert_same_as_unsharded('files/test_dir2', 2, 2, Bm25Scorer)
+
+    def test_more_shards_than_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = ShardedIndex.build('files/test_dir1', tmp, 100)
+            self.assertEqual(len(index.shards), index.get_docs_count())
+            index.close()
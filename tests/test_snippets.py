@@ -0,0 +1,36 @@
+import os
+import re
+import tempfile
+from unittest import TestCase
+from foogle import Foogle
+from text_cache import FileTextCache
+
+
+class TestSnippets(TestCase):
+    def test_snippet_takes_only_entry_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(tmp + '/a.txt', 'w', encoding='utf8') as f:
+                f.write('первая строка\nвторая строка с кукурузой\nтретья строка\n')
+            foogle = Foogle(tmp)
+            entries = foogle.folder_index.entries_by_file('кукурузой')[tmp + '/a.txt']
+            snippet = foogle.make_snippet(tmp + '/a.txt', entries[0])
+            self.assertEqual(re.sub(r'\x1b\[\d+m', '', snippet), '   2  вторая строка с кукурузой')
+
+    def test_text_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filepaths = [f'{tmp}/{i}.txt' for i in range(3)]
+            for filepath in filepaths:
+                with open(filepath, 'w', encoding='utf8') as f:
+                    f.write('x' * 10)
+
+            cache = FileTextCache(max_files=10, max_chars=25)
+            for filepath in filepaths:
+                self.assertEqual(cache.get(filepath, 'utf8'), 'x' * 10)
+            self.assertEqual([key[0] for key in cache.texts], filepaths[1:])
+            self.assertEqual(cache.chars_count, 20)
+
+            # измененный файл читается заново
+            with open(filepaths[2], 'w', encoding='utf8') as f:
+                f.write('y')
+            os.utime(filepaths[2], ns=(0, 0))
+            self.assertEqual(cache.get(filepaths[2], 'utf8'), 'y')
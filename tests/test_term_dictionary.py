@@ -0,0 +1,67 @@
+import os
+import re
+import shutil
+import tempfile
+from unittest import TestCase
+
+from folder_index import FolderIndexer, FolderIndexSaveloader
+from foogle import Foogle
+from sharded_index import ShardedIndex
+
+
+class TestTermDictionary(TestCase):
+    def setUp(self):
+        self.index = FolderIndexer().index_folder('files/test_dir2')
+        self.patterns = ['ш*', 'ко*я', 'к*', 'md*', 'шестнадцатеричн*', 'с*о*т', 'нет*такого', 'и*']
+
+    def expand_by_scan(self, words, pattern: str) -> list[str]:
+        regex = re.compile('.*'.join(map(re.escape, pattern.split('*'))), re.DOTALL)
+        return sorted(word for word in words if regex.fullmatch(word))
+
+    def test_same_as_scan(self):
+        for pattern in self.patterns:
+            self.assertEqual(self.index.expand_terms(pattern, 10 ** 6),
+                             self.expand_by_scan(self.index.word_entires, pattern), pattern)
+
+    def test_mapped_and_sharded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.idx')
+            FolderIndexSaveloader.save(path, self.index)
+            mapped_index = FolderIndexSaveloader.load(path)
+            sharded_index = ShardedIndex.build('files/test_dir2', os.path.join(tmp, 'shards'), 3)
+            for pattern in self.patterns:
+                expected = self.index.expand_terms(pattern, 10 ** 6)
+                self.assertEqual(mapped_index.expand_terms(pattern, 10 ** 6), expected, pattern)
+                self.assertEqual(sharded_index.expand_terms(pattern, 10 ** 6), expected, pattern)
+            mapped_index.close()
+            sharded_index.close()
+
+    def test_search(self):
+        foogle = Foogle(index=self.index)
+        for pattern in self.patterns:
+            words = self.index.expand_terms(pattern, 10 ** 6)
+            result, _ = foogle.search(f'{pattern} & и')
+            expected, _ = foogle.search(f'( {" | ".join(words)} ) & и') if words else (result, None)
+            self.assertEqual(result.load_postings(), expected.load_postings(), pattern)
+
+    def test_limits(self):
+        foogle = Foogle(index=self.index, max_expansions=3)
+        with self.assertRaises(ValueError):
+            foogle.search('к*')
+        with self.assertRaises(ValueError):
+            foogle.search('*я')
+        self.assertEqual(len(foogle.search('шестнадцатеричн*')[0].postings), 1)
+
+    def test_dictionary_updated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, 'folder')
+            shutil.copytree('files/test_dir1', folder)
+            index = FolderIndexer().index_folder(folder)
+            self.assertEqual(index.expand_terms('зюзюк*', 10), [])
+            with open(os.path.join(folder, 'new.txt'), 'w', encoding='utf8') as f:
+                f.write('зюзюка зюзюкин')
+            index.update(folder)
+            self.assertEqual(index.expand_terms('зюзюк*', 10), ['зюзюка', 'зюзюкин'])
+            os.remove(os.path.join(folder, 'new.txt'))
+            index.update(folder)
+            self.assertEqual(index.expand_terms('зюзюк*', 10), [])
@@ -0,0 +1,52 @@
+import collections
+import os
+import threading
+
+
+class FileTextCache:
+    """
+    LRU-кеш декодированного содержимого файлов для сниппетов.
+    ограничен и количеством файлов, и суммарным количеством символов в них.
+    ключ включает mtime, поэтому измененный на диске файл будет прочитан заново.
+    потокобезопасен
+    """
+
+    def __init__(self, max_files: int = 256, max_chars: int = 32 * 2 ** 20):
+        self.max_files = max_files
+        self.max_chars = max_chars
+        self.texts: collections.OrderedDict[tuple[str, str, int], str] = collections.OrderedDict()
+        self.chars_count = 0
+        # сколько раз файлы читались с диска и сколько байт прочитано (для instrumentation)
+        self.files_read = 0
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+    def get(self, filepath: str, encoding: str) -> str:
+        stat = os.stat(filepath)
+        key = (filepath, encoding, stat.st_mtime_ns)
+        with self.lock:
+            if key in self.texts:
+                self.texts.move_to_end(key)
+                return self.texts[key]
+
+        with open(filepath, encoding=encoding) as f:
+            text = f.read()
+        with self.lock:
+            self.files_read += 1
+            self.bytes_read += stat.st_size
+            if key not in self.texts:
+                self.texts[key] = text
+                self.chars_count += len(text)
+                self.evict()
+        return text
+
+    def evict(self):
+        # последний добавленный файл не выкидываем, даже если он один больше лимита
+        while len(self.texts) > 1 and (len(self.texts) > self.max_files or self.chars_count > self.max_chars):
+            _, text = self.texts.popitem(last=False)
+            self.chars_count -= len(text)
+
+    def clear(self):
+        with self.lock:
+            self.texts.clear()
+            self.chars_count = 0
@@ -39,6 +39,21 @@ class RightParenthesis(Parenthesis):
         return ')'
 
 
+class NearOperator(Operator):
+    def __init__(self, distance: int):
+        super().__init__(f'{settings.NEAR_TERM}{distance}')
+        self.distance = distance
+
+
+class Phrase(Token):
+    def __init__(self, words: list[str]):
+        super().__init__()
+        self.words = words
+
+    def __repr__(self):
+        return settings.PHRASE_QUOTE + ' '.join(self.words) + settings.PHRASE_QUOTE
+
+
 class Word(Token):
     def __init__(self, word: str):
         super().__init__()
@@ -49,60 +64,58 @@ class Word(Token):
 
 
 class Tokenizator:
+    """
+    разбирает запрос за один проход одним регулярным выражением TOKEN_REGEX: на каждой позиции пробуются
+    по порядку скобка, фраза, оператор, NEAR/k и слово. оператор и NEAR/k - только отдельно стоящие,
+    '&x' или 'near/5x' - слова. время линейно по длине запроса
+    """
+    TOKEN_REGEX = re.compile(
+        r'\s*(?:(?P<left>\()|(?P<right>\))'
+        f'|{re.escape(settings.PHRASE_QUOTE)}(?P<phrase>[^{re.escape(settings.PHRASE_QUOTE)}]*)'
+        f'(?P<closed>{re.escape(settings.PHRASE_QUOTE)})?'
+        f'|(?P<operator>{"|".join(re.escape(term) for term in sorted(settings.LOGIC_TERMS))})(?!\\S)'
+        f'|(?P<near>{settings.NEAR_REGEX})(?!\\S)'
+        f'|(?P<word>{settings.WORD_REGEX}))')
+    NEAR_REGEX = re.compile(settings.NEAR_REGEX)
+    PHRASE_WORD_REGEX = re.compile(settings.WORD_REGEX)
+
     def __init__(self, query: str):
         self.query = query
         self.tokens: list[Token] = []
         self.cursor = 0
 
     def tokenize(self) -> list[Token]:
-        self.skip_spaces()
-        while self.cursor < len(self.query):
-            success = (self.try_read_parenthesis() or
-                       self.try_read_operator() or
-                       self.try_read_word())
-            if not success:
-                raise Exception('не удалось считать токен')
-
-            self.skip_spaces()
-
+        while True:
+            match = self.TOKEN_REGEX.match(self.query, self.cursor)
+            if match is None:
+                # остались только пробелы
+                break
+            self.tokens.append(self.make_token(match))
+            self.cursor = match.end()
         return self.tokens
 
-    def skip_spaces(self):
-        while self.cursor < len(self.query) and self.query[self.cursor].isspace():
-            self.cursor += 1
-
-    def try_read_parenthesis(self):
-        char = self.query[self.cursor]
-        if char == '(':
-            self.tokens.append(LeftParenthesis())
-            self.cursor += 1
-            return True
-        if char == ')':
-            self.tokens.append(RightParenthesis())
-            self.cursor += 1
-            return True
-        return False
-
-    def try_read_operator(self):
-        for op in settings.LOGIC_TERMS:
-            if self.cursor + len(op) > len(self.query): continue
-            op_in_query = self.query[self.cursor:self.cursor + len(op)]
-            if op == op_in_query and (
-                    self.cursor + len(op) == len(self.query) or self.query[self.cursor + len(op)].isspace()):
-                self.tokens.append(Operator(op))
-                self.cursor += len(op)
-                return True
-        return False
-
-    def try_read_word(self):
-        match = re.search(settings.WORD_REGEX, self.query[self.cursor:])
-        if match is None:
-            return False
-        if match.span()[0] > 0: return False
-
-        self.tokens.append(Word(match.group()))
-        self.cursor += match.span()[1]
-        return True
+    def make_token(self, match: re.Match) -> Token:
+        kind = match.lastgroup
+        if kind == 'word':
+            return Word(match.group('word'))
+        if kind == 'operator':
+            return Operator(match.group('operator'))
+        if kind == 'left':
+            return LeftParenthesis()
+        if kind == 'right':
+            return RightParenthesis()
+        if kind == 'near':
+            distance = int(self.NEAR_REGEX.fullmatch(match.group('near')).group(1))
+            if distance < 1:
+                raise ValueError(f'расстояние {settings.NEAR_TERM} должно быть положительным, а не {distance}')
+            return NearOperator(distance)
+        start = match.start('phrase') - len(settings.PHRASE_QUOTE)
+        if match.group('closed') is None:
+            raise ValueError(f'фраза с {start}-го символа не закрыта {settings.PHRASE_QUOTE}')
+        words = self.PHRASE_WORD_REGEX.findall(match.group('phrase'))
+        if len(words) == 0:
+            raise ValueError(f'пустая фраза с {start}-го символа')
+        return Phrase(words)
 
 
 def main():